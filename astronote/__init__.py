@@ -1,3 +1,5 @@
 # -*- coding: utf-8 -*-
 
 from .core import *
+from .aio import async_get_events
+from . import export
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Aio
+###############################################################################
+
+# Methods that calculate events from within an asyncio event loop. The
+# calculations are run in an executor so that the event loop is never blocked,
+# and identical requests that are in progress at the same time share a single
+# calculation.
+
+import asyncio
+import copy
+import functools
+import weakref
+from . import core
+
+
+# The executor used to run calculations (`None` uses the event loop's default
+# executor) and the maximum number of calculations run at the same time.
+_settings = {
+    'executor': None,
+    'max_concurrency': 4
+}
+
+# The state of each event loop, so that separate event loops do not share
+# semaphores or requests.
+_states = weakref.WeakKeyDictionary()
+
+
+class _LoopState(object):
+    """The semaphore and in progress requests of an event loop."""
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(_settings['max_concurrency'])
+        self.requests = {}
+
+
+class _Request(object):
+    """A calculation that is in progress, along with the number of callers
+    that are waiting for it.
+    """
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+def configure(executor = None, max_concurrency = 4):
+    """Sets the executor used to run calculations and the maximum number of
+    calculations that can run at the same time. Event loops that have already
+    made a request keep their existing limit.
+
+    Keyword arguments:
+    executor -- a `concurrent.futures.Executor` object, or `None` to use the
+                event loop's default executor.
+    max_concurrency -- the maximum number of calculations run at once.
+    """
+
+    _settings['executor'] = executor
+    _settings['max_concurrency'] = max_concurrency
+
+
+async def async_get_events(date, lat = '0', lon = '0'):
+    """Calculates all astronomical events on a given day at a given location
+    without blocking the event loop. The events are identical to those
+    returned by `get_events`.
+
+    If an identical request is already in progress, its result is shared
+    rather than being calculated again. Cancelling a request only cancels the
+    calculation once no other requests are waiting for it.
+
+    Keyword arguments:
+    date -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    """
+
+    loop = asyncio.get_running_loop()
+    state = _get_state(loop)
+    key = (date, str(lat), str(lon))
+
+    request = state.requests.get(key)
+
+    if request is None:
+        request = _Request(loop.create_task(_calculate(loop, state, key)))
+        request.task.add_done_callback(functools.partial(_remove_request, state, key, request))
+        state.requests[key] = request
+
+    request.waiters += 1
+
+    try:
+
+        # Shield the shared calculation so that cancelling this request does
+        # not cancel it for every other request waiting on it.
+        events = await asyncio.shield(request.task)
+
+    except asyncio.CancelledError:
+
+        # The request is removed as soon as it is cancelled, so that a new
+        # identical request starts its own calculation rather than joining
+        # this one before it finishes cancelling.
+        if request.waiters == 1:
+            _remove_request(state, key, request)
+            request.task.cancel()
+
+        raise
+
+    finally:
+        request.waiters -= 1
+
+    # Each request receives its own copy so that it can be modified without
+    # affecting the others.
+    return copy.deepcopy(events)
+
+
+def _get_state(loop):
+    """Returns the state of an event loop, creating it if required.
+
+    Keyword arguments:
+    loop -- an asyncio event loop.
+    """
+
+    state = _states.get(loop)
+
+    if state is None:
+        state = _LoopState()
+        _states[loop] = state
+
+    return state
+
+
+async def _calculate(loop, state, key):
+    """Calculates the events for a request in the configured executor, once
+    the number of running calculations is below the limit.
+
+    A calculation that has started in the executor cannot be stopped, so if
+    the request is cancelled its place is only given up once the calculation
+    finishes. The limit therefore bounds the calculations actually running.
+
+    Keyword arguments:
+    loop -- an asyncio event loop.
+    state -- the _LoopState of the event loop.
+    key -- a (date, lat, lon) tuple.
+    """
+
+    await state.semaphore.acquire()
+
+    try:
+        future = loop.run_in_executor(_settings['executor'], core.get_events, *key)
+    except BaseException:
+        state.semaphore.release()
+        raise
+
+    future.add_done_callback(functools.partial(_release, state))
+
+    return await asyncio.shield(future)
+
+
+def _release(state, future):
+    """Gives up the place of a finished calculation.
+
+    Keyword arguments:
+    state -- the _LoopState of the event loop.
+    future -- the future of the finished calculation.
+    """
+
+    state.semaphore.release()
+
+    # Retrieve the exception of a calculation that nothing is waiting for, so
+    # that it is not reported as never retrieved.
+    if not future.cancelled():
+        future.exception()
+
+
+def _remove_request(state, key, request, task = None):
+    """Removes a request from the requests that are in progress, once it has
+    finished or been cancelled.
+
+    Keyword arguments:
+    state -- the _LoopState of the event loop.
+    key -- a (date, lat, lon) tuple.
+    request -- the _Request that finished.
+    task -- the finished task.
+    """
+
+    if state.requests.get(key) is request:
+        del state.requests[key]
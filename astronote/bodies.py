@@ -7,9 +7,38 @@
 # Methods that calculate information for planetary bodies, including
 # oppositions, conjunctions, elongations and visibility times.
 
+import bisect
 import ephem
+import math
+import numpy
+import threading
+from collections import namedtuple
 from datetime import datetime
 from . import helpers
+from . import samples
+from . import solvers
+
+
+# The names of all planets that events are found for.
+PLANETS = ['Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn', 'Uranus', 'Neptune', 'Pluto']
+
+# Planets that orbit inside the Earth's orbit. These have inferior and superior
+# conjunctions and greatest elongations, but never reach opposition.
+INFERIOR_PLANETS = ['Mercury', 'Venus']
+
+
+# An opposition, conjunction or greatest elongation of a planet, where `type`
+# is the type of the event and `subtype` is the type of conjunction or
+# elongation (or `None` for an opposition). The `angle` of a greatest
+# elongation is the planet's angular distance from the Sun in degrees (and is
+# `None` for other events).
+PlanetaryEvent = namedtuple('PlanetaryEvent', ['time', 'type', 'body', 'subtype', 'angle'], defaults=[None])
+
+
+# Catalogs of planetary events that have already been built, keyed by year,
+# and the lock held while a catalog is built.
+_catalogs = {}
+_catalogs_lock = threading.Lock()
 
 
 def is_visible(body, date):
@@ -28,11 +57,8 @@ def is_opposition(body, date):
     time1 = ephem.Date(date)
     time2 = ephem.Date(time1 + 1)
 
-    body.compute(time1)
-    elong1 = body.elong.norm
-
-    body.compute(time2)
-    elong2 = body.elong.norm
+    elong1 = samples.get_sample(body, time1, 'bodies').elong.norm
+    elong2 = samples.get_sample(body, time2, 'bodies').elong.norm
 
     return ((elong1 <= ephem.pi) and (elong2 >= ephem.pi)) or \
            ((elong1 >= ephem.pi) and (elong2 <= ephem.pi))
@@ -51,11 +77,8 @@ def is_conjunction(body, date):
     time1 = ephem.Date(date)
     time2 = ephem.Date(time1 + 1)
 
-    body.compute(time1)
-    elong1 = body.elong.norm
-
-    body.compute(time2)
-    elong2 = body.elong.norm
+    elong1 = samples.get_sample(body, time1, 'bodies').elong.norm
+    elong2 = samples.get_sample(body, time2, 'bodies').elong.norm
 
     # Due to the value of elongation crossing the 0-360 degree (e.g. 0 and 2 Pi
     # radians), the elongation has to check if it transitions from the fourth
@@ -75,8 +98,7 @@ def get_conjunction_type(body, date):
     """
 
     time = ephem.Date(date) + 1
-    body.compute(time)
-    elong = body.elong.norm
+    elong = samples.get_sample(body, time, 'bodies').elong.norm
 
     if body.name == 'Mercury' or body.name == 'Venus':
 
@@ -92,37 +114,16 @@ def get_conjunction_type(body, date):
 def is_elongation(body, date):
     """Returns True if the body is at its greatest elongation (i.e. it is at a
     point where it is farthest away from the Sun when viewed from Earth).
+    Greatest elongations are looked up from the planetary event catalog.
 
     Keyword arguments:
     body -- a PyEphem Body object (typically a planet).
     date -- a YYYY-MM-DD string.
     """
 
-    time1 = ephem.Date(date)
-    time2 = ephem.Date(time1 + 1)
-
-    body.compute(time1)
-    elong1a = body.elong.znorm
-
-    # Hours are used over minutes due to the values being too close and
-    # constantly misfiring positives.
-    body.compute(time1 + ephem.hour)
-    elong1b = body.elong.znorm
-
-    body.compute(time2 - ephem.hour)
-    elong2a = body.elong.znorm
+    start = ephem.Date(date)
 
-    body.compute(time2)
-    elong2b = body.elong.znorm
-
-    if abs(helpers.get_degrees(elong1a)) > 5 and abs(helpers.get_degrees(elong2b)) > 5:
-
-        return (elong1a <= elong1b) and (elong2a >= elong2b) or \
-               (elong1a >= elong1b) and (elong2a <= elong2b)
-
-    else:
-
-        return False
+    return len(get_greatest_elongations(start, start + 1, body.name)) > 0
 
 
 def get_elongation_type(body, date):
@@ -135,10 +136,187 @@ def get_elongation_type(body, date):
     """
 
     time = ephem.Date(date) + 1
-    body.compute(time)
-    elong = body.elong.znorm
+    elong = samples.get_sample(body, time, 'bodies').elong.znorm
 
     if elong < 0:
         return 'west'
     elif elong > 0:
         return 'east'
+
+
+def get_catalog(year):
+    """Returns a tuple containing a sorted list of event times and a matching
+    list of PlanetaryEvent objects for every opposition, conjunction and
+    greatest elongation of every planet during a year. Each year is only
+    calculated once.
+
+    Keyword arguments:
+    year -- the year as an integer.
+    """
+
+    if year not in _catalogs:
+
+        # Only one thread builds a catalog, while any others wait for it.
+        with _catalogs_lock:
+
+            if year not in _catalogs:
+
+                start = ephem.Date(datetime(year, 1, 1))
+                end = ephem.Date(datetime(year + 1, 1, 1))
+                planets = [getattr(ephem, name)() for name in PLANETS]
+
+                events = find_planetary_events(planets, start, end)
+
+                _catalogs[year] = ([event.time for event in events], events)
+
+    return _catalogs[year]
+
+
+def get_catalog_events(start, end):
+    """Returns a list of all PlanetaryEvent objects that occur between two
+    times, sorted by time.
+
+    Keyword arguments:
+    start -- a PyEphem Date object.
+    end -- a PyEphem Date object.
+    """
+
+    start = ephem.Date(start)
+    end = ephem.Date(end)
+
+    events = []
+
+    for year in range(start.tuple()[0], end.tuple()[0] + 1):
+
+        times, year_events = get_catalog(year)
+        index1 = bisect.bisect_left(times, start)
+        index2 = bisect.bisect_left(times, end)
+        events += year_events[index1:index2]
+
+    return events
+
+
+def get_greatest_elongations(start, end, name = None):
+    """Returns a list of PlanetaryEvent objects for every greatest eastern and
+    western elongation that occurs between two times, sorted by time. Only
+    Mercury and Venus have greatest elongations.
+
+    Keyword arguments:
+    start -- a PyEphem Date object.
+    end -- a PyEphem Date object.
+    name -- the name of a planet (e.g. 'Mercury') to only return its
+            elongations.
+    """
+
+    return [
+        event for event in get_catalog_events(start, end)
+        if event.type == 'elongation' and (name is None or event.body == name.lower())
+    ]
+
+
+def find_planetary_events(planets, start, end):
+    """Returns a sorted list of PlanetaryEvent objects for every opposition,
+    conjunction and greatest elongation of each planet between two times. The
+    elongation of every planet is sampled once a day to find each event, which
+    is then refined to the nearest second using bisection.
+
+    Keyword arguments:
+    planets -- a list of PyEphem Body objects.
+    start -- a PyEphem Date object.
+    end -- a PyEphem Date object.
+    """
+
+    events = []
+
+    # Search a day either side of the time period so that events landing close
+    # to the start or end are not missed.
+    times = numpy.arange(math.floor(start) - 1, math.ceil(end) + 2)
+
+    # Use a separate cache for the search so that the daily samples are shared
+    # with the refinements, without being added to the cache of a request.
+    with samples.use_cache(samples.SampleCache()):
+
+        elongs = samples.sample_positions(planets, times, 'bodies').elong
+
+        # The sine of the elongation is zero at both conjunction (0 degrees)
+        # and opposition (180 degrees), and unlike the elongation itself it
+        # does not jump when the elongation passes 360 degrees.
+        crossings = solvers.find_sign_changes(numpy.sin(elongs))
+
+        # The angular distance from the Sun is used for elongations, as the
+        # elongation changes sign abruptly when a planet passes close to (but
+        # not directly in front of) the Sun.
+        maxima = solvers.find_maxima(numpy.abs(elongs))
+
+        for row, column in zip(*numpy.nonzero(crossings)):
+            events.append(get_crossing_event(planets[row], times[column], times[column + 1]))
+
+        for row, column in zip(*numpy.nonzero(maxima)):
+
+            # Only inferior planets have a greatest elongation. The elongation
+            # of a superior planet keeps growing until it reaches opposition.
+            if planets[row].name in INFERIOR_PLANETS:
+                events.append(get_elongation_event(planets[row], times[column - 1], times[column + 1]))
+
+    return sorted([event for event in events if start <= event.time < end])
+
+
+def get_crossing_event(body, time1, time2):
+    """Returns a PlanetaryEvent for the opposition or conjunction of a planet
+    between two times, found to the nearest second using bisection.
+
+    Keyword arguments:
+    body -- a PyEphem Body object (typically a planet).
+    time1 -- a PyEphem Date object.
+    time2 -- a PyEphem Date object.
+    """
+
+    def get_sine(time):
+        return math.sin(samples.get_sample(body, time, 'bodies').elong)
+
+    time = solvers.find_root(get_sine, time1, time2)
+
+    if math.cos(samples.get_sample(body, time, 'bodies').elong) < 0:
+        return PlanetaryEvent(time, 'opposition', body.name.lower(), None)
+
+    # An inferior planet passing between the Earth and the Sun moves from east
+    # of the Sun to west of the Sun.
+    if body.name in INFERIOR_PLANETS:
+        if get_sine(time1) > 0:
+            subtype = 'inferior'
+        else:
+            subtype = 'superior'
+    else:
+        subtype = 'conjunction'
+
+    return PlanetaryEvent(time, 'conjunction', body.name.lower(), subtype)
+
+
+def get_elongation_event(body, time1, time2):
+    """Returns a PlanetaryEvent for the greatest elongation of a planet between
+    two times, found to the nearest second using bisection, along with the
+    angle between the planet and the Sun at that time.
+
+    Keyword arguments:
+    body -- a PyEphem Body object (typically a planet).
+    time1 -- a PyEphem Date object.
+    time2 -- a PyEphem Date object.
+    """
+
+    # The rate at which the angular distance from the Sun is changing, which is
+    # zero at greatest elongation. Finding where the rate changes sign is far
+    # more precise than searching for the largest angle, as the angle barely
+    # changes for hours either side of greatest elongation.
+    def get_rate(time):
+        return abs(samples.get_sample(body, time + ephem.hour, 'bodies').elong) - \
+               abs(samples.get_sample(body, time - ephem.hour, 'bodies').elong)
+
+    time = solvers.find_root(get_rate, time1, time2)
+    elong = samples.get_sample(body, time, 'bodies').elong
+
+    if elong > 0:
+        subtype = 'east'
+    else:
+        subtype = 'west'
+
+    return PlanetaryEvent(time, 'elongation', body.name.lower(), subtype, abs(helpers.get_degrees(elong)))
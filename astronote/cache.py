@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Cache
+###############################################################################
+
+# An opt-in, in-process cache of the results of `get_events`. Results are kept
+# in a least recently used (LRU) cache, keyed by the date and the location
+# rounded to a configurable precision, so that nearby requests share a result.
+# The events that do not depend on the location are cached separately, keyed
+# only by the date, so that they are shared by every location.
+
+import threading
+import time
+from collections import OrderedDict
+from . import parallel
+
+
+# The cache settings. Caching is disabled until `configure` is called.
+_settings = {
+    'enabled': False,
+    'precision': 0.01
+}
+
+# The results of `get_events` (keyed by date, location and sections) and the
+# location independent events (keyed by date and sections).
+results = None
+geocentric = None
+
+
+class LRUCache(object):
+    """A thread safe store of values that holds at most `max_size` values,
+    discarding the least recently used value when it is full. Values can
+    optionally expire `ttl` seconds after they are stored.
+
+    Keyword arguments:
+    max_size -- the maximum number of values stored.
+    ttl -- the number of seconds that a value is kept, or None to keep values
+           until they are discarded to make space.
+    """
+
+    def __init__(self, max_size = 1024, ttl = None):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.values = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+
+    def get(self, key):
+        """Returns the value stored for a key, or None if there is no value (or
+        the value has expired).
+
+        Keyword arguments:
+        key -- a hashable key.
+        """
+
+        with self.lock:
+
+            entry = self.values.get(key)
+
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                del self.values[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.values.move_to_end(key)
+            self.hits += 1
+
+            return entry[1]
+
+
+    def set(self, key, value):
+        """Stores the value for a key, discarding the least recently used
+        values if the cache is full.
+
+        Keyword arguments:
+        key -- a hashable key.
+        value -- the value to store (which must not be None).
+        """
+
+        expires = None
+
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+
+        with self.lock:
+
+            self.values[key] = (expires, value)
+            self.values.move_to_end(key)
+
+            while len(self.values) > self.max_size:
+                self.values.popitem(last=False)
+                self.evictions += 1
+
+
+    def invalidate(self, predicate = None):
+        """Removes every value whose key matches a predicate, or all values.
+        Returns the number of values that were removed.
+
+        Keyword arguments:
+        predicate -- a function that accepts a key and returns True if its
+                     value should be removed, or None to remove all values.
+        """
+
+        with self.lock:
+
+            if predicate is None:
+                keys = list(self.values)
+            else:
+                keys = [key for key in self.values if predicate(key)]
+
+            for key in keys:
+                del self.values[key]
+
+            return len(keys)
+
+
+    def get_stats(self):
+        """Returns a dictionary containing the number of values that were found
+        (hits), not found (misses), discarded to make space (evictions) and
+        discarded because they expired (expirations), along with the
+        proportion of requests that were hits and the number of values
+        currently stored.
+        """
+
+        with self.lock:
+
+            requests = self.hits + self.misses
+
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / requests if requests else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self.values)
+            }
+
+
+def configure(enabled = True, max_size = 1024, ttl = None, precision = 0.01, geocentric_max_size = 64):
+    """Enables (or disables) the result cache used by `get_events`, replacing
+    any existing caches.
+
+    Keyword arguments:
+    enabled -- True to cache results, or False to disable caching.
+    max_size -- the maximum number of results stored.
+    ttl -- the number of seconds that a result is kept, or None to keep
+           results until they are discarded to make space.
+    precision -- the number of degrees that latitudes and longitudes are
+                 rounded to, or None to only share results between identical
+                 locations. Results are calculated for the rounded location.
+    geocentric_max_size -- the maximum number of location independent results
+                           stored (one for each date and set of sections).
+    """
+
+    global results, geocentric
+
+    _settings['enabled'] = enabled
+    _settings['precision'] = precision
+
+    if enabled:
+        results = LRUCache(max_size, ttl)
+        geocentric = LRUCache(geocentric_max_size, ttl)
+    else:
+        results = None
+        geocentric = None
+
+    # Worker processes copy the caches when they start, so any running pool
+    # is shut down to start new workers with these settings.
+    parallel.shutdown()
+
+
+def is_enabled():
+    """Returns True if results are being cached."""
+
+    return _settings['enabled']
+
+
+def quantize(value, precision = None):
+    """Returns a floating-point latitude or longitude string rounded to the
+    nearest multiple of a precision.
+
+    Keyword arguments:
+    value -- a floating-point latitude or longitude string.
+    precision -- the number of degrees to round to. By default the configured
+                 precision is used.
+    """
+
+    if precision is None:
+        precision = _settings['precision']
+
+    if precision is None:
+        return str(value)
+
+    # Values are formatted with a fixed number of decimals, so that values
+    # close to zero are never formatted in exponent notation (e.g. 1e-05).
+    # Adding zero turns a rounded value of -0.0 into 0.0.
+    value = round(float(value) / precision) * precision
+
+    return '%.6f' % (round(value, 6) + 0.0)
+
+
+def invalidate(date = None):
+    """Removes all cached results, or only the results for a given date.
+    Returns the number of results that were removed.
+
+    Keyword arguments:
+    date -- a YYYY-MM-DD string, or None to remove every result.
+    """
+
+    if not is_enabled():
+        return 0
+
+    predicate = None
+
+    if date is not None:
+        predicate = lambda key: key[0] == date
+
+    return results.invalidate(predicate) + geocentric.invalidate(predicate)
+
+
+def get_stats():
+    """Returns a dictionary containing the statistics of the results cache and
+    the location independent cache, or None if caching is disabled.
+    """
+
+    if not is_enabled():
+        return None
+
+    return {
+        'results': results.get_stats(),
+        'geocentric': geocentric.get_stats()
+    }
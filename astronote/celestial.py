@@ -7,11 +7,167 @@
 # Methods relating to celestial events that are too small for their own module.
 
 import ephem
+import json
 import math
-from datetime import datetime
+import threading
+from collections import namedtuple
+from datetime import date as Day, datetime, timedelta
 from . import helpers
 
 
+# A meteor shower, where `start`, `peak` and `end` are (month, day) tuples and
+# `zhr` is the expected zenithal hourly rate at the peak. The start can fall
+# later in the year than the end for showers that are active over the new
+# year.
+MeteorShower = namedtuple('MeteorShower', ['name', 'start', 'peak', 'end', 'zhr'])
+
+
+# A list of popular meteor showers, detailing the meteor shower name, when the
+# shower is active and the expected peak.
+METEOR_SHOWERS = [
+    MeteorShower('Quadrantids', (12, 28), (1, 3), (1, 12), 120),
+    MeteorShower('Lyrids', (4, 14), (4, 22), (4, 30), 18),
+    MeteorShower('Eta Aquarids', (4, 19), (5, 6), (5, 28), 50),
+    MeteorShower('Perseids', (7, 17), (8, 13), (8, 24), 100),
+    MeteorShower('Draconids', (10, 6), (10, 8), (10, 10), 10),
+    MeteorShower('Orionids', (10, 2), (10, 21), (11, 7), 20),
+    MeteorShower('Leonids', (11, 6), (11, 18), (11, 30), 15),
+    MeteorShower('Geminids', (12, 4), (12, 14), (12, 20), 150),
+    MeteorShower('Ursids', (12, 17), (12, 22), (12, 26), 10)
+]
+
+# The number of days either side of a peak that a meteor shower is reported
+# by `get_meteor_showers`.
+PEAK_DAYS = 2
+
+
+# The meteor showers that are currently in use, the index of each year that
+# has been built from them and the lock held while either is changed.
+_meteor_showers = list(METEOR_SHOWERS)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def load_meteor_showers(path):
+    """Replaces the meteor shower catalog with one loaded from a JSON file and
+    returns it. The file must contain a list of objects with `name`, `start`,
+    `peak`, `end` and `zhr` keys, where each date is a [month, day] list.
+
+    Keyword arguments:
+    path -- the path to the JSON file.
+    """
+
+    with open(path) as f:
+        showers = [
+            MeteorShower(
+                shower['name'],
+                tuple(shower['start']),
+                tuple(shower['peak']),
+                tuple(shower['end']),
+                shower['zhr']
+            )
+            for shower in json.load(f)
+        ]
+
+    set_meteor_showers(showers)
+
+    return showers
+
+
+def set_meteor_showers(showers):
+    """Replaces the meteor shower catalog, discarding any index built from the
+    previous catalog.
+
+    Keyword arguments:
+    showers -- a list of MeteorShower objects.
+    """
+
+    global _meteor_showers
+
+    with _indexes_lock:
+        _meteor_showers = list(showers)
+        _indexes.clear()
+
+
+def get_index(year):
+    """Returns a tuple of two lists, each with an entry for every day of a year
+    (ordered by the day of the year). The first list contains the meteor
+    showers that peak within `PEAK_DAYS` of each day and the second contains
+    the meteor showers that are active on each day. Each year is only built
+    once.
+
+    Keyword arguments:
+    year -- the year as an integer.
+    """
+
+    index = _indexes.get(year)
+
+    if index is None:
+
+        # The lock is also held while the meteor showers are replaced, so an
+        # index is never built from a catalog that is being replaced.
+        with _indexes_lock:
+
+            if year not in _indexes:
+
+                first_day = Day(year, 1, 1)
+                days = (Day(year + 1, 1, 1) - first_day).days
+
+                peaks = [[] for day in range(days)]
+                active = [[] for day in range(days)]
+
+                def add(days_list, shower, start, end):
+                    start = max((start - first_day).days, 0)
+                    end = min((end - first_day).days, days - 1)
+
+                    for day in range(start, end + 1):
+                        days_list[day].append(shower)
+
+                for shower in _meteor_showers:
+
+                    # Showers from the previous and next years are included so
+                    # that showers active over the new year are found on both
+                    # sides of it.
+                    for shower_year in (year - 1, year, year + 1):
+
+                        peak = get_shower_day(shower_year, shower.peak)
+                        add(peaks, shower, peak - timedelta(PEAK_DAYS), peak + timedelta(PEAK_DAYS))
+
+                        start = get_shower_day(shower_year, shower.start)
+                        end = get_shower_day(shower_year, shower.end)
+
+                        if end < start:
+                            end = get_shower_day(shower_year + 1, shower.end)
+
+                        add(active, shower, start, end)
+
+                _indexes[year] = (
+                    [tuple(day) for day in peaks],
+                    [tuple(day) for day in active]
+                )
+
+            index = _indexes[year]
+
+    return index
+
+
+def get_shower_day(year, month_day):
+    """Returns the date of a (month, day) tuple in a given year. A leap day is
+    moved to the 28th of February in years without one.
+
+    Keyword arguments:
+    year -- the year as an integer.
+    month_day -- a (month, day) tuple.
+    """
+
+    month, day = month_day
+
+    if month == 2 and day == 29 and (Day(year, 3, 1) - Day(year, 2, 1)).days == 28:
+        day = 28
+
+    return Day(year, month, day)
+
+
 def get_meteor_showers(date):
     """Return a list of all meteor showers that are nearby a location based on
     the date.
@@ -20,105 +176,57 @@ def get_meteor_showers(date):
     date -- a YYYY-MM-DD string.
     """
 
-    # A list of popular meteor showers, detailing the meteor shower name and the
-    # expected peak.
-    meteor_showers = [
-        {
-            'name': 'Quadrantids',
-            'peak': {
-                'month': 1,
-                'day': 3
-            }
-        },
-        {
-            'name': 'Lyrids',
-            'peak': {
-                'month': 4,
-                'day': 22
-            }
-        },
-        {
-            'name': 'Eta Aquarids',
-            'peak': {
-                'month': 5,
-                'day': 6
-            }
-        },
-        {
-            'name': 'Perseids',
-            'peak': {
-                'month': 8,
-                'day': 13
-            }
-        },
-        {
-            'name': 'Draconids',
-            'peak': {
-                'month': 10,
-                'day': 8
-            }
-        },
-        {
-            'name': 'Orionids',
-            'peak': {
-                'month': 10,
-                'day': 21
-            }
-        },
-        {
-            'name': 'Leonids',
-            'peak': {
-                'month': 11,
-                'day': 18
-            }
-        },
-        {
-            'name': 'Geminids',
-            'peak': {
-                'month': 12,
-                'day': 14
-            }
-        },
+    day = datetime.strptime(date, '%Y-%m-%d').date()
+    peaks = get_index(day.year)[0][day.timetuple().tm_yday - 1]
+
+    return [
         {
-            'name': 'Ursids',
+            'name': shower.name,
             'peak': {
-                'month': 12,
-                'day': 22
+                'month': shower.peak[0],
+                'day': shower.peak[1]
             }
         }
+        for shower in peaks
     ]
 
-    # Retrieve the year by splitting the date of the current location.
-    year = helpers.split_date(ephem.Date(date))['year']
 
-    # Calculate the start and end date range that will be used to compare
-    # against the peaks of all meteor showers.
-    start_date = ephem.Date(date) - 3
-    end_date = ephem.Date(date) + 3
+def get_active_meteor_showers(date):
+    """Return a list of all MeteorShower objects that are active on a given
+    day.
+
+    Keyword arguments:
+    date -- a YYYY-MM-DD string.
+    """
+
+    day = datetime.strptime(date, '%Y-%m-%d').date()
+    return list(get_index(day.year)[1][day.timetuple().tm_yday - 1])
+
 
-    # Create an empty list that will be populated if any meteor showers are
-    # nearby.
-    visible_meteor_showers = []
+def get_active_meteor_showers_range(start, end):
+    """Return a list of (date, showers) tuples for every day between two dates
+    (inclusive), where `showers` is a list of MeteorShower objects that are
+    active on that day.
 
-    # Check each meteor shower, stopping the check after a meteor shower later
-    # than the location date is checked. This prevents us from checking things
-    # that will never return a value.
-    for meteor_shower in meteor_showers:
+    Keyword arguments:
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    """
 
-        month = meteor_shower['peak']['month']
-        day = meteor_shower['peak']['day']
-        peak_date = ephem.Date(datetime(year, month, day))
+    day = datetime.strptime(start, '%Y-%m-%d').date()
+    end = datetime.strptime(end, '%Y-%m-%d').date()
 
-        if peak_date > start_date and peak_date < end_date:
+    days = []
 
-            visible_meteor_showers.append({
-                'name': meteor_shower['name'],
-                'peak': meteor_shower['peak']
-            })
+    while day <= end:
 
-        elif end_date < peak_date:
+        active = get_index(day.year)[1]
+        last_day = min(end, Day(day.year, 12, 31))
 
-            break
+        # Take every day of the year in the range straight from the index.
+        for index in range(day.timetuple().tm_yday - 1, last_day.timetuple().tm_yday):
+            days.append(((Day(day.year, 1, 1) + timedelta(index)).strftime('%Y-%m-%d'), list(active[index])))
 
-    return visible_meteor_showers
+        day = last_day + timedelta(1)
 
+    return days
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Command line
+###############################################################################
+
+# The `astronote` command, which calculates the events for many (date, lat,
+# lon) rows read as CSV from files or standard input, and writes the events of
+# each row as a line of JSON (NDJSON) in the same order. Rows are read and
+# calculated a chunk at a time, so any number of rows can be streamed through
+# a single process: the bodies are only created once, and the location
+# independent events of each date are shared by every row in a chunk.
+#
+# `astronote prefill` instead calculates the location independent events of
+# every day between two years and adds them to a store (see `prefill_store`).
+#
+# Usage: astronote [-o OUTPUT] [-w WORKERS] [-i SECTIONS] [FILE ...]
+#        astronote prefill [-w WORKERS] -s STORE START END
+
+import argparse
+import contextlib
+import csv
+import json
+import sys
+from . import core, helpers, parallel, samples, store
+
+
+# The number of rows calculated at once (and sent to a worker at once).
+CHUNK_SIZE = 256
+
+
+def read_rows(files):
+    """Yields a (date, lat, lon) tuple for each row of CSV files. Blank rows,
+    rows starting with '#' and a header row (starting with 'date') are
+    skipped, as are any columns after the first three. Rows with fewer than
+    three columns are yielded with the missing values as None.
+
+    Keyword arguments:
+    files -- a list of file objects opened for reading text.
+    """
+
+    for input_file in files:
+
+        for row in csv.reader(input_file):
+
+            if not row or not row[0].strip() or row[0].startswith('#'):
+                continue
+
+            if row[0].strip().lower() == 'date':
+                continue
+
+            row = [value.strip() for value in row[:3]]
+            row += [None] * (3 - len(row))
+
+            yield tuple(row)
+
+
+def get_lines(bodies, rows, include):
+    """Returns a list containing a line of JSON for each row, containing the
+    date, lat and lon of the row along with either its events or an error.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    rows -- a list of (date, lat, lon) tuples.
+    include -- a set of the sections to calculate.
+    """
+
+    lines = []
+    geocentric = {}
+
+    with samples.use_cache(samples.SampleCache()):
+
+        for date, lat, lon in rows:
+
+            line = {'date': date, 'lat': lat, 'lon': lon}
+
+            try:
+
+                if not date or not lat or not lon:
+                    raise ValueError('A date, lat and lon are required')
+
+                # Check the row before calculating anything for it.
+                helpers.check_location(date, lat, lon)
+
+                if date not in geocentric:
+                    geocentric[date] = core._get_cached_geocentric_events(bodies, date, include)
+
+                line['events'] = core._get_local_events(bodies, date, lat, lon, geocentric[date], include)
+
+            # Any row that cannot be calculated is written as an error, so
+            # one bad row does not stop the rest of the stream.
+            except Exception as error:
+                line['error'] = str(error) or error.__class__.__name__
+
+            lines.append(json.dumps(line))
+
+    return lines
+
+
+def _get_lines_chunk(rows, include):
+    """Returns the lines of JSON for a chunk of rows in a worker process.
+
+    Keyword arguments:
+    rows -- a list of (date, lat, lon) tuples.
+    include -- a set of the sections to calculate.
+    """
+
+    return get_lines(core._worker_bodies, rows, include)
+
+
+def iter_lines(rows, workers = None, include = None):
+    """Yields a line of JSON for each of an iterable of rows, in the same
+    order as the rows.
+
+    Keyword arguments:
+    rows -- an iterable of (date, lat, lon) tuples.
+    workers -- the number of processes to split the rows between. By default
+               all rows are calculated in the current process.
+    include -- a collection of the SECTIONS to calculate. By default every
+               section is calculated.
+    """
+
+    include = core.get_sections(include)
+    chunks = parallel.split_chunks(rows, CHUNK_SIZE)
+
+    if workers and workers > 1:
+
+        for line in parallel.iter_chunks(_get_lines_chunk, chunks, workers, core._initialize_worker, include):
+            yield line
+
+        return
+
+    # The bodies are created once and used for every row.
+    bodies = core._create_bodies(helpers.define_location('2000-01-01', '0', '0'))
+
+    for chunk in chunks:
+        for line in get_lines(bodies, chunk, include):
+            yield line
+
+
+def get_parser():
+    """Returns the ArgumentParser used by `main`."""
+
+    parser = argparse.ArgumentParser(
+        prog='astronote',
+        description='Calculates the astronomical events for each date,lat,lon '
+                    'row of CSV input, writing the events of each row as a '
+                    'line of JSON.'
+    )
+
+    parser.add_argument(
+        'files', nargs='*', metavar='FILE',
+        help="CSV files of date,lat,lon rows (or '-' for standard input, the default)"
+    )
+    parser.add_argument(
+        '-o', '--output', default='-',
+        help="the file to write to (or '-' for standard output, the default)"
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=None,
+        help='the number of processes to split the rows between'
+    )
+    parser.add_argument(
+        '-i', '--include', default=None,
+        help='a comma separated list of the sections to calculate (%s)' % ', '.join(core.SECTIONS)
+    )
+
+    return parser
+
+
+def get_prefill_parser():
+    """Returns the ArgumentParser used by `prefill`."""
+
+    parser = argparse.ArgumentParser(
+        prog='astronote prefill',
+        description='Calculates the location independent events of every day '
+                    'between two years (inclusive) and adds any that are '
+                    'missing to a store.'
+    )
+
+    parser.add_argument('start', type=int, metavar='START', help='the first year to store')
+    parser.add_argument('end', type=int, metavar='END', help='the last year to store')
+    parser.add_argument(
+        '-s', '--store', required=True,
+        help='the path of the database file to store the events in'
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=None,
+        help='the number of processes to split the days between'
+    )
+
+    return parser
+
+
+def prefill(arguments):
+    """Runs the `astronote prefill` command and returns its exit status.
+
+    Keyword arguments:
+    arguments -- a list of command line arguments after `prefill`.
+    """
+
+    parser = get_prefill_parser()
+    arguments = parser.parse_args(arguments)
+
+    if arguments.start > arguments.end:
+        parser.error('START must not be after END')
+
+    store.configure(arguments.store)
+
+    try:
+        count = core.prefill_store(arguments.start, arguments.end, arguments.workers)
+    finally:
+        # Closes the store and shuts down any workers.
+        store.configure(None)
+
+    sys.stdout.write('Stored %d days\n' % count)
+
+    return 0
+
+
+def main(arguments = None):
+    """Runs the `astronote` command and returns its exit status.
+
+    Keyword arguments:
+    arguments -- a list of command line arguments, or None to use sys.argv.
+    """
+
+    if arguments is None:
+        arguments = sys.argv[1:]
+
+    if arguments and arguments[0] == 'prefill':
+        return prefill(arguments[1:])
+
+    parser = get_parser()
+    arguments = parser.parse_args(arguments)
+
+    include = None
+
+    if arguments.include is not None:
+        include = [section.strip() for section in arguments.include.split(',') if section.strip()]
+
+    try:
+        include = core.get_sections(include)
+    except ValueError as error:
+        parser.error(str(error))
+
+    # Every file opened is closed on the way out, even if a later one cannot
+    # be opened.
+    with contextlib.ExitStack() as stack:
+
+        stack.callback(parallel.shutdown)
+
+        files = []
+
+        for path in arguments.files or ['-']:
+            files.append(sys.stdin if path == '-' else stack.enter_context(open(path, newline='')))
+
+        output = sys.stdout if arguments.output == '-' else stack.enter_context(open(arguments.output, 'w'))
+
+        for line in iter_lines(read_rows(files), arguments.workers, include):
+            output.write(line + '\n')
+
+    return 0
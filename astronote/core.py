@@ -4,8 +4,10 @@
 # AstroNote
 ###############################################################################
 
+import copy
 import ephem
 import math
+from collections.abc import Mapping
 from datetime import datetime
 from . import lunar
 from . import bodies
@@ -14,9 +16,22 @@ from . import celestial
 from . import transits
 from . import separations
 from . import helpers
+from . import instrumentation
+from . import parallel
+from . import samples
+from . import cache
+from . import store
+from . import records
 
 
-def get_events(date = datetime.now().strftime('%Y-%m-%d'), lat = '0', lon = '0'):
+# The sections of events that can be included in the results of `get_events`.
+# The 'sun', 'moon' and 'planets' sections each have their own key, while the
+# events from the remaining sections are combined in the 'events' list.
+SECTIONS = ['sun', 'moon', 'planets', 'planetary', 'separations', 'meteor_showers', 'seasons']
+EVENT_SECTIONS = ['planetary', 'separations', 'meteor_showers', 'seasons']
+
+
+def get_events(date = datetime.now().strftime('%Y-%m-%d'), lat = '0', lon = '0', include = None, lazy = False, compact = False):
     """Calculates all astronomical events on a given day at a given location.
     The returned events containin information about:
 
@@ -31,18 +46,444 @@ def get_events(date = datetime.now().strftime('%Y-%m-%d'), lat = '0', lon = '0')
     date -- a YYYY-MM-DD string.
     lat -- a floating-point latitude string. (positive/negative = North/South)
     lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a collection of the SECTIONS to calculate. By default every
+               section is calculated.
+    lazy -- if True, a LazyEvents object is returned that only calculates
+            each section the first time it is accessed.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
     """
 
-    # Determine the hemisphere based on the latitude.
-    if float(lat) > 0:
-        hemisphere = 'north'
-    else:
-        hemisphere = 'south'
+    include = get_sections(include)
 
+    # Results are only cached once the cache has been configured (see
+    # `cache.configure`).
+    if cache.is_enabled() and not lazy:
+        return _get_cached_events(date, lat, lon, include, compact)
 
     # Create a location and all body objects.
     location = helpers.define_location(date, lat, lon)
 
+    if lazy:
+        return LazyEvents(_create_bodies(location), date, lat, lon, include, compact)
+
+    # Share samples between all methods for the duration of the request, as
+    # the same bodies are computed at the same times by several methods.
+    with samples.request_cache():
+        return _get_events(_create_bodies(location), date, lat, lon, include, compact)
+
+
+def _get_cached_events(date, lat, lon, include, compact = False):
+    """Returns the events on a given day at a given location from the result
+    cache, calculating and storing them if they are not cached. The location
+    is rounded to the precision of the cache before the events are
+    calculated.
+
+    Keyword arguments:
+    date -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a set of the sections to calculate.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    lat = cache.quantize(lat)
+    lon = cache.quantize(lon)
+
+    key = (date, lat, lon, frozenset(include), compact)
+    events = cache.results.get(key)
+
+    if events is None:
+
+        location = helpers.define_location(date, lat, lon)
+        bodies = _create_bodies(location)
+
+        with samples.request_cache():
+            geocentric = _get_cached_geocentric_events(bodies, date, include)
+            events = _get_local_events(bodies, date, lat, lon, geocentric, include, compact)
+
+        cache.results.set(key, events)
+
+    # Each caller receives its own copy so that it can be modified without
+    # affecting the cached result.
+    return copy.deepcopy(events)
+
+
+def _get_cached_geocentric_events(bodies, date, include):
+    """Returns the events on a given day that do not depend on the location,
+    using the location independent cache (if caching is enabled) followed by
+    the persistent store (if one is configured) before calculating them.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    date -- a YYYY-MM-DD string.
+    include -- a set of the sections to calculate.
+    """
+
+    sections = frozenset(include.difference(['sun', 'planets']))
+
+    if cache.is_enabled():
+
+        geocentric = cache.geocentric.get((date, sections))
+
+        if geocentric is not None:
+            return geocentric
+
+    geocentric_store = store.get_store()
+    geocentric = None
+
+    if geocentric_store is not None:
+        geocentric = geocentric_store.get(date, sections)
+
+    if geocentric is None:
+
+        geocentric = _get_geocentric_events(bodies, date, include)
+
+        if geocentric_store is not None:
+            geocentric_store.set(date, sections, geocentric)
+
+    if cache.is_enabled():
+        cache.geocentric.set((date, sections), geocentric)
+
+    return geocentric
+
+
+def prefill_store(start_year, end_year, workers = None):
+    """Calculates and stores the location independent events of every day
+    between two years (inclusive) in the configured store, skipping any days
+    that are already stored. Returns the number of days that were added.
+
+    Keyword arguments:
+    start_year -- the first year to store.
+    end_year -- the last year to store.
+    workers -- the number of processes to split the days between. By default
+               all days are calculated in the current process.
+    """
+
+    geocentric_store = store.get_store()
+
+    if geocentric_store is None:
+        raise ValueError('No store is configured')
+
+    sections = frozenset(SECTIONS).difference(['sun', 'planets'])
+    stored = geocentric_store.get_dates(sections)
+
+    count = 0
+
+    for year in range(start_year, end_year + 1):
+
+        dates = [
+            date for date in helpers.get_date_range('%d-01-01' % year, '%d-12-31' % year)
+            if date not in stored
+        ]
+
+        if not dates:
+            continue
+
+        if workers and workers > 1:
+            items = parallel.map_chunks(_get_geocentric_chunk, dates, workers, _initialize_worker)
+        else:
+            location = helpers.define_location(dates[0], '0', '0')
+            items = _get_geocentric_for_dates(_create_bodies(location), dates)
+
+        # Each year is stored in a single transaction.
+        geocentric_store.set_many(items, sections)
+        count += len(items)
+
+    return count
+
+
+def _get_geocentric_for_dates(bodies, dates):
+    """Returns a list of (date, geocentric) tuples containing the location
+    independent events for a list of consecutive dates.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    dates -- a list of consecutive YYYY-MM-DD strings.
+    """
+
+    sample_cache = samples.SampleCache()
+
+    items = []
+
+    with samples.use_cache(sample_cache):
+
+        for date in dates:
+
+            items.append((date, _get_geocentric_events(bodies, date)))
+            sample_cache.discard_before(ephem.Date(date) + 1)
+
+    return items
+
+
+def get_sections(include = None):
+    """Returns a set of the sections to calculate, raising a ValueError if
+    any of the sections are unknown.
+
+    Keyword arguments:
+    include -- a collection of section names, or None for every section.
+    """
+
+    if include is None:
+        return set(SECTIONS)
+
+    include = set(include)
+
+    for section in include:
+        if section not in SECTIONS:
+            raise ValueError('Unknown section: %s' % section)
+
+    return include
+
+
+class LazyEvents(Mapping):
+    """The events on a given day at a given location, where each of the
+    'sun', 'moon', 'planets' and 'events' keys is only calculated the first
+    time it is accessed. The keys and values are identical to the dictionary
+    returned by `get_events`, which can be created with `dict(events)`.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    date -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a set of the sections to calculate.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    def __init__(self, bodies, date, lat, lon, include, compact = False):
+        self.bodies = bodies
+        self.date = date
+        self.lat = lat
+        self.lon = lon
+        self.include = include
+        self.compact = compact
+
+        # Samples are shared between sections, however many are accessed.
+        self.cache = samples.SampleCache()
+
+        self._keys = _get_keys(include)
+        self._values = {}
+        self._horizon = None
+
+
+    def __getitem__(self, key):
+
+        if key not in self._keys:
+            raise KeyError(key)
+
+        if key not in self._values:
+            with samples.use_cache(self.cache):
+                self._values[key] = self._calculate(key)
+
+        return self._values[key]
+
+
+    def __iter__(self):
+        return iter(self._keys)
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def __repr__(self):
+        return 'LazyEvents(%r, %r, %r, calculated=%r)' % (self.date, self.lat, self.lon, sorted(self._values))
+
+
+    def _calculate(self, key):
+        """Calculates the value of a key.
+
+        Keyword arguments:
+        key -- one of 'sun', 'moon', 'planets' or 'events'.
+        """
+
+        bodies = self.bodies
+
+        if key == 'events':
+            geocentric = _get_cached_geocentric_events(bodies, self.date, self.include.intersection(EVENT_SECTIONS))
+            return _get_event_records(geocentric, self.compact)
+
+        # The transit sections share a single SampledHorizon (if the sampled
+        # engine is configured), which is created the first time one of them
+        # is accessed.
+        if self._horizon is None:
+            self._horizon = transits.get_horizon(_get_transit_bodies(bodies, self.include), self.date, self.lat, self.lon)
+
+        if key == 'sun':
+            return get_sun_data(bodies['sun'], self.date, self.lat, self.lon, self._horizon, self.compact)
+
+        if key == 'moon':
+            geocentric = get_geocentric_moon_data(bodies['moon'], self.date)
+            return _get_moon_data(bodies['moon'], self.date, self.lat, self.lon, geocentric, self._horizon, self.compact)
+
+        return get_planet_data(bodies['planets'], self.date, self.lat, self.lon, self._horizon, self.compact)
+
+
+def _get_keys(include):
+    """Returns the list of keys in the events for a set of sections.
+
+    Keyword arguments:
+    include -- a set of the sections to calculate.
+    """
+
+    keys = [key for key in ['sun', 'moon', 'planets'] if key in include]
+
+    if include.intersection(EVENT_SECTIONS):
+        keys.append('events')
+
+    return keys
+
+
+def _get_transit_bodies(bodies, include):
+    """Returns a list of the bodies whose rise and set times are needed for a
+    set of sections.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    include -- a set of the sections to calculate.
+    """
+
+    transit_bodies = []
+
+    if 'sun' in include:
+        transit_bodies.append(bodies['sun'])
+
+    if 'moon' in include:
+        transit_bodies.append(bodies['moon'])
+
+    if 'planets' in include:
+        transit_bodies += bodies['planets']
+
+    return transit_bodies
+
+
+def get_events_range(start, end, lat = '0', lon = '0', workers = None, include = None, compact = False):
+    """Calculates all astronomical events for every day between two dates
+    (inclusive) at a given location. The events for each day are identical to
+    those returned by `get_events`, but the bodies are only created once and
+    any samples shared by consecutive days (e.g. the end of one day and the
+    start of the next) are only calculated once.
+
+    Returns a list of (date, events) tuples in date order.
+
+    Keyword arguments:
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    workers -- the number of processes to split the days between. By default
+               all days are calculated in the current process.
+    include -- a collection of the SECTIONS to calculate. By default every
+               section is calculated.
+    """
+
+    include = get_sections(include)
+    dates = helpers.get_date_range(start, end)
+
+    if workers and workers > 1:
+        return parallel.map_chunks(_get_range_chunk, dates, workers, _initialize_worker, lat, lon, include, compact)
+
+    location = helpers.define_location(start, lat, lon)
+
+    return _get_events_for_dates(_create_bodies(location), dates, lat, lon, include, compact)
+
+
+def iter_events(start, end, lat = '0', lon = '0', workers = None, include = None, compact = False):
+    """Yields a (date, events) tuple for every day between two dates
+    (inclusive) at a given location, in date order, with the same events as
+    `get_events_range`. Each day is only calculated when it is requested (or
+    a few chunks ahead, when using workers), so the memory used does not
+    depend on the number of days and the caller controls the pace.
+
+    Keyword arguments:
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    workers -- the number of processes to split the days between. By default
+               all days are calculated in the current process.
+    include -- a collection of the SECTIONS to calculate. By default every
+               section is calculated.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    include = get_sections(include)
+    dates = helpers.iter_date_range(start, end)
+
+    if workers and workers > 1:
+
+        chunks = parallel.split_chunks(dates, parallel.STREAM_CHUNK_SIZE)
+        results = parallel.iter_chunks(_get_range_chunk, chunks, workers, _initialize_worker, lat, lon, include, compact)
+
+    else:
+
+        location = helpers.define_location(start, lat, lon)
+        results = _iter_events_for_dates(_create_bodies(location), dates, lat, lon, include, compact)
+
+    for result in results:
+        yield result
+
+
+def _get_events_for_dates(bodies, dates, lat, lon, include = None, compact = False):
+    """Returns a list of (date, events) tuples for a list of consecutive dates
+    at a given location, using existing body objects.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    dates -- a list of consecutive YYYY-MM-DD strings.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a set of the sections to calculate, or None for every section.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    return list(_iter_events_for_dates(bodies, dates, lat, lon, include, compact))
+
+
+def _iter_events_for_dates(bodies, dates, lat, lon, include = None, compact = False):
+    """Yields a (date, events) tuple for each of an iterable of consecutive
+    dates at a given location, using existing body objects.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    dates -- an iterable of consecutive YYYY-MM-DD strings.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a set of the sections to calculate, or None for every section.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    sample_cache = samples.SampleCache()
+
+    for date in dates:
+
+        # The cache is only active while each day is calculated, so that it
+        # is never left active for the caller between days.
+        with samples.use_cache(sample_cache):
+            events = _get_events(bodies, date, lat, lon, include, compact)
+
+        # Samples from before the next day (or from before the earliest
+        # sample used by the sampled transit engine) will never be requested
+        # again, so they are discarded to keep the cache from growing for the
+        # length of the range.
+        sample_cache.discard_before(ephem.Date(date) + 1 - transits.SAMPLE_DAYS_BEFORE)
+
+        yield date, events
+
+
+def _create_bodies(location):
+    """Returns a dictionary of all PyEphem objects used to calculate events.
+
+    Keyword arguments:
+    location -- a PyEphem Observer object.
+    """
+
     # Create all of the PyEphem objects that will be used.
     sun = ephem.Sun(location)
     moon = ephem.Moon(location)
@@ -55,32 +496,267 @@ def get_events(date = datetime.now().strftime('%Y-%m-%d'), lat = '0', lon = '0')
     neptune = ephem.Neptune(location)
     pluto = ephem.Pluto(location)
 
-    # Create lists for referencing in later loops.
-    planets = [mercury, venus, mars, jupiter, saturn, uranus, neptune, pluto]
-    bodies = [moon] + planets
+    return {
+        'sun': sun,
+        'moon': moon,
+        'planets': [mercury, venus, mars, jupiter, saturn, uranus, neptune, pluto]
+    }
+
+
+def get_events_many(date, locations, workers = None, include = None, compact = False):
+    """Calculates all astronomical events on a given day for many locations.
+    The events for each location are identical to those returned by
+    `get_events`, but everything that does not depend on the location (e.g.
+    planetary events, separations and meteor showers) is only calculated once.
+
+    Returns a list of events in the same order as `locations`.
+
+    Keyword arguments:
+    date -- a YYYY-MM-DD string.
+    locations -- a list of (lat, lon) tuples of floating-point strings.
+    workers -- the number of processes to split the locations between. By
+               default all locations are calculated in the current process.
+    include -- a collection of the SECTIONS to calculate. By default every
+               section is calculated.
+    """
+
+    include = get_sections(include)
+
+    location = helpers.define_location(date, '0', '0')
+    bodies = _create_bodies(location)
+
+    with samples.request_cache():
+        geocentric = _get_cached_geocentric_events(bodies, date, include)
+
+    # The location independent events are calculated once and sent to each
+    # worker, so only the location dependent events are split between them.
+    if workers and workers > 1:
+        return parallel.map_chunks(_get_many_chunk, list(locations), workers, _initialize_worker, date, geocentric, include, compact)
+
+    return [
+        _get_local_events(bodies, date, lat, lon, geocentric, include, compact)
+        for lat, lon in locations
+    ]
+
+
+# The bodies used by a worker process, created once when the worker starts.
+_worker_bodies = None
+
+
+def _initialize_worker():
+    """Creates the bodies used by a worker process, then builds the tables of
+    the current year (e.g. the planetary event catalog) so that they are ready
+    before the worker takes any work.
+    """
+
+    global _worker_bodies
+
+    now = datetime.now()
+    _worker_bodies = _create_bodies(helpers.define_location(now.strftime('%Y-%m-%d'), '0', '0'))
+
+    bodies.get_catalog(now.year)
+    lunar.get_phase_table(now.year)
+    lunar.get_apsis_table(now.year)
+    seasons.build_season_table(now.year, now.year)
+    celestial.get_index(now.year)
 
 
-    # Define a list to store all events that occur on the given day.
-    events = {
-        'sun': get_sun_data(sun, date, lat, lon),
-        'moon': get_moon_data(moon, date, lat, lon),
-        'planets': get_planet_data(planets, date, lat, lon),
-        'events': []
+def _get_range_chunk(dates, lat, lon, include, compact):
+    """Returns the events for a chunk of consecutive dates in a worker process.
+
+    Keyword arguments:
+    dates -- a list of consecutive YYYY-MM-DD strings.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a set of the sections to calculate.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    return _get_events_for_dates(_worker_bodies, dates, lat, lon, include, compact)
+
+
+def _get_geocentric_chunk(dates):
+    """Returns the location independent events for a chunk of consecutive
+    dates in a worker process.
+
+    Keyword arguments:
+    dates -- a list of consecutive YYYY-MM-DD strings.
+    """
+
+    return _get_geocentric_for_dates(_worker_bodies, dates)
+
+
+def _get_many_chunk(locations, date, geocentric, include, compact):
+    """Returns the events for a chunk of locations in a worker process.
+
+    Keyword arguments:
+    locations -- a list of (lat, lon) tuples of floating-point strings.
+    date -- a YYYY-MM-DD string.
+    geocentric -- a dictionary of events, as created by
+                  `_get_geocentric_events`.
+    include -- a set of the sections to calculate.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    return [
+        _get_local_events(_worker_bodies, date, lat, lon, geocentric, include, compact)
+        for lat, lon in locations
+    ]
+
+
+def _get_events(bodies, date, lat, lon, include = None, compact = False):
+    """Calculates all astronomical events on a given day at a given location
+    using existing body objects.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    date -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a set of the sections to calculate, or None for every section.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    if include is None:
+        include = set(SECTIONS)
+
+    geocentric = _get_cached_geocentric_events(bodies, date, include)
+    return _get_local_events(bodies, date, lat, lon, geocentric, include, compact)
+
+
+def _get_geocentric_events(bodies, date, include = None):
+    """Calculates all astronomical events on a given day that do not depend on
+    the location they are viewed from.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    date -- a YYYY-MM-DD string.
+    include -- a set of the sections to calculate, or None for every section.
+    """
+
+    if include is None:
+        include = set(SECTIONS)
+
+    geocentric = {
+        'events': _get_event_list(bodies, date, include)
     }
 
+    if 'moon' in include:
+        with instrumentation.section('moon'):
+            geocentric['moon'] = get_geocentric_moon_data(bodies['moon'], date)
+
+    return geocentric
 
-    events['events'] += get_planetary_events(planets, date, lat, lon)
-    events['events'] += get_separation_events(bodies, date)
-    events['events'] += get_celestial_events(date)
 
+def _get_event_list(bodies, date, include):
+    """Returns the list of events on a given day for the event sections that
+    are included.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    date -- a YYYY-MM-DD string.
+    include -- a set of the sections to calculate.
+    """
+
+    moon = bodies['moon']
+    planets = bodies['planets']
+
+    events = []
+
+    if 'planetary' in include:
+        with instrumentation.section('planetary'):
+            events += get_planetary_events(planets, date, None, None)
+
+    if 'separations' in include:
+        with instrumentation.section('separations'):
+            events += get_separation_events([moon] + planets, date)
+
+    if 'meteor_showers' in include:
+        with instrumentation.section('meteor_showers'):
+            events += get_celestial_events(date)
+
+    if 'seasons' in include:
+        with instrumentation.section('seasons'):
+            events += get_season_events(date)
+
+    return events
+
+
+def _get_local_events(bodies, date, lat, lon, geocentric, include = None, compact = False):
+    """Calculates all astronomical events on a given day at a given location,
+    combining them with the events that do not depend on the location.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    date -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    geocentric -- a dictionary of events, as created by
+                  `_get_geocentric_events`.
+    include -- a set of the sections to calculate, or None for every section.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    if include is None:
+        include = set(SECTIONS)
+
+    # Find the rise and set times of every body at once if the sampled transit
+    # engine is configured.
+    horizon = None
+    transit_bodies = _get_transit_bodies(bodies, include)
+
+    if transit_bodies:
+        with instrumentation.section('horizon'):
+            horizon = transits.get_horizon(transit_bodies, date, lat, lon)
+
+    # Define a dictionary to store all events that occur on the given day.
+    events = {}
+
+    if 'sun' in include:
+        with instrumentation.section('sun'):
+            events['sun'] = get_sun_data(bodies['sun'], date, lat, lon, horizon, compact)
+
+    if 'moon' in include:
+        with instrumentation.section('moon'):
+            events['moon'] = _get_moon_data(bodies['moon'], date, lat, lon, geocentric['moon'], horizon, compact)
+
+    if 'planets' in include:
+        with instrumentation.section('planets'):
+            events['planets'] = get_planet_data(bodies['planets'], date, lat, lon, horizon, compact)
+
+    if 'events' in _get_keys(include):
+        events['events'] = _get_event_records(geocentric, compact)
 
     return events
 
 
-def get_sun_data(sun, date, lat, lon):
+def _get_event_records(geocentric, compact = False):
+    """Returns the list of location independent events for a location. Each
+    location receives its own list (and its own dictionaries, unless compact
+    records are requested) so that the events of each location can be
+    modified separately.
+
+    Keyword arguments:
+    geocentric -- a dictionary of events, as created by
+                  `_get_geocentric_events`.
+    compact -- if True, rise and set times and events are returned as compact
+               Transit and Event records rather than dictionaries.
+    """
+
+    if compact:
+        return list(geocentric['events'])
+
+    return [event.to_dict() for event in geocentric['events']]
+
+
+def get_sun_data(sun, date, lat, lon, horizon = None, compact = False):
 
     data = {
-        'transits': transits.get_transit_times(sun, date, lat, lon)
+        'transits': transits.get_transit_times(sun, date, lat, lon, horizon, compact)
     }
 
     return data
@@ -88,23 +764,77 @@ def get_sun_data(sun, date, lat, lon):
 
 def get_moon_data(moon, date, lat, lon):
 
+    return _get_moon_data(moon, date, lat, lon, get_geocentric_moon_data(moon, date))
+
+
+def _get_moon_data(moon, date, lat, lon, geocentric, horizon = None, compact = False):
+
     data = {
-        'transits': transits.get_transit_times(moon, date, lat, lon),
-        'phase': {
-            'percent': int(round(moon.moon_phase * 100, 0)),
-            'name': lunar.is_major_phase(date)
-        }
+        'transits': transits.get_transit_times(moon, date, lat, lon, horizon, compact),
+        'phase': dict(geocentric['phase'])
     }
 
-    if lunar.is_at_perigee(moon, date):
+    if geocentric['perigee']:
         data['perigee'] = True
-    elif lunar.is_at_apogee(moon, date):
+    elif geocentric['apogee']:
         data['apogee'] = True
 
+    apsis = geocentric['apsis']
+
+    if apsis is not None:
+
+        time = records.Timestamp(apsis['time'])
+
+        data['apsis'] = {
+            'type': apsis['type'],
+            'time': time if compact else time.to_dict(),
+            'distance': apsis['distance']
+        }
+
+    if geocentric['supermoon']:
+        data['supermoon'] = True
+
     return data
 
 
-def get_planet_data(planets, date, lat, lon):
+def get_geocentric_moon_data(moon, date):
+    """Returns a dictionary of Moon data that does not depend on the location
+    it is viewed from, i.e. the phase, whether the Moon is at perigee or
+    apogee (along with the exact time and distance, in kilometres, of the
+    perigee or apogee) and whether a full Moon is a supermoon.
+
+    Keyword arguments:
+    moon -- a PyEphem Moon object.
+    date -- a YYYY-MM-DD string.
+    """
+
+    # The illuminated percentage is measured at the start of the day.
+    instrumentation.count('computes', 'core')
+    moon.compute(date)
+
+    # Perigees and apogees are looked up from the apsis table.
+    apsis = lunar.get_apsis(date)
+
+    if apsis is not None:
+        apsis = {
+            'type': apsis.type,
+            'time': apsis.time,
+            'distance': int(round(apsis.distance))
+        }
+
+    return {
+        'phase': {
+            'percent': int(round(moon.moon_phase * 100, 0)),
+            'name': lunar.is_major_phase(date)
+        },
+        'perigee': apsis is not None and apsis['type'] == 'perigee',
+        'apogee': apsis is not None and apsis['type'] == 'apogee',
+        'apsis': apsis,
+        'supermoon': lunar.is_supermoon(date)
+    }
+
+
+def get_planet_data(planets, date, lat, lon, horizon = None, compact = False):
 
     data = []
 
@@ -114,7 +844,7 @@ def get_planet_data(planets, date, lat, lon):
 
             planet_data = {
                 'name': planet.name,
-                'transits': transits.get_transit_times(planet, date, lat, lon)
+                'transits': transits.get_transit_times(planet, date, lat, lon, horizon, compact)
             }
 
             data.append(planet_data)
@@ -126,35 +856,31 @@ def get_planetary_events(planets, date, lat, lon):
 
     events = []
 
-    for planet in planets:
-
-        if planet.name != 'Mercury' and planet.name != 'Venus':
-
-            if bodies.is_opposition(planet, date):
+    # Look up all oppositions, conjunctions and elongations that occur during
+    # the day from the catalog of planetary events.
+    start = ephem.Date(date)
+    day_events = bodies.get_catalog_events(start, start + 1)
 
-                opposition = helpers.create_event('opposition', {
-                    'body': planet.name.lower()
-                })
-
-                events.append(opposition)
-
-        if bodies.is_conjunction(planet, date):
+    for planet in planets:
 
-            conjunction = helpers.create_event('conjunction', {
-                'body': planet.name.lower(),
-                'type': bodies.get_conjunction_type(planet, date)
-            })
+        for day_event in day_events:
 
-            events.append(conjunction)
+            if day_event.body != planet.name.lower():
+                continue
 
-        if bodies.is_elongation(planet, date):
+            # Only greatest elongations have an angle.
+            angle = None
 
-            elongation = helpers.create_event('elongation', {
-                'body': planet.name.lower(),
-                'type': bodies.get_elongation_type(planet, date)
-            })
+            if day_event.angle is not None:
+                angle = round(day_event.angle, 1)
 
-            events.append(elongation)
+            events.append(records.Event(
+                day_event.type,
+                body=day_event.body,
+                angle=angle,
+                time=records.Timestamp(day_event.time),
+                subtype=day_event.subtype or None
+            ))
 
     return events
 
@@ -167,48 +893,51 @@ def get_celestial_events(date):
 
     for meteor_shower in meteor_showers:
 
-        events.append(helpers.create_event('meteor_shower', {
-            'name': meteor_shower['name'],
-            'peak': meteor_shower['peak']
-        }))
+        events.append(records.Event(
+            'meteor_shower',
+            name=meteor_shower['name'],
+            peak=meteor_shower['peak']
+        ))
 
     return events
 
 
-def get_separation_events(bodies, date):
+def get_season_events(date):
 
     events = []
 
-    # Create a new list that is essentially a copy of the `bodies` list. The
-    # purpose of this is so that one list can have items removed while the list
-    # used for the main loop remains intact.
-    comparators = list(bodies)
+    season = seasons.get_season(date)
 
-    for body1 in bodies:
+    if season:
 
-        for body2 in comparators:
+        events.append(records.Event(
+            season.type,
+            time=records.Timestamp(season.time),
+            subtype=season.name
+        ))
 
-            if (body1 != body2):
+    return events
 
-                if separations.is_min_separation(body1, body2, date):
 
-                    separation = separations.get_min_separation(body1, body2, date)
+def get_separation_events(bodies, date):
+
+    events = []
+
+    # Find every pair of bodies that reach their closest point during the day,
+    # ordered so that each pair is only included once.
+    for body1, body2 in separations.find_min_separations(bodies, date):
 
-                    # If the separation is small enough to be notable, the
-                    # separation will be a numerical value. If the separation
-                    # is too large, the value will be `None`.
-                    if separation:
+        time, separation = separations.get_closest_approach(body1, body2, date)
 
-                        events.append(helpers.create_event('separation', {
-                            'body1': body1.name.lower(),
-                            'body2': body2.name.lower(),
-                            'angle': round(separation, 2)
-                        }))
+        # Only add the separation if it is small enough to be notable.
+        if separation <= separations.MAX_SEPARATION:
 
-        # Remove the first element from the list which is used for comparisons
-        # only. This means that any duplicate checks are avoided because the
-        # same check will not be run twice, i.e. Jupiter will not check against
-        # Venus because Venus will have already checked against Jupiter.
-        comparators.pop(0)
+            events.append(records.Event(
+                'separation',
+                body1=body1.name.lower(),
+                body2=body2.name.lower(),
+                angle=round(separation, 2),
+                time=records.Timestamp(time)
+            ))
 
     return events
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Export
+###############################################################################
+
+# Methods that export the events over a range of dates as flat rows, rather
+# than the nested dictionaries returned by `get_events`. Rows are streamed one
+# at a time (so exporting decades does not hold every event in memory) and can
+# be written as CSV or newline-delimited JSON, or collected into a NumPy
+# structured array with a typed column for each value.
+
+import csv
+import ephem
+import heapq
+import json
+import numpy
+from collections import namedtuple
+from . import core, helpers, samples, transits
+
+
+# A single event, where `date` is the YYYY-MM-DD day the event belongs to and
+# `time` is a Timestamp (or None if the event has no exact time, e.g. a meteor
+# shower). Rises and sets have the type 'rise' or 'set' and the name of the
+# body in `body1`. Any other values that do not apply to the event are None.
+Row = namedtuple('Row', ['date', 'type', 'subtype', 'body1', 'body2', 'name', 'angle', 'time'])
+
+
+# The NumPy type of each row in the arrays returned by `get_array`. Missing
+# strings are empty, a missing angle is NaN and a missing time is NaT.
+DTYPE = numpy.dtype([
+    ('date', 'datetime64[D]'),
+    ('type', 'U16'),
+    ('subtype', 'U16'),
+    ('body1', 'U8'),
+    ('body2', 'U8'),
+    ('name', 'U32'),
+    ('angle', 'f8'),
+    ('time', 'datetime64[ms]')
+])
+
+# The number of days between the start of PyEphem dates (noon on 31 December
+# 1899) and the start of Unix time.
+UNIX_EPOCH = 25567.5
+
+
+def iter_rows(start, end, lat = '0', lon = '0', include = None):
+    """Yields a Row for every event between two dates (inclusive) at a given
+    location, ordered by date and then by time (with events that have no exact
+    time first).
+
+    Unlike `get_events_range`, each rise and set is only included once, on
+    the day that it occurs. Location independent events are read through the
+    result cache and store in the same way as `get_events`.
+
+    Keyword arguments:
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a collection of the SECTIONS to export. By default every
+               section is exported.
+    """
+
+    include = core.get_sections(include)
+    bodies = core._create_bodies(helpers.define_location(start, lat, lon))
+
+    streams = [_iter_event_rows(bodies, start, end, include)]
+
+    for body in core._get_transit_bodies(bodies, include):
+        streams.append(_iter_transit_rows(body, lat, lon, start, end))
+
+    # Each stream is already in order, so they only need to be merged.
+    for row in heapq.merge(*streams, key=_get_row_key):
+        yield row
+
+
+def _iter_event_rows(bodies, start, end, include):
+    """Yields a Row for every location independent event between two dates
+    (inclusive), in the order of `_get_row_key`.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    include -- a set of the sections to export.
+    """
+
+    if not include.intersection(core.EVENT_SECTIONS):
+        return
+
+    sample_cache = samples.SampleCache()
+
+    for date in helpers.iter_date_range(start, end):
+
+        with samples.use_cache(sample_cache):
+            geocentric = core._get_cached_geocentric_events(bodies, date, include)
+
+        sample_cache.discard_before(ephem.Date(date) + 1)
+
+        rows = [get_event_row(date, event) for event in geocentric['events']]
+        rows.sort(key=_get_row_key)
+
+        for row in rows:
+            yield row
+
+
+def _iter_transit_rows(body, lat, lon, start, end):
+    """Yields a Row for every rise and set of a body between two dates
+    (inclusive), in time order.
+
+    Keyword arguments:
+    body -- a PyEphem Body object.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    """
+
+    name = body.name.lower()
+
+    for transit in transits.iter_transits(body, lat, lon, start, end, compact=True):
+
+        date = '%04d-%02d-%02d' % transit.time.to_date().tuple()[:3]
+
+        yield Row(date, transit.type, None, name, None, None, None, transit.time)
+
+
+def _get_row_key(row):
+    """Returns the key that rows are ordered by.
+
+    Keyword arguments:
+    row -- a Row.
+    """
+
+    return (row.date, -1.0 if row.time is None else row.time)
+
+
+def get_event_row(date, event):
+    """Returns a Row for an event.
+
+    Keyword arguments:
+    date -- the YYYY-MM-DD string of the day the event belongs to.
+    event -- an Event record.
+    """
+
+    return Row(
+        date,
+        event.type,
+        event.subtype,
+        event.body if event.body is not None else event.body1,
+        event.body2,
+        event.name,
+        event.angle,
+        event.time
+    )
+
+
+def get_array(start, end, lat = '0', lon = '0', include = None):
+    """Returns a NumPy structured array (of DTYPE) containing every event
+    between two dates (inclusive) at a given location, in the same order as
+    `iter_rows`.
+
+    Keyword arguments:
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a collection of the SECTIONS to export. By default every
+               section is exported.
+    """
+
+    return to_array(iter_rows(start, end, lat, lon, include))
+
+
+def to_array(rows):
+    """Returns a NumPy structured array (of DTYPE) containing a sequence of
+    rows.
+
+    Keyword arguments:
+    rows -- an iterable of Row objects.
+    """
+
+    # Each value is collected into its own column so that the conversion of
+    # each column (e.g. of every time) is done by NumPy at once.
+    columns = dict((field, []) for field in Row._fields)
+
+    for row in rows:
+        for field, value in zip(Row._fields, row):
+            columns[field].append(value)
+
+    array = numpy.empty(len(columns['date']), dtype=DTYPE)
+
+    array['date'] = numpy.array(columns['date'], dtype='datetime64[D]')
+
+    for field in ['type', 'subtype', 'body1', 'body2', 'name']:
+        array[field] = [value or '' for value in columns[field]]
+
+    array['angle'] = numpy.array(columns['angle'], dtype=float)
+    array['time'] = to_datetime64(numpy.array(columns['time'], dtype=float))
+
+    return array
+
+
+def to_datetime64(times):
+    """Returns a NumPy datetime64 array (to the millisecond) of PyEphem dates,
+    where any NaN dates are NaT.
+
+    Keyword arguments:
+    times -- a NumPy array of floating-point PyEphem dates.
+    """
+
+    missing = numpy.isnan(times)
+
+    milliseconds = numpy.round((numpy.where(missing, 0, times) - UNIX_EPOCH) * 86400000)
+    milliseconds = milliseconds.astype('int64').astype('datetime64[ms]')
+    milliseconds[missing] = numpy.datetime64('NaT')
+
+    return milliseconds
+
+
+def format_time(time):
+    """Returns a time as an ISO 8601 string (to the second, which is
+    truncated in the same way as `split_date`), or an empty string if there
+    is no time.
+
+    Keyword arguments:
+    time -- a Timestamp, or None.
+    """
+
+    if time is None:
+        return ''
+
+    values = ephem.Date(time).tuple()
+
+    return '%04d-%02d-%02dT%02d:%02d:%02dZ' % (values[:5] + (int(values[5]),))
+
+
+def write_csv(file, rows):
+    """Writes rows as CSV (with a header row), one at a time. Missing values
+    are left empty and times are written by `format_time`. Returns the number
+    of rows written.
+
+    Keyword arguments:
+    file -- a file object opened for writing text (with newline='').
+    rows -- an iterable of Row objects.
+    """
+
+    writer = csv.writer(file)
+    writer.writerow(Row._fields)
+
+    count = 0
+
+    for row in rows:
+
+        writer.writerow(row[:-1] + (format_time(row.time),))
+        count += 1
+
+    return count
+
+
+def write_ndjson(file, rows):
+    """Writes rows as newline-delimited JSON, with one object per line
+    containing only the values that apply to the event. Times are written by
+    `format_time`. Returns the number of rows written.
+
+    Keyword arguments:
+    file -- a file object opened for writing text.
+    rows -- an iterable of Row objects.
+    """
+
+    count = 0
+
+    for row in rows:
+
+        data = dict(
+            (field, value) for field, value in zip(Row._fields[:-1], row)
+            if value is not None
+        )
+
+        if row.time is not None:
+            data['time'] = format_time(row.time)
+
+        file.write(json.dumps(data) + '\n')
+        count += 1
+
+    return count
@@ -8,7 +8,8 @@
 
 import ephem
 import math
-from datetime import datetime
+from datetime import datetime, timedelta
+from . import instrumentation
 
 
 def get_degrees(angle):
@@ -40,6 +41,35 @@ def define_location(date, lat, lon):
     return location
 
 
+def check_location(date, lat, lon):
+    """Returns a PyEphem Observer object, as created by `define_location`,
+    after checking the arguments strictly. A ValueError is raised if the date
+    is not a valid YYYY-MM-DD date or if the latitude or longitude is out of
+    range, which PyEphem would otherwise accept (e.g. rolling '2017-13-01' over
+    into the next year).
+
+    Keyword arguments:
+    date -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    """
+
+    try:
+        datetime.strptime(date, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError('Invalid date: %s' % date)
+
+    location = define_location(date, lat, lon)
+
+    if abs(location.lat) > math.pi / 2:
+        raise ValueError('Latitude out of range: %s' % lat)
+
+    if abs(location.lon) > math.pi:
+        raise ValueError('Longitude out of range: %s' % lon)
+
+    return location
+
+
 def is_date(value):
     """ Return a Boolean indicating if the value is a PyEphem Date object.
 
@@ -76,6 +106,35 @@ def split_date(date):
     return set_date_to_midnight(next_equinox) == ephem.Date(date)
 
 
+def get_date_range(start, end):
+    """Return a list of YYYY-MM-DD strings for every day between two dates
+    (inclusive).
+
+    Keyword arguments:
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    """
+
+    return list(iter_date_range(start, end))
+
+
+def iter_date_range(start, end):
+    """Yield a YYYY-MM-DD string for every day between two dates (inclusive),
+    without creating a list of every date.
+
+    Keyword arguments:
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    """
+
+    day = datetime.strptime(start, '%Y-%m-%d')
+    end = datetime.strptime(end, '%Y-%m-%d')
+
+    while day <= end:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
+
+
 def get_distance_from_earth(body, date):
     """Return the distance of a body from the Earth (in AU) at a given date.
 
@@ -84,6 +143,8 @@ def get_distance_from_earth(body, date):
     date -- a PyEphem Date object.
     """
 
+    instrumentation.count('computes', 'helpers')
+
     body.compute(date)
     return body.earth_distance
 
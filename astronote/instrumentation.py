@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Instrumentation
+###############################################################################
+
+# Opt-in measurements of where the time of a request goes. While a recorder is
+# active (see `record`), the time spent in each section of `get_events` is
+# recorded, along with the number of times bodies are computed, the number of
+# rise and set searches and the number of bodies that are always up or never
+# up. When no recorder is active, each measurement returns immediately.
+#
+# Computes are counted where this package computes a body, against the module
+# that needed it (samples are counted against the module that requested them).
+# The computes made within PyEphem's own rise and set searches are not
+# visible, so those searches are counted as solver calls instead. The sampled
+# transit engine makes no solver calls, and counts each crossing it refines as
+# a refinement.
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+# The counters kept by a recorder, each keyed by the module that made the call.
+COUNTERS = ['computes', 'solver_calls', 'refinements', 'always_up', 'never_up']
+
+
+# The active recorder is stored per thread, in the same way as sample caches,
+# so that only the requests made by the recording thread are measured.
+_local = threading.local()
+
+
+class Recorder(object):
+    """A record of the time spent in each section and the number of calls
+    counted by each module. Calls are also counted against the section that
+    was active when they were made.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self.counts = dict((counter, {}) for counter in COUNTERS)
+        self.stack = []
+
+
+    def get_section(self, name):
+        """Returns the dictionary of measurements for a section, creating it
+        if the section has not been recorded before.
+
+        Keyword arguments:
+        name -- the name of the section.
+        """
+
+        section = self.sections.get(name)
+
+        if section is None:
+            section = dict((counter, 0) for counter in COUNTERS)
+            section['time'] = 0.0
+            section['calls'] = 0
+            self.sections[name] = section
+
+        return section
+
+
+    def count(self, counter, module, number = 1):
+        """Adds to a counter for a module (and for the active section, if
+        there is one).
+
+        Keyword arguments:
+        counter -- one of the COUNTERS.
+        module -- the name of the module making the call.
+        number -- the number to add.
+        """
+
+        counts = self.counts[counter]
+        counts[module] = counts.get(module, 0) + number
+
+        if self.stack:
+            self.get_section(self.stack[-1])[counter] += number
+
+
+    def to_dict(self):
+        """Returns every measurement as a dictionary, containing a `sections`
+        dictionary (keyed by section name, each with the number of seconds
+        spent in the section, the number of times it was entered and its
+        counts) along with a dictionary for each of the COUNTERS (keyed by
+        module).
+        """
+
+        data = {
+            'sections': dict((name, dict(section)) for name, section in self.sections.items())
+        }
+
+        for counter in COUNTERS:
+            data[counter] = dict(self.counts[counter])
+
+        return data
+
+
+class Section(object):
+    """Times a section of a request for a recorder, when used as a context
+    manager.
+
+    Keyword arguments:
+    recorder -- a Recorder object.
+    name -- the name of the section.
+    """
+
+    __slots__ = ('recorder', 'name', 'start')
+
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+
+    def __enter__(self):
+        self.recorder.stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *args):
+        section = self.recorder.get_section(self.name)
+        section['time'] += time.perf_counter() - self.start
+        section['calls'] += 1
+        self.recorder.stack.pop()
+        return False
+
+
+class NullSection(object):
+    """A context manager that does nothing, used for sections when no recorder
+    is active.
+    """
+
+    __slots__ = ()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_section = NullSection()
+
+
+@contextmanager
+def record(callback = None):
+    """Activates a new recorder for the current thread, so that every request
+    made within the `with` block is measured. Yields the Recorder.
+
+    Keyword arguments:
+    callback -- a function that is called with the measurements (as returned
+                by `Recorder.to_dict`) at the end of the block, e.g. to send
+                them to a metrics system.
+    """
+
+    recorder = Recorder()
+
+    previous = getattr(_local, 'recorder', None)
+    _local.recorder = recorder
+
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
+
+        if callback is not None:
+            callback(recorder.to_dict())
+
+
+def get_recorder():
+    """Returns the active recorder for the current thread, or None."""
+
+    return getattr(_local, 'recorder', None)
+
+
+def section(name):
+    """Returns a context manager that times a section of a request, which
+    does nothing if no recorder is active.
+
+    Keyword arguments:
+    name -- the name of the section.
+    """
+
+    recorder = getattr(_local, 'recorder', None)
+
+    if recorder is None:
+        return _null_section
+
+    return Section(recorder, name)
+
+
+def count(counter, module, number = 1):
+    """Adds to a counter of the active recorder, if there is one.
+
+    Keyword arguments:
+    counter -- one of the COUNTERS.
+    module -- the name of the module making the call.
+    number -- the number to add.
+    """
+
+    recorder = getattr(_local, 'recorder', None)
+
+    if recorder is not None:
+        recorder.count(counter, module, number)
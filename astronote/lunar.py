@@ -4,10 +4,67 @@
 # Lunar
 ###############################################################################
 
+import bisect
 import ephem
+import numpy
+import threading
+from collections import namedtuple
 from datetime import datetime
-from . import transits
-from . import helpers
+from . import instrumentation
+from . import solvers
+
+
+# The code of each major Moon phase and the PyEphem method used to find it.
+PHASES = [
+    ('new_moon', ephem.next_new_moon),
+    ('first_quarter', ephem.next_first_quarter_moon),
+    ('full_moon', ephem.next_full_moon),
+    ('last_quarter', ephem.next_last_quarter_moon)
+]
+
+
+# The mean time (in days) between one perigee of the Moon and the next.
+ANOMALISTIC_MONTH = 27.554550
+
+# The number of days either side of the predicted time of a perigee (or
+# apogee) that it is searched for. Perigees can arrive up to three days before
+# or after one anomalistic month has passed.
+APSIS_WINDOW = 4
+
+# The number of kilometres in an astronomical unit.
+KM_PER_AU = ephem.meters_per_au / 1000
+
+# PyEphem only stores distances to single precision (roughly 0.04 km for the
+# Moon), so the distance is flat to within a few minutes of an apogee. Each
+# perigee and apogee is found to FIT_PRECISION days with Brent's method, and
+# then from a parabola fitted to FIT_SAMPLES distances either side of it,
+# spread over FIT_DAYS days.
+FIT_PRECISION = 10 * ephem.minute
+FIT_SAMPLES = 6
+FIT_DAYS = 0.25
+
+# A full Moon is a supermoon if its distance is within this proportion of the
+# range between the nearest apogee and perigee (measured from the perigee).
+SUPERMOON_PROPORTION = 0.1
+
+
+# A major Moon phase, where `name` is the code of the phase.
+MoonPhase = namedtuple('MoonPhase', ['time', 'name'])
+
+# A perigee or apogee of the Moon, where `type` is 'perigee' or 'apogee' and
+# `distance` is the distance between the centres of the Earth and the Moon in
+# kilometres.
+Apsis = namedtuple('Apsis', ['time', 'type', 'distance'])
+
+
+# Tables of Moon phases that have already been calculated, keyed by year.
+_phase_tables = {}
+_phase_tables_lock = threading.Lock()
+
+# Tables of perigees and apogees that have already been calculated, keyed by
+# year.
+_apsis_tables = {}
+_apsis_tables_lock = threading.Lock()
 
 
 def is_major_phase(date):
@@ -18,36 +75,122 @@ def is_major_phase(date):
     date -- a PyEphem Date object.
     """
 
-    # Calculate the exact date and time of each upcoming major Moon phase.
-    next_new_moon = ephem.next_new_moon(date)
-    next_first_quarter_moon = ephem.next_first_quarter_moon(date)
-    next_full_moon = ephem.next_full_moon(date)
-    next_last_quarter_moon = ephem.next_last_quarter_moon(date)
-
-    # Format the major Moon phase dates by resetting their hour, minute and
-    # second values to zero, positioning each day at midnight so that they can
-    # be directly compared against the date argument.
-    next_new_moon_date = helpers.set_date_to_midnight(next_new_moon)
-    next_first_quarter_moon_date = helpers.set_date_to_midnight(next_first_quarter_moon)
-    next_full_moon_date = helpers.set_date_to_midnight(next_full_moon)
-    next_last_quarter_moon_date = helpers.set_date_to_midnight(next_last_quarter_moon)
-
     # Convert the `date` arugment to an Ephem Date for comparison.
     date = ephem.Date(date)
 
-    # Return the appropriate code based on if there is a match. No matches will
+    # Return the code of the phase that occurs during the day. No matches will
     # return `None`.
-    if (next_new_moon_date == date):
-        return 'new_moon'
+    phases = get_phases(date, date + 1)
+
+    if phases:
+        return phases[0].name
+
+    return None
 
-    if (next_first_quarter_moon_date == date):
-        return 'first_quarter'
 
-    if (next_full_moon_date == date):
-        return 'full_moon'
+def get_phase_table(year):
+    """Returns a tuple containing a sorted list of phase times and a matching
+    list of MoonPhase objects for every major Moon phase during a year. Each
+    year is only calculated once.
+
+    Keyword arguments:
+    year -- the year as an integer.
+    """
+
+    if year not in _phase_tables:
+
+        # Other threads wait for the table to be built rather than building
+        # it again.
+        with _phase_tables_lock:
+
+            if year not in _phase_tables:
+
+                start = ephem.Date(datetime(year, 1, 1))
+                end = ephem.Date(datetime(year + 1, 1, 1))
+
+                phases = []
+
+                # Step through each phase in turn, starting each search from
+                # the time of the previous phase.
+                for name, find_next_phase in PHASES:
+
+                    time = find_next_phase(start)
+
+                    while time < end:
+                        phases.append(MoonPhase(float(time), name))
+                        time = find_next_phase(time)
+
+                phases.sort()
+
+                _phase_tables[year] = ([phase.time for phase in phases], phases)
+
+    return _phase_tables[year]
+
+
+def get_phases(start, end):
+    """Returns a list of all MoonPhase objects that occur between two times,
+    sorted by time.
+
+    Keyword arguments:
+    start -- a PyEphem Date object.
+    end -- a PyEphem Date object.
+    """
 
-    if (next_last_quarter_moon_date == date):
-        return 'last_quarter'
+    start = ephem.Date(start)
+    end = ephem.Date(end)
+
+    phases = []
+
+    for year in range(start.tuple()[0], end.tuple()[0] + 1):
+
+        times, year_phases = get_phase_table(year)
+        index1 = bisect.bisect_left(times, start)
+        index2 = bisect.bisect_left(times, end)
+        phases += year_phases[index1:index2]
+
+    return phases
+
+
+def get_month_phases(year, month):
+    """Returns a list of all MoonPhase objects that occur during a month,
+    sorted by time.
+
+    Keyword arguments:
+    year -- the year as an integer.
+    month -- the month as an integer.
+    """
+
+    start = ephem.Date(datetime(year, month, 1))
+
+    if month == 12:
+        end = ephem.Date(datetime(year + 1, 1, 1))
+    else:
+        end = ephem.Date(datetime(year, month + 1, 1))
+
+    return get_phases(start, end)
+
+
+def get_next_phase(date, name = None):
+    """Returns the first MoonPhase after a given time, optionally limited to a
+    single phase, e.g. the next full Moon.
+
+    Keyword arguments:
+    date -- a PyEphem Date object.
+    name -- a phase code, e.g. 'full_moon'.
+    """
+
+    date = ephem.Date(date)
+    year = date.tuple()[0]
+
+    # A month always contains every phase, so the search never needs to go
+    # further than the following year.
+    for year in (year, year + 1):
+
+        times, phases = get_phase_table(year)
+
+        for phase in phases[bisect.bisect_right(times, date):]:
+            if name is None or phase.name == name:
+                return phase
 
     return None
 
@@ -57,20 +200,13 @@ def is_at_apogee(moon, date):
     a cycle) on the specified day.
 
     Keyword arguments:
-    moon -- a PyEphem Moon object.
+    moon -- a PyEphem Moon object. This is kept for compatibility with
+            earlier versions and is not used, as apogees are looked up from
+            the apsis table (see `get_apsis`).
     date -- a YYYY-MM-DD string.
     """
 
-    moon.compute(date)
-    time1 = ephem.Date(date)
-    time2 = ephem.Date(time1 + 1)
-
-    dist1a = helpers.get_distance_from_earth(moon, time1)
-    dist1b = helpers.get_distance_from_earth(moon, time1 + ephem.minute)
-    dist2a = helpers.get_distance_from_earth(moon, time2 - ephem.minute)
-    dist2b = helpers.get_distance_from_earth(moon, time2)
-
-    return (dist1a <= dist1b) and (dist2a >= dist2b)
+    return get_apsis(date, 'apogee') is not None
 
 
 def is_at_perigee(moon, date):
@@ -78,17 +214,215 @@ def is_at_perigee(moon, date):
     a cycle) on the specified day.
 
     Keyword arguments:
-    body -- a PyEphem Body object (typically a planet).
+    moon -- a PyEphem Moon object. This is kept for compatibility with
+            earlier versions and is not used, as perigees are looked up from
+            the apsis table (see `get_apsis`).
     date -- a YYYY-MM-DD string.
     """
 
-    moon.compute(date)
-    time1 = ephem.Date(date)
-    time2 = ephem.Date(time1 + 1)
+    return get_apsis(date, 'perigee') is not None
+
+
+def get_apsis(date, name = None):
+    """Returns the Apsis (perigee or apogee) that occurs on a given day, or
+    None if there is none. The Moon never reaches both on the same day.
+
+    Keyword arguments:
+    date -- a YYYY-MM-DD string or PyEphem Date object.
+    name -- 'perigee' or 'apogee' to only return that type of apsis.
+    """
+
+    date = ephem.Date(date)
+
+    for apsis in get_apsides(date, date + 1):
+        if name is None or apsis.type == name:
+            return apsis
+
+    return None
+
+
+def get_apsis_table(year):
+    """Returns a tuple containing a sorted list of times and a matching list of
+    Apsis objects for every perigee and apogee of the Moon during a year. Each
+    year is only calculated once.
+
+    Keyword arguments:
+    year -- the year as an integer.
+    """
+
+    if year not in _apsis_tables:
+
+        with _apsis_tables_lock:
+
+            if year not in _apsis_tables:
+
+                start = ephem.Date(datetime(year, 1, 1))
+                end = ephem.Date(datetime(year + 1, 1, 1))
+                moon = ephem.Moon()
+
+                apsides = find_apsides(moon, 'perigee', start, end) + find_apsides(moon, 'apogee', start, end)
+                apsides.sort()
+
+                _apsis_tables[year] = ([apsis.time for apsis in apsides], apsides)
+
+    return _apsis_tables[year]
+
+
+def get_apsides(start, end):
+    """Returns a list of all Apsis objects that occur between two times, sorted
+    by time.
+
+    Keyword arguments:
+    start -- a PyEphem Date object.
+    end -- a PyEphem Date object.
+    """
+
+    start = ephem.Date(start)
+    end = ephem.Date(end)
+
+    apsides = []
+
+    for year in range(start.tuple()[0], end.tuple()[0] + 1):
+
+        times, year_apsides = get_apsis_table(year)
+        index1 = bisect.bisect_left(times, start)
+        index2 = bisect.bisect_left(times, end)
+        apsides += year_apsides[index1:index2]
+
+    return apsides
+
+
+def find_apsides(moon, name, start, end):
+    """Returns a list of Apsis objects for every perigee (or apogee) of the
+    Moon between two times, sorted by time.
+
+    The Moon's distance is sampled once a day over the anomalistic month
+    before the start to find the first perigee (or apogee), which is refined
+    with Brent's method. Each one after it is then found by searching within
+    APSIS_WINDOW days of one anomalistic month later.
+
+    Keyword arguments:
+    moon -- a PyEphem Moon object.
+    name -- 'perigee' or 'apogee'.
+    start -- a PyEphem Date object.
+    end -- a PyEphem Date object.
+    """
+
+    # Perigees are found as minimums of the distance and apogees as minimums
+    # of the negative distance.
+    sign = 1 if name == 'perigee' else -1
+    func = lambda time: sign * get_distance(moon, time)
+
+    times = numpy.arange(float(start) - ANOMALISTIC_MONTH - 1, float(start) + 1)
+    values = [func(time) for time in times]
+
+    time = find_nearest_minimum(func, times[int(numpy.argmin(values))], 1)
+
+    apsides = []
+
+    # The fitted time can move slightly either side of the time that was
+    # found, so it (rather than the time found) decides whether an apsis close
+    # to the start or end is included. Otherwise an apsis on the boundary of
+    # two years could be included in both years or in neither.
+    while time < end + FIT_DAYS:
+
+        fitted, value = fit_minimum(func, time)
+
+        if start <= fitted < end:
+            apsides.append(Apsis(fitted, name, sign * value))
+
+        time = find_nearest_minimum(func, time + ANOMALISTIC_MONTH, APSIS_WINDOW)
+
+    return apsides
+
+
+def find_nearest_minimum(func, time, window):
+    """Returns the time (to FIT_PRECISION) of the minimum of a function near a
+    given time. If the minimum is found at the edge of the search, the search
+    is moved so that the minimum can be found beyond it.
+
+    Keyword arguments:
+    func -- a function that accepts a time and returns a number.
+    time -- a floating-point time (as a PyEphem Date) to search around.
+    window -- the number of days either side of the time that are searched.
+    """
+
+    for attempt in range(3):
+
+        start = time - window
+        end = time + window
+
+        time = solvers.find_minimum(func, start, end, FIT_PRECISION)[0]
+
+        if time - start > ephem.hour and end - time > ephem.hour:
+            break
+
+    return time
+
+
+def fit_minimum(func, time):
+    """Returns a (time, value) tuple for the minimum of a parabola fitted to
+    the values of a function around a time close to its minimum.
+
+    Keyword arguments:
+    func -- a function that accepts a time and returns a number.
+    time -- a floating-point time (as a PyEphem Date) near the minimum.
+    """
+
+    offsets = numpy.linspace(-FIT_DAYS, FIT_DAYS, 2 * FIT_SAMPLES + 1)
+    values = [func(time + offset) for offset in offsets]
+
+    a, b, c = numpy.polyfit(offsets, values, 2)
+    offset = -b / (2 * a)
+
+    return float(time + offset), float(a * offset * offset + b * offset + c)
+
+
+def get_distance(moon, time):
+    """Returns the distance between the centres of the Earth and the Moon (in
+    kilometres) at a given time.
+
+    Keyword arguments:
+    moon -- a PyEphem Moon object.
+    time -- a floating-point time (as a PyEphem Date).
+    """
+
+    instrumentation.count('computes', 'lunar')
+
+    moon.compute(ephem.Date(time))
+    return moon.earth_distance * KM_PER_AU
+
+
+def is_supermoon(date):
+    """Returns True if a full Moon on the given day is a supermoon, i.e. its
+    distance is within SUPERMOON_PROPORTION of the range between the nearest
+    perigee and apogee (measured from the perigee).
+
+    Keyword arguments:
+    date -- a YYYY-MM-DD string or PyEphem Date object.
+    """
+
+    date = ephem.Date(date)
+
+    for phase in get_phases(date, date + 1):
+
+        if phase.name != 'full_moon':
+            continue
+
+        apsides = get_apsides(phase.time - ANOMALISTIC_MONTH, phase.time + ANOMALISTIC_MONTH)
+
+        perigee = min(
+            (apsis for apsis in apsides if apsis.type == 'perigee'),
+            key=lambda apsis: abs(apsis.time - phase.time)
+        )
+        apogee = min(
+            (apsis for apsis in apsides if apsis.type == 'apogee'),
+            key=lambda apsis: abs(apsis.time - phase.time)
+        )
+
+        distance = get_distance(ephem.Moon(), phase.time)
+        limit = perigee.distance + SUPERMOON_PROPORTION * (apogee.distance - perigee.distance)
 
-    dist1a = helpers.get_distance_from_earth(moon, time1)
-    dist1b = helpers.get_distance_from_earth(moon, time1 + ephem.minute)
-    dist2a = helpers.get_distance_from_earth(moon, time2 - ephem.minute)
-    dist2b = helpers.get_distance_from_earth(moon, time2)
+        return bool(distance <= limit)
 
-    return (dist1a >= dist1b) and (dist2a <= dist2b)
+    return False
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Parallel
+###############################################################################
+
+# Methods that spread the calculation of events over a pool of processes. The
+# pool is kept running between calls so that each worker process only has to
+# create its bodies (and build any catalogs) once.
+#
+# Each worker process copies the settings of the `transits`, `cache` and
+# `store` modules when it starts, so each of their `configure` methods shuts
+# down the pool, and the next call starts new workers with the new settings.
+
+import itertools
+import math
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+# The smallest number of items sent to a worker at once. Small chunks spend a
+# larger share of their time sending arguments and results between processes.
+MIN_CHUNK_SIZE = 8
+
+# The number of chunks created for each worker, so that workers that finish
+# early can pick up more work.
+CHUNKS_PER_WORKER = 4
+
+# The number of items in each chunk created by streaming methods (which cannot
+# size their chunks from the total number of items).
+STREAM_CHUNK_SIZE = 32
+
+# The number of chunks that `iter_chunks` sends to each worker ahead of the
+# results being consumed.
+PENDING_PER_WORKER = 2
+
+
+# The shared pool, the (workers, initializer) key it was created with and the
+# lock held while the pool is created or shut down.
+_executor = None
+_executor_key = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(workers, initializer = None):
+    """Returns a ProcessPoolExecutor with the given number of workers. The
+    executor is reused between calls, unless a different number of workers or
+    a different initializer is requested.
+
+    Keyword arguments:
+    workers -- the number of worker processes.
+    initializer -- a function called once when each worker process starts.
+    """
+
+    global _executor, _executor_key
+
+    key = (workers, initializer)
+
+    with _executor_lock:
+
+        if _executor is None or _executor_key != key:
+
+            _shutdown()
+
+            _executor = ProcessPoolExecutor(max_workers=workers, initializer=initializer)
+            _executor_key = key
+
+        return _executor
+
+
+def shutdown():
+    """Shuts down the process pool (if there is one), waiting for any running
+    work to finish.
+    """
+
+    with _executor_lock:
+        _shutdown()
+
+
+def _shutdown():
+    """Shuts down the process pool while the lock is held."""
+
+    global _executor, _executor_key
+
+    if _executor is not None:
+        _executor.shutdown()
+
+    _executor = None
+    _executor_key = None
+
+
+def get_chunks(items, workers):
+    """Returns a list of lists that splits a list of items into consecutive
+    chunks to be shared between workers.
+
+    Keyword arguments:
+    items -- a list of items.
+    workers -- the number of worker processes.
+    """
+
+    size = max(MIN_CHUNK_SIZE, int(math.ceil(len(items) / float(workers * CHUNKS_PER_WORKER))))
+    return [items[index:index + size] for index in range(0, len(items), size)]
+
+
+def map_chunks(func, items, workers, initializer = None, *args):
+    """Calls a function for each chunk of a list of items using a pool of
+    worker processes, and returns a single list of results in the same order
+    as the items.
+
+    Keyword arguments:
+    func -- a module level function that accepts a list of items (followed by
+            `args`) and returns a list of results.
+    items -- a list of items.
+    workers -- the number of worker processes.
+    initializer -- a function called once when each worker process starts.
+    *args -- additional arguments to pass to `func` for every chunk.
+    """
+
+    chunks = get_chunks(items, workers)
+    executor = get_executor(workers, initializer)
+
+    results = []
+
+    for chunk_results in executor.map(func, chunks, *[[arg] * len(chunks) for arg in args]):
+        results += chunk_results
+
+    return results
+
+
+def split_chunks(items, size):
+    """Yields lists of at most `size` consecutive items from an iterable,
+    without creating a list of every item.
+
+    Keyword arguments:
+    items -- an iterable of items.
+    size -- the number of items in each chunk.
+    """
+
+    items = iter(items)
+
+    while True:
+
+        chunk = list(itertools.islice(items, size))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def iter_chunks(func, chunks, workers, initializer = None, *args):
+    """Calls a function for each chunk of an iterable of chunks using a pool
+    of worker processes, and yields each result in the same order as the
+    items. Only `PENDING_PER_WORKER` chunks per worker are sent ahead of the
+    results being consumed, so the caller controls the pace and the number
+    of results held at once does not depend on the number of chunks.
+
+    Keyword arguments:
+    func -- a module level function that accepts a list of items (followed by
+            `args`) and returns a list of results.
+    chunks -- an iterable of lists of items.
+    workers -- the number of worker processes.
+    initializer -- a function called once when each worker process starts.
+    *args -- additional arguments to pass to `func` for every chunk.
+    """
+
+    chunks = iter(chunks)
+    executor = get_executor(workers, initializer)
+
+    pending = deque()
+
+    for chunk in itertools.islice(chunks, workers * PENDING_PER_WORKER):
+        pending.append(executor.submit(func, chunk, *args))
+
+    try:
+
+        while pending:
+
+            chunk_results = pending.popleft().result()
+
+            # A new chunk is only sent once a result is taken, which keeps the
+            # same number of chunks in progress.
+            for chunk in itertools.islice(chunks, 1):
+                pending.append(executor.submit(func, chunk, *args))
+
+            for result in chunk_results:
+                yield result
+
+    finally:
+
+        # Any chunks that have not started are cancelled if the caller stops
+        # early.
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Records
+###############################################################################
+
+# Compact types used to hold events and rise and set times. Each type stores
+# its values in slots rather than nested dictionaries, with each time stored as
+# a single float, and can be converted into the dictionaries returned by
+# `get_events` with `to_dict`.
+
+import ephem
+from collections import namedtuple
+from . import helpers
+
+
+class Timestamp(float):
+    """A time stored as a single float, counting the days since noon on 31
+    December 1899 (the same as a PyEphem Date, also known as the Dublin Julian
+    Date).
+    """
+
+    __slots__ = ()
+
+
+    def __repr__(self):
+        return 'Timestamp(%s)' % float.__repr__(self)
+
+
+    def to_date(self):
+        """Returns the time as a PyEphem Date object."""
+
+        return ephem.Date(self)
+
+
+    def to_dict(self):
+        """Returns the time as a dictionary, as created by `split_date`."""
+
+        return helpers.split_date(ephem.Date(self))
+
+
+class Transit(namedtuple('Transit', ['type', 'time'])):
+    """A rise or set of a body, where the time is a Timestamp (or the string
+    'AlwaysUp' or 'NeverUp' if the body does not rise or set).
+    """
+
+    __slots__ = ()
+
+
+    def to_dict(self):
+        """Returns the transit as a dictionary, as created by
+        `format_transit_time`.
+        """
+
+        time = self.time
+
+        if isinstance(time, Timestamp):
+            time = time.to_dict()
+
+        return {
+            'type': self.type,
+            'time': time
+        }
+
+
+# The optional values of an event, in the order they appear in its data. The
+# subtype of an event (e.g. 'superior' for a conjunction) is stored under the
+# 'type' key of its data.
+EVENT_FIELDS = ['body', 'body1', 'body2', 'name', 'peak', 'angle', 'time', 'subtype']
+
+
+class Event(namedtuple('Event', ['type'] + EVENT_FIELDS, defaults=[None] * len(EVENT_FIELDS))):
+    """An event, e.g. an opposition, separation or meteor shower. Any optional
+    values that do not apply to the event are None.
+    """
+
+    __slots__ = ()
+
+
+    def to_dict(self):
+        """Returns the event as a dictionary, as created by `create_event`,
+        containing only the values that apply to the event.
+        """
+
+        data = {}
+
+        for field, value in zip(EVENT_FIELDS, self[1:]):
+
+            if value is None:
+                continue
+
+            if isinstance(value, Timestamp):
+                value = value.to_dict()
+
+            data['type' if field == 'subtype' else field] = value
+
+        return helpers.create_event(self.type, data)
+
+
+def load_event(values):
+    """Returns an Event from a list of its values, e.g. an Event that has been
+    stored as a JSON array.
+
+    Keyword arguments:
+    values -- a list of values in the same order as the fields of an Event.
+    """
+
+    event = Event(*values)
+
+    if event.time is not None:
+        event = event._replace(time=Timestamp(event.time))
+
+    return event
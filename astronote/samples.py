@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Samples
+###############################################################################
+
+# Methods that compute the geocentric position of a body at a given time. When
+# a cache is active, each body is only computed once for any given instant and
+# the result is shared by every method that asks for it. `get_events` activates
+# a cache for the lifetime of each request.
+
+import ephem
+import numpy
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from . import instrumentation
+
+
+# The values recorded each time a body is computed.
+Sample = namedtuple('Sample', ['elong', 'earth_distance', 'ra', 'dec', 'phase'])
+
+# The values recorded for many bodies over many times, where each value is a
+# NumPy array with a row for each body and a column for each time.
+Positions = namedtuple('Positions', Sample._fields)
+
+
+# The active cache is stored per thread so that separate threads can calculate
+# events without sharing (or corrupting) each other's samples.
+_local = threading.local()
+
+
+class SampleCache(object):
+    """A store of samples keyed by the name of a body and the time it was
+    computed at.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, body, time, module = 'samples'):
+        """Returns the sample for a body at a given time, computing it only if
+        it has not been requested before.
+
+        Keyword arguments:
+        body -- a PyEphem Body object.
+        time -- a PyEphem Date object.
+        module -- the name of the module requesting the sample, which any
+                  compute is counted against.
+        """
+
+        key = (body.name, time)
+        sample = self.samples.get(key)
+
+        if sample is None:
+            sample = compute_sample(body, time, module)
+            self.samples[key] = sample
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return sample
+
+
+    def get_stats(self):
+        """Returns a dictionary containing the number of samples that were
+        reused (hits), the number that had to be computed (misses) and the
+        number currently stored.
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.samples)
+        }
+
+
+    def discard_before(self, time):
+        """Removes all samples computed before a given time.
+
+        Keyword arguments:
+        time -- a PyEphem Date object.
+        """
+
+        self.samples = dict(
+            (key, sample) for key, sample in self.samples.items()
+            if key[1] >= time
+        )
+
+
+@contextmanager
+def use_cache(cache):
+    """Activates a cache for the current thread, so that all samples requested
+    within the `with` block are shared.
+
+    Keyword arguments:
+    cache -- a SampleCache object.
+    """
+
+    previous = getattr(_local, 'cache', None)
+    _local.cache = cache
+
+    try:
+        yield cache
+    finally:
+        _local.cache = previous
+
+
+@contextmanager
+def request_cache():
+    """Activates a new cache for the current thread for the duration of a
+    request. If a cache is already active (e.g. one set by the caller with
+    `use_cache`), that cache is used instead so that its samples and counts are
+    shared with the request.
+    """
+
+    cache = getattr(_local, 'cache', None)
+
+    if cache is not None:
+        yield cache
+
+    else:
+        with use_cache(SampleCache()) as cache:
+            yield cache
+
+
+def compute_sample(body, time, module = 'samples'):
+    """Computes a body at a given time and returns a Sample.
+
+    Keyword arguments:
+    body -- a PyEphem Body object.
+    time -- a PyEphem Date object.
+    module -- the name of the module requesting the sample, which the compute
+              is counted against.
+    """
+
+    instrumentation.count('computes', module)
+
+    body.compute(time)
+    return Sample(body.elong, body.earth_distance, body.ra, body.dec, body.phase)
+
+
+def get_sample(body, time, module = 'samples'):
+    """Returns a Sample for a body at a given time, using the active cache (if
+    there is one).
+
+    Keyword arguments:
+    body -- a PyEphem Body object.
+    time -- a PyEphem Date object or a YYYY-MM-DD string.
+    module -- the name of the module requesting the sample, which any compute
+              is counted against.
+    """
+
+    # Normalise the time so that strings, dates and floats representing the
+    # same instant share the same key.
+    time = float(ephem.Date(time))
+    cache = getattr(_local, 'cache', None)
+
+    if cache is None:
+        return compute_sample(body, time, module)
+
+    return cache.get(body, time, module)
+
+
+def sample_positions(bodies, times, module = 'samples'):
+    """Returns a Positions tuple containing the samples of many bodies over
+    many times, so that events can be found using array operations rather than
+    comparing samples one at a time. The active cache (if there is one) is used
+    for each sample.
+
+    Keyword arguments:
+    bodies -- a list of PyEphem Body objects.
+    times -- a list of PyEphem Date objects.
+    module -- the name of the module requesting the samples, which any
+              computes are counted against.
+    """
+
+    values = numpy.empty((len(Sample._fields), len(bodies), len(times)))
+
+    for row, body in enumerate(bodies):
+        for column, time in enumerate(times):
+            values[:, row, column] = get_sample(body, time, module)
+
+    return Positions(*values)
@@ -9,20 +9,45 @@
 
 import ephem
 import math
+import threading
+from collections import namedtuple
 from datetime import datetime
 from . import helpers
 
 
+# The type and name of each season, along with the PyEphem method used to find
+# it, in the order they occur during a year.
+SEASONS = [
+    ('equinox', 'march', ephem.next_vernal_equinox),
+    ('solstice', 'june', ephem.next_summer_solstice),
+    ('equinox', 'september', ephem.next_autumnal_equinox),
+    ('solstice', 'december', ephem.next_winter_solstice)
+]
+
+
+# A solstice or equinox, where `type` is either 'solstice' or 'equinox' and
+# `name` is the month that it occurs in.
+Season = namedtuple('Season', ['time', 'type', 'name'])
+
+
+# Every solstice and equinox that has been calculated, keyed by the (year,
+# month, day) tuple of the day it occurs on, and the years that have been
+# calculated. The lock is held while years are calculated.
+_season_days = {}
+_season_years = set()
+_season_lock = threading.Lock()
+
+
 def is_solstice(date):
-    """Returns a Boolean if the given day does not land on a solstice, or a
-    PyEphem Date if the given day does land on a solstice.
+    """Returns True if a solstice occurs on the given day, looked up from the
+    season table (which is calculated once for each year).
 
     Keyword arguments:
     date -- a YYYY-MM-DD string.
     """
 
-    next_solstice = ephem.next_solstice(date)
-    return helpers.set_date_to_midnight(next_solstice) == ephem.Date(date)
+    season = get_season(date)
+    return season is not None and season.type == 'solstice'
 
 
 def get_solstice_type(date):
@@ -45,15 +70,15 @@ def get_solstice_type(date):
 
 
 def is_equinox(date):
-    """Returns a Boolean if the given day does not land on a equinox, or a
-    PyEphem Date if the given day does land on a equinox.
+    """Returns True if an equinox occurs on the given day, looked up from the
+    season table (which is calculated once for each year).
 
     Keyword arguments:
     date -- a YYYY-MM-DD string.
     """
 
-    next_equinox = ephem.next_equinox(date)
-    return helpers.set_date_to_midnight(next_equinox) == ephem.Date(date)
+    season = get_season(date)
+    return season is not None and season.type == 'equinox'
 
 
 def get_equinox_type(date):
@@ -73,3 +98,49 @@ def get_equinox_type(date):
         return 'september'
     else:
         return None
+
+
+def build_season_table(start_year, end_year):
+    """Calculates every solstice and equinox between two years (inclusive) so
+    that they can be looked up by day. Years that have already been calculated
+    are skipped.
+
+    Keyword arguments:
+    start_year -- the first year as an integer.
+    end_year -- the last year as an integer.
+    """
+
+    with _season_lock:
+
+        for year in range(start_year, end_year + 1):
+
+            if year in _season_years:
+                continue
+
+            start = ephem.Date(datetime(year, 1, 1))
+
+            for season_type, name, find_next_season in SEASONS:
+
+                time = find_next_season(start)
+                _season_days[time.tuple()[:3]] = Season(float(time), season_type, name)
+
+            # The year is only added once all of its seasons are, so that no
+            # other thread looks up a partly calculated year.
+            _season_years.add(year)
+
+
+def get_season(date):
+    """Returns the Season that occurs on a given day, or `None` if the day is
+    not a solstice or equinox. The season table is calculated for the year of
+    the day if it has not been already.
+
+    Keyword arguments:
+    date -- a YYYY-MM-DD string.
+    """
+
+    day = ephem.Date(date).tuple()[:3]
+
+    if day[0] not in _season_years:
+        build_season_table(day[0], day[0])
+
+    return _season_days.get(day)
@@ -7,8 +7,15 @@
 # Methods that are used to calculate interesting separations between bodies.
 
 import ephem
+import numpy
 from datetime import datetime
 from . import helpers
+from . import samples
+from . import solvers
+
+
+# The largest separation (in degrees) that is considered notable.
+MAX_SEPARATION = 4
 
 
 def get_separation(body1, body2, time):
@@ -20,9 +27,13 @@ def get_separation(body1, body2, time):
     time -- a PyEphem Date object.
     """
 
-    body1.compute(time)
-    body2.compute(time)
-    return helpers.get_degrees(ephem.separation(body1, body2))
+    sample1 = samples.get_sample(body1, time, 'separations')
+    sample2 = samples.get_sample(body2, time, 'separations')
+
+    return helpers.get_degrees(ephem.separation(
+        (sample1.ra, sample1.dec),
+        (sample2.ra, sample2.dec)
+    ))
 
 
 def is_min_separation(body1, body2, date):
@@ -49,41 +60,107 @@ def is_min_separation(body1, body2, date):
         return False
 
 
-def get_min_separation(body1, body2, date):
-    """Returns a rough estimate of the minimum angular separation between two
-    bodies on a given day by comparing the separations every 15 minutes
-    throughout the day. Once the minimum has been found, the `for` loop cancels
-    to avoid any unnecessary calculations.
+def get_separation_matrix(ra, dec):
+    """Returns a NumPy array of the angular separation (in degrees) between
+    every pair of bodies at every time, where element [i, j, t] is the
+    separation between bodies `i` and `j` at time `t`.
+
+    Keyword arguments:
+    ra -- a NumPy array of right ascensions with a row per body and a column
+          per time, e.g. from `samples.sample_positions`.
+    dec -- a NumPy array of declinations in the same shape as `ra`.
+    """
+
+    ra1 = ra[:, numpy.newaxis]
+    ra2 = ra[numpy.newaxis, :]
+    dec1 = dec[:, numpy.newaxis]
+    dec2 = dec[numpy.newaxis, :]
+
+    # The Vincenty formula is used as it remains accurate for both very small
+    # and very large separations.
+    difference = ra2 - ra1
+    x = numpy.sin(dec1) * numpy.sin(dec2) + numpy.cos(dec1) * numpy.cos(dec2) * numpy.cos(difference)
+    y = numpy.hypot(
+        numpy.cos(dec2) * numpy.sin(difference),
+        numpy.cos(dec1) * numpy.sin(dec2) - numpy.sin(dec1) * numpy.cos(dec2) * numpy.cos(difference)
+    )
+
+    return numpy.degrees(numpy.arctan2(y, x))
+
+
+def find_min_separations(bodies, date):
+    """Returns a list of (body1, body2) tuples for every pair of bodies that
+    reach their closest point on the given day. This is equivalent to calling
+    `is_min_separation` for every pair, but samples each body once and checks
+    every pair at the same time.
+
+    Keyword arguments:
+    bodies -- a list of PyEphem Body objects.
+    date -- a YYYY-MM-DD string.
+    """
+
+    time1 = ephem.Date(date)
+    time2 = ephem.Date(time1 + 1)
+
+    positions = samples.sample_positions(bodies, [
+        time1,
+        time1 + ephem.minute,
+        time2 - ephem.minute,
+        time2
+    ], 'separations')
+
+    separations = get_separation_matrix(positions.ra, positions.dec)
+
+    # Each pair must be approaching at the start of the day and moving apart
+    # at the end of the day. Only the upper triangle of the matrix is used so
+    # that each pair is only included once.
+    found = (separations[..., 0] >= separations[..., 1]) & \
+            (separations[..., 2] <= separations[..., 3])
+
+    rows, columns = numpy.nonzero(numpy.triu(found, 1))
+
+    return [(bodies[row], bodies[column]) for row, column in zip(rows, columns)]
+
+
+def get_closest_approach(body1, body2, date):
+    """Returns a (time, separation) tuple for the closest approach of two
+    bodies on a given day, where the time is a PyEphem Date and the separation
+    is expressed in degrees. The closest approach is found to the nearest
+    second using Brent's method.
 
     Keyword arguments:
     body1 -- a PyEphem Body object (typically a planet).
     body2 -- a PyEphem Body object (typically a planet).
-    date -- a PyEphem Date object.
+    date -- a YYYY-MM-DD string or PyEphem Date object.
     """
 
-    separations = []
+    time1 = ephem.Date(date)
+    time2 = ephem.Date(time1 + 1)
 
-    for hour in range(0, 95):
+    return solvers.find_minimum(
+        lambda time: get_separation(body1, body2, time),
+        time1,
+        time2
+    )
 
-        offset = 0
 
-        if hour > 0:
-            offset = hour / 4
+def get_min_separation(body1, body2, date):
+    """Returns the minimum angular separation between two bodies on a given
+    day, or `None` if the bodies are too far apart for the separation to be
+    notable.
 
-        time = ephem.Date(date) + (ephem.hour * offset)
-        separation =  get_separation(body1, body2, time)
+    Keyword arguments:
+    body1 -- a PyEphem Body object (typically a planet).
+    body2 -- a PyEphem Body object (typically a planet).
+    date -- a PyEphem Date object.
+    """
 
-        # Check if the separation is increasing again so that we can break the
-        # loop early.
-        if separations and separation > separations[-1]:
-            break
-        else:
-            separations.append(separation)
+    separation = get_closest_approach(body1, body2, date)[1]
 
     # If the minimum separation is less than or equal to 4 degrees, return the
     # separation value.
-    if separations[-1] <= 4:
-        return separations[-1]
+    if separation <= MAX_SEPARATION:
+        return separation
     else:
         return None
 
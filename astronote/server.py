@@ -0,0 +1,595 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Server
+###############################################################################
+
+# An optional HTTP server (using only the standard library) that serves the
+# events of `get_events` and `get_events_range` as JSON. Calculations run in a
+# pool of worker processes that is warmed up when the server starts (or in the
+# server's own threads, using a pool of bodies that are only created once).
+# Identical requests that arrive while one is being calculated share that
+# calculation, responses are kept in an in-memory cache, and latency
+# histograms are served at /metrics in the Prometheus text format.
+#
+# Usage: python -m astronote.server [--host HOST] [--port PORT] [--workers N]
+#
+# GET /events?date=YYYY-MM-DD&lat=LAT&lon=LON[&include=sun,moon,...]
+# GET /range?start=YYYY-MM-DD&end=YYYY-MM-DD&lat=LAT&lon=LON[&include=...]
+# GET /metrics
+# GET /health
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from . import cache, core, helpers, samples
+from .__version__ import __version__
+
+
+# The upper bounds (in seconds) of the buckets of each latency histogram.
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# The paths that are served. Requests for any other path are recorded under
+# the path 'other', so that unknown paths do not create new metrics.
+PATHS = ['/events', '/range', '/metrics', '/health']
+
+
+class Histogram(object):
+    """A count of observations in each of a list of buckets, along with the
+    total count and sum of every observation.
+
+    Keyword arguments:
+    buckets -- a sorted list of the upper bound of each bucket.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+
+    def observe(self, value):
+        """Adds an observation to the histogram.
+
+        Keyword arguments:
+        value -- the value observed.
+        """
+
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+        self.count += 1
+        self.sum += value
+
+
+    def get_cumulative_counts(self):
+        """Returns a list of the number of observations less than or equal to
+        the upper bound of each bucket.
+        """
+
+        counts = []
+        total = 0
+
+        for count in self.counts:
+            total += count
+            counts.append(total)
+
+        return counts
+
+
+class Metrics(object):
+    """The request latencies, response counts and cache counts of a server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.responses = {}
+        self.counters = {
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'coalesced': 0
+        }
+        self.in_progress = 0
+
+
+    def observe(self, path, status, seconds):
+        """Records the latency and status of a request.
+
+        Keyword arguments:
+        path -- the path of the request.
+        status -- the HTTP status code of the response.
+        seconds -- the number of seconds taken to respond.
+        """
+
+        if path not in PATHS:
+            path = 'other'
+
+        with self.lock:
+
+            histogram = self.latencies.get(path)
+
+            if histogram is None:
+                histogram = Histogram(LATENCY_BUCKETS)
+                self.latencies[path] = histogram
+
+            histogram.observe(seconds)
+
+            key = (path, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+
+    def increment(self, name, number = 1):
+        """Adds to one of the counters.
+
+        Keyword arguments:
+        name -- the name of the counter.
+        number -- the number to add.
+        """
+
+        with self.lock:
+            self.counters[name] += number
+
+
+    def to_dict(self):
+        """Returns the metrics as a dictionary."""
+
+        with self.lock:
+
+            return {
+                'latencies': dict(
+                    (path, {
+                        'buckets': dict(zip(histogram.buckets, histogram.get_cumulative_counts())),
+                        'count': histogram.count,
+                        'sum': histogram.sum
+                    })
+                    for path, histogram in self.latencies.items()
+                ),
+                'responses': dict(
+                    ('%s %d' % key, count) for key, count in self.responses.items()
+                ),
+                'counters': dict(self.counters),
+                'in_progress': self.in_progress
+            }
+
+
+    def to_text(self):
+        """Returns the metrics in the Prometheus text format."""
+
+        lines = []
+
+        with self.lock:
+
+            lines.append('# HELP astronote_request_duration_seconds The time taken to respond to each request.')
+            lines.append('# TYPE astronote_request_duration_seconds histogram')
+
+            for path in sorted(self.latencies):
+
+                histogram = self.latencies[path]
+
+                for bound, count in zip(histogram.buckets, histogram.get_cumulative_counts()):
+                    lines.append('astronote_request_duration_seconds_bucket{path="%s",le="%g"} %d' % (path, bound, count))
+
+                lines.append('astronote_request_duration_seconds_bucket{path="%s",le="+Inf"} %d' % (path, histogram.count))
+                lines.append('astronote_request_duration_seconds_sum{path="%s"} %.6f' % (path, histogram.sum))
+                lines.append('astronote_request_duration_seconds_count{path="%s"} %d' % (path, histogram.count))
+
+            lines.append('# HELP astronote_responses_total The number of responses sent, by status.')
+            lines.append('# TYPE astronote_responses_total counter')
+
+            for (path, status), count in sorted(self.responses.items()):
+                lines.append('astronote_responses_total{path="%s",status="%d"} %d' % (path, status, count))
+
+            for name in sorted(self.counters):
+                lines.append('# TYPE astronote_%s_total counter' % name)
+                lines.append('astronote_%s_total %d' % (name, self.counters[name]))
+
+            lines.append('# TYPE astronote_in_progress gauge')
+            lines.append('astronote_in_progress %d' % self.in_progress)
+
+        return '\n'.join(lines) + '\n'
+
+
+class EventServer(ThreadingHTTPServer):
+    """An HTTP server of astronomical events. Each request is handled in its
+    own thread.
+
+    Keyword arguments:
+    address -- a (host, port) tuple. A port of 0 uses any free port.
+    workers -- the number of worker processes to calculate events in, or
+               None to calculate events in the server's own threads.
+    cache_size -- the maximum number of responses cached, or 0 to disable
+                  the cache.
+    ttl -- the number of seconds that a response is cached, or None to keep
+           responses until they are discarded to make space.
+    max_range_days -- the maximum number of days in a range request.
+    """
+
+    daemon_threads = True
+
+
+    def __init__(self, address = ('127.0.0.1', 8000), workers = None, cache_size = 1024, ttl = None, max_range_days = 366):
+        ThreadingHTTPServer.__init__(self, address, RequestHandler)
+
+        self.workers = workers
+        self.max_range_days = max_range_days
+        self.metrics = Metrics()
+
+        self.responses = None
+
+        if cache_size:
+            self.responses = cache.LRUCache(cache_size, ttl)
+
+        # The calculations in progress, keyed in the same way as responses.
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        # Sets of bodies used when calculating in the server's threads, so that
+        # bodies are only created once but never shared by two threads at once.
+        self.bodies = queue.LifoQueue()
+
+        # The server has its own pool of workers, rather than the pool shared
+        # by the `parallel` methods, so that the pool is never replaced or
+        # shut down by other calls while requests are being handled. Workers
+        # copy the settings of the transit engine, cache and store as they
+        # start, so these must be configured before the server is created.
+        self.executor = None
+
+        if workers:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=core._initialize_worker)
+
+
+    def warm_up(self):
+        """Starts the worker processes and waits until one is ready. Each
+        worker calculates the events of the current day as it starts (see
+        `core._initialize_worker`), before it takes any request. Without
+        workers, the events are calculated in the server's thread instead, so
+        in both cases the tables used by every request are built before the
+        first request arrives.
+        """
+
+        date = datetime.now().strftime('%Y-%m-%d')
+
+        if self.executor is None:
+            self.calculate(_get_events_json, date, '0', '0', None)
+            return
+
+        self.executor.submit(_call_in_worker, _get_events_json, date, '0', '0', None).result()
+
+
+    def get_response(self, key, func, *args):
+        """Returns the JSON response for a request, from the cache if it is
+        cached. Otherwise, the response is calculated by calling a function, or
+        shared with an identical request that is already being calculated.
+
+        Keyword arguments:
+        key -- a hashable key that identifies the request.
+        func -- a module level function that returns the JSON response.
+        *args -- arguments to pass to `func`.
+        """
+
+        if self.responses is not None:
+
+            response = self.responses.get(key)
+
+            if response is not None:
+                self.metrics.increment('cache_hits')
+                return response
+
+            self.metrics.increment('cache_misses')
+
+        with self.lock:
+
+            future = self.pending.get(key)
+            owner = future is None
+
+            if owner:
+                future = Future()
+                self.pending[key] = future
+
+        if not owner:
+            self.metrics.increment('coalesced')
+            return future.result()
+
+        try:
+            response = self.calculate(func, *args)
+        except BaseException as error:
+            future.set_exception(error)
+        else:
+            future.set_result(response)
+
+            if self.responses is not None:
+                self.responses.set(key, response)
+        finally:
+            with self.lock:
+                del self.pending[key]
+
+        return future.result()
+
+
+    def calculate(self, func, *args):
+        """Calls a function in a worker process (or in the current thread with
+        a set of bodies from the pool) and returns its result.
+
+        Keyword arguments:
+        func -- a module level function that accepts a dictionary of bodies
+                followed by `args`.
+        *args -- arguments to pass to `func`.
+        """
+
+        if self.executor is not None:
+            return self.executor.submit(_call_in_worker, func, *args).result()
+
+        try:
+            bodies = self.bodies.get_nowait()
+        except queue.Empty:
+            bodies = core._create_bodies(helpers.define_location('2000-01-01', '0', '0'))
+
+        try:
+            return func(bodies, *args)
+        finally:
+            self.bodies.put(bodies)
+
+
+    def shutdown_workers(self):
+        """Shuts down the worker processes (if any)."""
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Handles each request to an EventServer."""
+
+    server_version = 'astronote/%s' % __version__
+
+
+    def do_GET(self):
+
+        start = time.perf_counter()
+        url = urlparse(self.path)
+
+        with self.server.metrics.lock:
+            self.server.metrics.in_progress += 1
+
+        try:
+            status, content_type, body = self.get_response(url.path, parse_qs(url.query))
+        finally:
+            with self.server.metrics.lock:
+                self.server.metrics.in_progress -= 1
+
+        # The request is recorded before the response is sent, so that the
+        # metrics include every request that a client has received.
+        self.server.metrics.observe(url.path, status, time.perf_counter() - start)
+
+        body = body.encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def get_response(self, path, params):
+        """Returns a (status, content type, body) tuple for a request.
+
+        Keyword arguments:
+        path -- the path of the request.
+        params -- a dictionary of query parameters, as created by `parse_qs`.
+        """
+
+        try:
+
+            if path == '/events':
+                return 200, 'application/json', get_events_response(self.server, params)
+
+            if path == '/range':
+                return 200, 'application/json', get_range_response(self.server, params)
+
+            if path == '/metrics':
+                return 200, 'text/plain; version=0.0.4', self.server.metrics.to_text()
+
+            if path == '/health':
+                return 200, 'application/json', json.dumps({'status': 'ok'})
+
+            return 404, 'application/json', json.dumps({'error': 'Not found: %s' % path})
+
+        except ValueError as error:
+            return 400, 'application/json', json.dumps({'error': str(error)})
+
+        except Exception as error:
+            self.log_error('Error handling %s: %r', self.path, error)
+            return 500, 'application/json', json.dumps({'error': 'Internal server error'})
+
+
+    def log_message(self, format, *args):
+
+        # Requests are only logged when the server is run from the command
+        # line, so that servers started by other programs are quiet.
+        if getattr(self.server, 'verbose', False):
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def get_param(params, name, default = None):
+    """Returns the value of a query parameter, raising a ValueError if it is
+    required (i.e. has no default) and missing.
+
+    Keyword arguments:
+    params -- a dictionary of query parameters, as created by `parse_qs`.
+    name -- the name of the parameter.
+    default -- the value returned if the parameter is missing.
+    """
+
+    values = params.get(name)
+
+    if not values:
+
+        if default is None:
+            raise ValueError('Missing parameter: %s' % name)
+
+        return default
+
+    return values[0]
+
+
+def get_include(params):
+    """Returns a sorted tuple of the sections to calculate for a request,
+    raising a ValueError if any are unknown.
+
+    Keyword arguments:
+    params -- a dictionary of query parameters, as created by `parse_qs`.
+    """
+
+    include = get_param(params, 'include', '')
+
+    if not include:
+        return tuple(sorted(core.SECTIONS))
+
+    return tuple(sorted(core.get_sections(section.strip() for section in include.split(','))))
+
+
+def get_events_response(server, params):
+    """Returns the JSON response of an /events request.
+
+    Keyword arguments:
+    server -- an EventServer.
+    params -- a dictionary of query parameters, as created by `parse_qs`.
+    """
+
+    date = get_param(params, 'date')
+    lat = get_param(params, 'lat')
+    lon = get_param(params, 'lon')
+    include = get_include(params)
+
+    # Check the request before it is sent to a worker.
+    helpers.check_location(date, lat, lon)
+
+    return server.get_response(('events', date, lat, lon, include), _get_events_json, date, lat, lon, include)
+
+
+def get_range_response(server, params):
+    """Returns the JSON response of a /range request.
+
+    Keyword arguments:
+    server -- an EventServer.
+    params -- a dictionary of query parameters, as created by `parse_qs`.
+    """
+
+    start = get_param(params, 'start')
+    end = get_param(params, 'end')
+    lat = get_param(params, 'lat')
+    lon = get_param(params, 'lon')
+    include = get_include(params)
+
+    helpers.check_location(start, lat, lon)
+    helpers.check_location(end, lat, lon)
+
+    # The number of days is found from the dates alone, so that a long range
+    # is rejected without creating a date for every day in it.
+    days = (datetime.strptime(end, '%Y-%m-%d') - datetime.strptime(start, '%Y-%m-%d')).days + 1
+
+    if days <= 0:
+        raise ValueError('The end date is before the start date')
+
+    if days > server.max_range_days:
+        raise ValueError('A range can contain at most %d days' % server.max_range_days)
+
+    return server.get_response(('range', start, end, lat, lon, include), _get_range_json, start, end, lat, lon, include)
+
+
+def _call_in_worker(func, *args):
+    """Calls a function with the bodies of a worker process.
+
+    Keyword arguments:
+    func -- a module level function that accepts a dictionary of bodies
+            followed by `args`.
+    *args -- arguments to pass to `func`.
+    """
+
+    return func(core._worker_bodies, *args)
+
+
+def _get_events_json(bodies, date, lat, lon, include):
+    """Returns the events on a given day at a given location as JSON.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    date -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a collection of the sections to calculate, or None for every
+               section.
+    """
+
+    include = core.get_sections(include)
+
+    with samples.request_cache():
+        return json.dumps(core._get_events(bodies, date, lat, lon, include))
+
+
+def _get_range_json(bodies, start, end, lat, lon, include):
+    """Returns the events for every day between two dates (inclusive) at a
+    given location as JSON.
+
+    Keyword arguments:
+    bodies -- a dictionary of PyEphem objects, as created by `_create_bodies`.
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    include -- a collection of the sections to calculate.
+    """
+
+    dates = helpers.iter_date_range(start, end)
+    days = core._iter_events_for_dates(bodies, dates, lat, lon, core.get_sections(include))
+
+    return json.dumps([{'date': date, 'events': events} for date, events in days])
+
+
+def main(arguments = None):
+    """Runs the server until it is interrupted.
+
+    Keyword arguments:
+    arguments -- a list of command line arguments, or None to use sys.argv.
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m astronote.server', description='Serves astronomical events over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='the address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='the port to listen on (default: 8000)')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='the number of worker processes')
+    parser.add_argument('--cache-size', type=int, default=1024, help='the number of responses to cache (0 to disable)')
+    parser.add_argument('--ttl', type=float, default=None, help='the number of seconds to cache each response')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not log each request')
+    arguments = parser.parse_args(arguments)
+
+    server = EventServer((arguments.host, arguments.port), arguments.workers, arguments.cache_size, arguments.ttl)
+    server.verbose = not arguments.quiet
+
+    server.warm_up()
+
+    sys.stderr.write('Serving on http://%s:%d\n' % server.server_address[:2])
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.shutdown_workers()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Solvers
+###############################################################################
+
+# Numerical methods used to find the exact time of an event, once the event
+# has been narrowed down to a short period of time.
+
+import ephem
+import math
+import numpy
+
+
+# The golden ratio section used to shrink the interval in `find_minimum` when a
+# parabolic step cannot be trusted.
+GOLDEN_SECTION = (3 - math.sqrt(5)) / 2
+
+
+def find_sign_changes(values):
+    """Returns a Boolean NumPy array that is True wherever the sign of a value
+    differs from the sign of the value that follows it (along the last axis).
+
+    Keyword arguments:
+    values -- a NumPy array of sampled values.
+    """
+
+    negative = values < 0
+    return negative[..., :-1] != negative[..., 1:]
+
+
+def find_maxima(values):
+    """Returns a Boolean NumPy array that is True wherever a value is a local
+    maximum, i.e. larger than the value before it and no smaller than the
+    value after it (along the last axis). The first and last values can never
+    be a maximum.
+
+    Keyword arguments:
+    values -- a NumPy array of sampled values.
+    """
+
+    changes = numpy.diff(values)
+
+    maxima = numpy.zeros(values.shape, dtype=bool)
+    maxima[..., 1:-1] = (changes[..., :-1] > 0) & (changes[..., 1:] <= 0)
+
+    return maxima
+
+
+def find_root(func, time1, time2, precision = ephem.second):
+    """Returns the time at which the value of a function changes sign between
+    two times, using bisection. The function must have opposite signs at
+    `time1` and `time2`.
+
+    Keyword arguments:
+    func -- a function that accepts a PyEphem Date and returns a number.
+    time1 -- a PyEphem Date object.
+    time2 -- a PyEphem Date object.
+    precision -- the maximum error (in days) of the returned time.
+    """
+
+    time1 = float(time1)
+    time2 = float(time2)
+    negative1 = func(time1) < 0
+
+    while time2 - time1 > precision:
+
+        middle = (time1 + time2) / 2
+
+        if (func(middle) < 0) == negative1:
+            time1 = middle
+        else:
+            time2 = middle
+
+    return ephem.Date((time1 + time2) / 2)
+
+
+def find_minimum(func, time1, time2, precision = ephem.second):
+    """Returns a (time, value) tuple for the minimum value of a function
+    between two times, using Brent's method. Parabolic interpolation is used
+    to converge quickly on the minimum, falling back to golden-section steps
+    whenever the parabola cannot be trusted. The function is assumed to only
+    have a single minimum between the two times.
+
+    Keyword arguments:
+    func -- a function that accepts a PyEphem Date and returns a number.
+    time1 -- a PyEphem Date object.
+    time2 -- a PyEphem Date object.
+    precision -- the maximum error (in days) of the returned time.
+    """
+
+    a = float(time1)
+    b = float(time2)
+
+    # `x` is the best time found so far, `w` the second best and `v` the
+    # previous value of `w`.
+    x = w = v = a + GOLDEN_SECTION * (b - a)
+    value_x = value_w = value_v = func(x)
+
+    step = 0.0
+    previous_step = 0.0
+    tolerance = precision / 2
+
+    while abs(x - (a + b) / 2) > precision - (b - a) / 2:
+
+        middle = (a + b) / 2
+        use_golden_section = True
+
+        # Attempt to fit a parabola through `x`, `w` and `v`.
+        if abs(previous_step) > tolerance:
+
+            r = (x - w) * (value_x - value_v)
+            q = (x - v) * (value_x - value_w)
+            p = (x - v) * q - (x - w) * r
+            q = 2 * (q - r)
+
+            if q > 0:
+                p = -p
+
+            q = abs(q)
+
+            # Only accept the parabolic step if it falls within the interval
+            # and is smaller than half of the step before last.
+            if abs(p) < abs(q * previous_step / 2) and q * (a - x) < p < q * (b - x):
+
+                previous_step = step
+                step = p / q
+                use_golden_section = False
+
+                if (x + step) - a < precision or b - (x + step) < precision:
+                    step = math.copysign(tolerance, middle - x)
+
+        if use_golden_section:
+
+            if x >= middle:
+                previous_step = a - x
+            else:
+                previous_step = b - x
+
+            step = GOLDEN_SECTION * previous_step
+
+        if abs(step) >= tolerance:
+            u = x + step
+        else:
+            u = x + math.copysign(tolerance, step)
+
+        value_u = func(u)
+
+        if value_u <= value_x:
+
+            if u >= x:
+                a = x
+            else:
+                b = x
+
+            v, w, x = w, x, u
+            value_v, value_w, value_x = value_w, value_x, value_u
+
+        else:
+
+            if u < x:
+                a = u
+            else:
+                b = u
+
+            if value_u <= value_w or w == x:
+                v, w = w, u
+                value_v, value_w = value_w, value_u
+            elif value_u <= value_v or v == x or v == w:
+                v = u
+                value_v = value_u
+
+    return (ephem.Date(x), value_x)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Store
+###############################################################################
+
+# An optional on-disk store of the events that do not depend on the location
+# they are viewed from (planetary events, separations, meteor showers,
+# solstices and equinoxes, and the phase of the Moon). These only depend on the
+# date, so once calculated they can be kept for as long as the methods that
+# find them stay the same.
+
+import json
+import os
+import sqlite3
+import threading
+from . import parallel
+from . import records
+
+
+# The version of the stored data. This must be increased whenever a change
+# alters the events that are found, so that any existing stores are cleared
+# rather than returning events calculated by the old methods.
+SCHEMA_VERSION = 4
+
+
+# The store used by `get_events`, which is None until `configure` is called.
+_store = None
+
+
+class GeocentricStore(object):
+    """A SQLite database of location independent events, keyed by date and
+    the sections that were calculated. If the database was created with a
+    different SCHEMA_VERSION, all of its events are removed when it is
+    opened.
+
+    A SQLite connection cannot be used by a forked process, so each process
+    (e.g. each worker of a process pool) opens its own connection the first
+    time it uses the store.
+
+    Keyword arguments:
+    path -- the path of the database file (created if it does not exist), or
+            ':memory:' for a temporary database.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+        self.connection = None
+        self.lock = None
+
+        self.hits = 0
+        self.misses = 0
+
+        self._get_connection()
+
+
+    def _get_connection(self):
+        """Returns the connection of the current process, opening it (and
+        creating the tables of the database) if the current process has not
+        used the store before.
+        """
+
+        if self.pid != os.getpid():
+
+            # The lock is replaced along with the connection, as the lock of
+            # the parent process may have been held when it forked.
+            self.pid = os.getpid()
+            self.lock = threading.Lock()
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+
+            self._create()
+
+        return self.connection
+
+
+    def _create(self):
+        """Creates the tables of the database, removing all events if they were
+        stored with a different schema version.
+        """
+
+        with self.lock, self.connection:
+
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS geocentric ('
+                'date TEXT, sections TEXT, data TEXT, PRIMARY KEY (date, sections))'
+            )
+
+            row = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'schema_version'"
+            ).fetchone()
+
+            if row is None or int(row[0]) != SCHEMA_VERSION:
+
+                self.connection.execute('DELETE FROM geocentric')
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+                    (str(SCHEMA_VERSION),)
+                )
+
+
+    def get(self, date, sections):
+        """Returns the stored events for a date and set of sections, or None if
+        they have not been stored.
+
+        Keyword arguments:
+        date -- a YYYY-MM-DD string.
+        sections -- a collection of section names.
+        """
+
+        connection = self._get_connection()
+
+        with self.lock:
+
+            row = connection.execute(
+                'SELECT data FROM geocentric WHERE date = ? AND sections = ?',
+                (date, get_sections_key(sections))
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+
+        # Events are stored as JSON arrays of their values.
+        geocentric = json.loads(row[0])
+        geocentric['events'] = [records.load_event(values) for values in geocentric['events']]
+
+        return geocentric
+
+
+    def set(self, date, sections, geocentric):
+        """Stores the events for a date and set of sections.
+
+        Keyword arguments:
+        date -- a YYYY-MM-DD string.
+        sections -- a collection of section names.
+        geocentric -- a dictionary of events, as created by
+                      `_get_geocentric_events`.
+        """
+
+        self.set_many([(date, geocentric)], sections)
+
+
+    def set_many(self, items, sections):
+        """Stores the events for many dates in a single transaction.
+
+        Keyword arguments:
+        items -- a list of (date, geocentric) tuples.
+        sections -- a collection of section names.
+        """
+
+        key = get_sections_key(sections)
+        connection = self._get_connection()
+
+        with self.lock, connection:
+
+            connection.executemany(
+                'INSERT OR REPLACE INTO geocentric (date, sections, data) VALUES (?, ?, ?)',
+                [(date, key, json.dumps(geocentric)) for date, geocentric in items]
+            )
+
+
+    def get_dates(self, sections):
+        """Returns a set of every date with stored events for a set of sections.
+
+        Keyword arguments:
+        sections -- a collection of section names.
+        """
+
+        connection = self._get_connection()
+
+        with self.lock:
+
+            rows = connection.execute(
+                'SELECT date FROM geocentric WHERE sections = ?',
+                (get_sections_key(sections),)
+            ).fetchall()
+
+        return set(row[0] for row in rows)
+
+
+    def clear(self):
+        """Removes all stored events."""
+
+        connection = self._get_connection()
+
+        with self.lock, connection:
+            connection.execute('DELETE FROM geocentric')
+
+
+    def get_stats(self):
+        """Returns a dictionary containing the number of requests that were
+        found in the store (hits), the number that were not (misses) and the
+        number of rows stored.
+        """
+
+        connection = self._get_connection()
+
+        with self.lock:
+            size = connection.execute('SELECT COUNT(*) FROM geocentric').fetchone()[0]
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': size
+        }
+
+
+    def close(self):
+        """Closes the database connection of the current process. The
+        connections of other processes are left to them.
+        """
+
+        if self.pid != os.getpid():
+            return
+
+        with self.lock:
+            self.connection.close()
+
+
+def get_sections_key(sections):
+    """Returns the string used to store a set of sections.
+
+    Keyword arguments:
+    sections -- a collection of section names.
+    """
+
+    return ','.join(sorted(sections))
+
+
+def configure(path = None):
+    """Opens the store used by `get_events`, closing any existing store.
+
+    Keyword arguments:
+    path -- the path of the database file, or None to stop using a store.
+    """
+
+    global _store
+
+    if _store is not None:
+        _store.close()
+
+    _store = None
+
+    if path is not None:
+        _store = GeocentricStore(path)
+
+    # Worker processes copy the store when they start, so any running pool is
+    # shut down to start new workers with this store.
+    parallel.shutdown()
+
+
+def get_store():
+    """Returns the store used by `get_events`, or None if there is no store."""
+
+    return _store
@@ -5,10 +5,448 @@
 ###############################################################################
 
 # Methods that calculate transit information such as rise and set times.
+#
+# Two engines are available. The 'solver' engine uses PyEphem's rising and
+# setting methods, which search for each rise or set separately. The 'sampled'
+# engine estimates every horizon crossing of all bodies at once from samples
+# on a shared time grid, and only refines the crossings that are used.
 
 import ephem
+import math
+import numpy
 from datetime import datetime
 from . import helpers
+from . import instrumentation
+from . import parallel
+from . import records
+from . import samples
+from . import solvers
+
+
+# The available transit engines.
+ENGINES = ['solver', 'sampled']
+
+# The engine used by `get_events`.
+_settings = {
+    'engine': 'solver'
+}
+
+# The furthest (in days) that a rise or set is searched for from a given time
+# before the body is considered to be always up or never up. This is slightly
+# longer than a day so that a Moon rise that is more than 24 hours after the
+# previous one is still found.
+SEARCH_DAYS = 1.1
+
+# The number of days before and after a date that the geocentric position of
+# each body is sampled, which must cover the one search before and the two
+# searches after the date made by `get_transit_times`. Positions are
+# interpolated between samples onto a grid with a point every GRID_STEP days.
+SAMPLE_DAYS_BEFORE = 1
+SAMPLE_DAYS_AFTER = 3
+GRID_STEP = 10 * ephem.minute
+
+# The number of days covered by each SampledHorizon created by
+# `iter_transits`. Longer windows share more of their setup, while the memory
+# used stays the same however long the period being iterated over is.
+WINDOW_DAYS = 30
+
+# The rotation of the Earth (in radians) relative to the stars in one day.
+SIDEREAL_RATE = 2 * math.pi * 1.00273790935
+
+# The radius of the Earth (in km) and the length of an astronomical unit (in
+# km), used to find the parallax of the Moon.
+EARTH_RADIUS = 6378.137
+AU = 149597870.7
+
+# The maximum number of steps taken to refine a crossing. A crossing is refined
+# once a step is smaller than REFINE_PRECISION days, as each step reduces the
+# error to a small fraction (about 1/50th at most) of the step before it.
+REFINE_STEPS = 8
+REFINE_PRECISION = 10 * ephem.second
+
+
+def configure(engine = 'solver'):
+    """Sets the engine used to calculate rise and set times in `get_events`.
+
+    Keyword arguments:
+    engine -- 'solver' to use PyEphem's rising and setting methods, or
+              'sampled' to use a SampledHorizon for each location.
+    """
+
+    if engine not in ENGINES:
+        raise ValueError('Unknown transit engine: %s' % engine)
+
+    _settings['engine'] = engine
+
+    # Worker processes copy the engine when they start, so any running pool
+    # is shut down to start new workers with this engine.
+    parallel.shutdown()
+
+
+def get_horizon(bodies, date, lat, lon):
+    """Returns a SampledHorizon for a list of bodies at a given location if
+    the sampled engine is configured, or None if PyEphem's methods should be
+    used.
+
+    Keyword arguments:
+    bodies -- a list of PyEphem Body objects.
+    date -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    """
+
+    if _settings['engine'] == 'sampled':
+        return SampledHorizon(bodies, date, lat, lon)
+
+    return None
+
+
+class Crossing(object):
+    """A horizon crossing estimated from a sampled grid."""
+
+    def __init__(self, time, rising, ra_rate, dec_rate):
+        self.time = time
+        self.rising = rising
+        self.ra_rate = ra_rate
+        self.dec_rate = dec_rate
+        self.refined = None
+
+
+class SampledHorizon(object):
+    """Finds the rise and set times of many bodies at one location.
+
+    The geocentric position of each body is sampled once a day (sharing
+    samples through the active sample cache) and interpolated onto a grid
+    covering several days either side of the date. The altitude of every body
+    is estimated over the whole grid at once, and the horizon crossings are
+    found from the changes in sign. A crossing is only refined, using the
+    body's exact position as seen from the location, once it is requested.
+
+    The rising and setting methods share their names and arguments with those
+    of a PyEphem Observer, so a SampledHorizon can be used in their place with
+    `get_transit_times`.
+
+    Keyword arguments:
+    bodies -- a list of PyEphem Body objects.
+    date -- a YYYY-MM-DD string.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    days -- the number of days (starting from the date) that rise and set
+            times can be searched from.
+    """
+
+    def __init__(self, bodies, date, lat, lon, days = 1):
+
+        location = helpers.define_location(date, lat, lon)
+
+        self.date = location.date
+        self.lat = float(location.lat)
+
+        # Crossings are found in the same way as PyEphem, i.e. using the
+        # geometric altitude of the body with refraction applied to the
+        # horizon instead.
+        self.pressure = location.pressure
+        self.temp = location.temp
+        self.location = location
+        self.location.pressure = 0
+
+        # The number of crossings that have been refined.
+        self.refinements = 0
+
+        nodes = numpy.arange(-SAMPLE_DAYS_BEFORE, days + SAMPLE_DAYS_AFTER) + float(self.date)
+
+        # The grid covers every time that can be searched. (Times before the
+        # first sample are extrapolated.)
+        self.times = numpy.arange(
+            float(self.date) - SEARCH_DAYS - GRID_STEP,
+            float(self.date) + days - 1 + 2 * SEARCH_DAYS + 2 * GRID_STEP,
+            GRID_STEP
+        )
+
+        positions = samples.sample_positions(bodies, [ephem.Date(node) for node in nodes], 'transits')
+        sidereal_time = float(location.sidereal_time()) + SIDEREAL_RATE * (self.times - float(self.date))
+
+        # Estimate the altitude of every body over the whole grid at once,
+        # with a row for each body.
+        ra = interpolate(self.times, nodes, numpy.unwrap(positions.ra))
+        dec = interpolate(self.times, nodes, positions.dec)
+
+        altitudes = numpy.arcsin(
+            math.sin(self.lat) * numpy.sin(dec) +
+            math.cos(self.lat) * numpy.cos(dec) * numpy.cos(sidereal_time - ra)
+        )
+
+        # The horizon is lowered by the radius of each body and refraction.
+        # The Moon is close enough that its geocentric altitude is also higher
+        # than the altitude seen from the surface of the Earth.
+        for row, body in enumerate(bodies):
+
+            altitudes[row] -= ephem.unrefract(self.pressure, self.temp, -body.radius)
+
+            if body.name == 'Moon':
+                distance = interpolate(self.times, nodes, positions.earth_distance[row])
+                altitudes[row] -= numpy.arcsin(EARTH_RADIUS / (distance * AU))
+
+        ra_rates = numpy.gradient(ra, GRID_STEP, axis=-1)
+        dec_rates = numpy.gradient(dec, GRID_STEP, axis=-1)
+
+        self.altitudes = {}
+        self.crossings = {}
+
+        for row, body in enumerate(bodies):
+            self.altitudes[body.name] = altitudes[row]
+            self.crossings[body.name] = self._find_crossings(altitudes[row], ra_rates[row], dec_rates[row])
+
+
+    def _find_crossings(self, altitudes, ra_rates, dec_rates):
+        """Returns a list of Crossing objects for every horizon crossing in a
+        list of altitudes.
+
+        Keyword arguments:
+        altitudes -- a NumPy array of altitudes above the horizon.
+        ra_rates -- a NumPy array of the rate of change of right ascension.
+        dec_rates -- a NumPy array of the rate of change of declination.
+        """
+
+        crossings = []
+
+        for index in numpy.nonzero(solvers.find_sign_changes(altitudes))[0]:
+
+            # Interpolate between the two grid points to estimate the time.
+            altitude1 = altitudes[index]
+            altitude2 = altitudes[index + 1]
+            time = self.times[index] + GRID_STEP * altitude1 / (altitude1 - altitude2)
+
+            crossings.append(Crossing(time, altitude2 > altitude1, ra_rates[index], dec_rates[index]))
+
+        return crossings
+
+
+    def _refine(self, body, crossing):
+        """Returns the exact time of a crossing, refining its estimated time
+        using Newton's method the first time it is requested.
+
+        Keyword arguments:
+        body -- a PyEphem Body object.
+        crossing -- a Crossing object.
+        """
+
+        if crossing.refined is None:
+
+            location = self.location
+            time = crossing.time
+            previous = None
+            sin_lat = math.sin(self.lat)
+            cos_lat = math.cos(self.lat)
+
+            for _ in range(REFINE_STEPS):
+
+                location.date = time
+                body.compute(location)
+                instrumentation.count('computes', 'transits')
+
+                altitude = body.alt - ephem.unrefract(self.pressure, self.temp, -body.radius)
+
+                # The rate of change of altitude (in radians per day), caused
+                # by the change in hour angle as the Earth rotates and the
+                # change in declination as the body moves.
+                sin_dec = math.sin(body.dec)
+                cos_dec = math.cos(body.dec)
+
+                rate = (
+                    -cos_lat * cos_dec * math.sin(body.ha) * (SIDEREAL_RATE - crossing.ra_rate) +
+                    (sin_lat * cos_dec - cos_lat * sin_dec * math.cos(body.ha)) * crossing.dec_rate
+                ) / math.cos(body.alt)
+
+                # Near the highest (or lowest) point of a body's path the rate
+                # is too small to use, so the crossing is solved using the
+                # secant method instead. It starts from the last two Newton
+                # iterates (or from a minute after the only one), so that the
+                # progress made so far keeps it on the same crossing.
+                if abs(altitude) > abs(rate) * GRID_STEP:
+
+                    if previous is None or previous == time:
+                        previous = time + ephem.minute
+
+                    time = ephem.newton(lambda time: self._get_altitude(body, time), time, previous)
+                    break
+
+                step = altitude / rate
+                previous = time
+                time -= step
+
+                if abs(step) < REFINE_PRECISION:
+                    break
+
+            self.refinements += 1
+            instrumentation.count('refinements', 'transits')
+            crossing.refined = ephem.Date(time)
+
+        return crossing.refined
+
+
+    def _get_altitude(self, body, time):
+        """Returns the altitude of a body above the horizon at a given time.
+
+        Keyword arguments:
+        body -- a PyEphem Body object.
+        time -- a PyEphem Date object.
+        """
+
+        self.location.date = time
+        body.compute(self.location)
+        instrumentation.count('computes', 'transits')
+
+        return body.alt - ephem.unrefract(self.pressure, self.temp, -body.radius)
+
+
+    def _find(self, body, start, rising, direction):
+        """Returns the time of the first rise or set after (or before) a
+        given time, raising ephem.AlwaysUpError or ephem.NeverUpError if the
+        body does not rise or set within SEARCH_DAYS.
+
+        Keyword arguments:
+        body -- a PyEphem Body object.
+        start -- a PyEphem Date object, or None to use the date.
+        rising -- True to find a rise, or False to find a set.
+        direction -- 1 to search forwards, or -1 to search backwards.
+        """
+
+        start = float(self.date if start is None else start)
+        crossings = self.crossings[body.name]
+
+        if direction < 0:
+            crossings = reversed(crossings)
+
+        for crossing in crossings:
+
+            # Skip crossings of the wrong type, or those that are clearly on
+            # the wrong side of the start time.
+            if crossing.rising != rising or direction * (crossing.time - start) < -GRID_STEP:
+                continue
+
+            offset = direction * (self._refine(body, crossing) - start)
+
+            if offset > ephem.second and offset <= SEARCH_DAYS:
+                return crossing.refined
+
+            if offset > SEARCH_DAYS:
+                break
+
+        # The body does not rise (or set) in time, so it is either always up
+        # or never up at the end of the search.
+        altitude = numpy.interp(start + direction * SEARCH_DAYS, self.times, self.altitudes[body.name])
+
+        if altitude > 0:
+            raise ephem.AlwaysUpError('%r is above the horizon' % body.name)
+
+        raise ephem.NeverUpError('%r is below the horizon' % body.name)
+
+
+    def next_rising(self, body, start = None):
+        return self._find(body, start, True, 1)
+
+
+    def next_setting(self, body, start = None):
+        return self._find(body, start, False, 1)
+
+
+    def previous_rising(self, body, start = None):
+        return self._find(body, start, True, -1)
+
+
+    def previous_setting(self, body, start = None):
+        return self._find(body, start, False, -1)
+
+
+def interpolate(times, nodes, values):
+    """Returns the values of a smoothly changing quantity at many times, using
+    quadratic interpolation between values sampled once a day.
+
+    Keyword arguments:
+    times -- a NumPy array of times.
+    nodes -- a NumPy array of at least three times, one day apart.
+    values -- a NumPy array of the values at each node (along the last axis).
+    """
+
+    # Each time is interpolated using the node before it and the two nodes
+    # that follow (or the first or last three nodes, at either end).
+    index = numpy.clip(numpy.floor(times - nodes[0]).astype(int), 0, len(nodes) - 3)
+    offset = times - nodes[index]
+
+    value0 = values[..., index]
+    value1 = values[..., index + 1]
+    value2 = values[..., index + 2]
+
+    return value0 + offset * (value1 - value0) + \
+           offset * (offset - 1) / 2 * (value2 - 2 * value1 + value0)
+
+
+def iter_transits(body, lat, lon, start, end, compact = False):
+    """Yields every rise and set of a body at a given location between two
+    dates (inclusive) in time order, each in the same format as the transits
+    returned by `get_transit_times`. Nothing is yielded while the body is
+    always up or never up.
+
+    Unlike calling `get_transit_times` for each day, every rise and set is
+    only found (and yielded) once. The period is worked through WINDOW_DAYS at
+    a time, so the memory used does not grow with its length.
+
+    Keyword arguments:
+    body -- a PyEphem Body object.
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    start -- a YYYY-MM-DD string.
+    end -- a YYYY-MM-DD string.
+    compact -- if True, each rise and set is yielded as a Transit record
+               rather than a dictionary.
+    """
+
+    first = ephem.Date(start)
+    last = ephem.Date(ephem.Date(end) + 1)
+
+    cache = samples.SampleCache()
+    previous = None
+    window = first
+
+    while window < last:
+
+        days = int(min(WINDOW_DAYS, math.ceil(last - window)))
+        found = []
+
+        # The cache is only active while a window is calculated (rather than
+        # while its transits are yielded) so that it is never left active for
+        # the caller, e.g. while other generators are being consumed.
+        with samples.use_cache(cache):
+
+            horizon = SampledHorizon([body], ephem.Date(window), lat, lon, days)
+
+            for crossing in horizon.crossings[body.name]:
+
+                # A crossing close to the end of a window may be estimated on
+                # either side of it, so crossings just before the window are
+                # included and any that were already yielded are skipped.
+                if crossing.time < window - GRID_STEP or crossing.time >= window + days:
+                    continue
+
+                time = horizon._refine(body, crossing)
+
+                if time < first or time >= last:
+                    continue
+
+                if previous is not None and time - previous < ephem.minute:
+                    continue
+
+                previous = time
+                found.append(get_transit_record('rise' if crossing.rising else 'set', time))
+
+        for transit in found:
+            yield transit if compact else transit.to_dict()
+
+        window += days
+
+        # Only the samples shared with the next window are kept.
+        cache.discard_before(window - SAMPLE_DAYS_BEFORE)
 
 
 def format_transit_time(transit_type, date):
@@ -33,10 +471,29 @@ def format_transit_time(transit_type, date):
     return transit
 
 
-def get_transit_times(body, date, lat, lon):
+def get_transit_record(transit_type, date):
+    """Returns a Transit record that defines a transit time, the compact
+    equivalent of `format_transit_time`.
+
+    Keyword arguments:
+    transit_type -- a string defining what the transit is, e.g. rise or set
+    date -- a PyEphem Date object, or a "NeverUp" or "AlwaysUp" string.
+    """
+
+    if helpers.is_date(date):
+        return records.Transit(transit_type, records.Timestamp(date))
+
+    return records.Transit(transit_type, date)
+
+
+def get_transit_times(body, date, lat, lon, horizon = None, compact = False):
 
-    # Define an Observer.
-    location = helpers.define_location(date, lat, lon)
+    # Define an Observer, unless a SampledHorizon has been provided to find the
+    # rise and set times instead.
+    if horizon is None:
+        location = helpers.define_location(date, lat, lon)
+    else:
+        location = horizon
 
     # Create a holder for all transit information.
     times = []
@@ -65,27 +522,27 @@ def get_transit_times(body, date, lat, lon):
             prev_body_set = get_transit(location.previous_setting, body, start=body_rise)
             next_body_rise = get_transit(location.next_rising, body, start=body_set)
 
-            times.append(format_transit_time('set', prev_body_set))
-            times.append(format_transit_time('rise', body_rise))
-            times.append(format_transit_time('set', body_set))
-            times.append(format_transit_time('rise', next_body_rise))
+            times.append(get_transit_record('set', prev_body_set))
+            times.append(get_transit_record('rise', body_rise))
+            times.append(get_transit_record('set', body_set))
+            times.append(get_transit_record('rise', next_body_rise))
 
         # If the body sets before rising, get a previous rise and future set.
         else:
             prev_body_rise = get_transit(location.previous_rising, body, start=body_set)
             next_body_set = get_transit(location.next_setting, body, start=body_rise)
 
-            times.append(format_transit_time('rise', prev_body_rise))
-            times.append(format_transit_time('set', body_set))
-            times.append(format_transit_time('rise', body_rise))
-            times.append(format_transit_time('set', next_body_set))
+            times.append(get_transit_record('rise', prev_body_rise))
+            times.append(get_transit_record('set', body_set))
+            times.append(get_transit_record('rise', body_rise))
+            times.append(get_transit_record('set', next_body_set))
 
     # If the rise is undefined but the set is valid, get the previous and next
     # rise times based from the set time.
     elif not helpers.is_date(body_rise) and not helpers.is_date(body_set):
 
-        times.append(format_transit_time('rise', body_rise))
-        times.append(format_transit_time('set', body_set))
+        times.append(get_transit_record('rise', body_rise))
+        times.append(get_transit_record('set', body_set))
 
     else:
 
@@ -93,40 +550,44 @@ def get_transit_times(body, date, lat, lon):
             prev_body_set = get_transit(location.previous_setting, body, start=body_set)
             next_body_rise = get_transit(location.next_rising, body, start=body_set)
 
-            times.append(format_transit_time('set', prev_body_set))
-            times.append(format_transit_time('rise', body_rise))
-            times.append(format_transit_time('set', body_set))
-            times.append(format_transit_time('rise', next_body_rise))
+            times.append(get_transit_record('set', prev_body_set))
+            times.append(get_transit_record('rise', body_rise))
+            times.append(get_transit_record('set', body_set))
+            times.append(get_transit_record('rise', next_body_rise))
 
         elif body_rise == 'NeverUp':
             prev_body_rise = get_transit(location.previous_rising, body, start=body_set)
             next_body_set = get_transit(location.next_setting, body, start=body_set)
 
-            times.append(format_transit_time('rise', prev_body_rise))
-            times.append(format_transit_time('set', body_set))
-            times.append(format_transit_time('rise', body_rise))
-            times.append(format_transit_time('set', next_body_set))
+            times.append(get_transit_record('rise', prev_body_rise))
+            times.append(get_transit_record('set', body_set))
+            times.append(get_transit_record('rise', body_rise))
+            times.append(get_transit_record('set', next_body_set))
 
         elif body_set == 'AlwaysUp':
             prev_body_set = get_transit(location.previous_setting, body, start=body_rise)
             next_body_rise = get_transit(location.next_rising, body, start=body_rise)
 
-            times.append(format_transit_time('set', prev_body_set))
-            times.append(format_transit_time('rise', body_rise))
-            times.append(format_transit_time('set', body_set))
-            times.append(format_transit_time('rise', next_body_rise))
+            times.append(get_transit_record('set', prev_body_set))
+            times.append(get_transit_record('rise', body_rise))
+            times.append(get_transit_record('set', body_set))
+            times.append(get_transit_record('rise', next_body_rise))
 
         elif body_set == 'NeverUp':
             prev_body_rise = get_transit(location.previous_rising, body, start=body_rise)
             next_body_set = get_transit(location.next_setting, body, start=body_rise)
 
-            times.append(format_transit_time('rise', prev_body_rise))
-            times.append(format_transit_time('set', body_set))
-            times.append(format_transit_time('rise', body_rise))
-            times.append(format_transit_time('set', next_body_set))
+            times.append(get_transit_record('rise', prev_body_rise))
+            times.append(get_transit_record('set', body_set))
+            times.append(get_transit_record('rise', body_rise))
+            times.append(get_transit_record('set', next_body_set))
 
+    # Compact Transit records are only converted into dictionaries if they
+    # have not been requested.
+    if compact:
+        return times
 
-    return times
+    return [transit.to_dict() for transit in times]
 
 
 def get_transit(callback, *args, **kwargs):
@@ -153,11 +614,18 @@ def get_transit(callback, *args, **kwargs):
 
     if callback.__name__ in accepted_callbacks:
 
+        # Only PyEphem's own searches are solver calls. A SampledHorizon
+        # counts its refinements instead.
+        if isinstance(getattr(callback, '__self__', None), ephem.Observer):
+            instrumentation.count('solver_calls', 'transits')
+
         try:
             return callback(*args, **kwargs)
         except ephem.AlwaysUpError:
+            instrumentation.count('always_up', 'transits')
             return 'AlwaysUp'
         except ephem.NeverUpError:
+            instrumentation.count('never_up', 'transits')
             return 'NeverUp'
         except:
             return None
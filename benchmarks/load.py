@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Load test
+###############################################################################
+
+# Starts an event server on a free local port and sends it requests from many
+# client threads at once, reporting the throughput, the latency percentiles
+# seen by the clients and the server's cache and coalescing counts. Requests
+# are drawn from a fixed set of dates and locations, so that repeated requests
+# exercise the response cache and concurrent identical requests are coalesced.
+#
+# Usage: python benchmarks/load.py [requests] [clients] [workers]
+
+import http.client
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from astronote import server
+
+
+# The dates and locations that requests are drawn from.
+DATES = ['2017-06-%02d' % day for day in range(1, 31)]
+LOCATIONS = [('51.5', '-0.1'), ('1.3', '103.8'), ('78.2', '15.6'), ('-33.9', '151.2')]
+
+
+def run_client(address, count, latencies, errors):
+    """Sends requests to the server, recording the latency of each.
+
+    Keyword arguments:
+    address -- the (host, port) tuple of the server.
+    count -- the number of requests to send.
+    latencies -- a list that the latency of each request is appended to.
+    errors -- a list that the status of each failed request is appended to.
+    """
+
+    connection = http.client.HTTPConnection(*address)
+
+    for index in range(count):
+
+        date = random.choice(DATES)
+        lat, lon = random.choice(LOCATIONS)
+
+        start = time.perf_counter()
+        connection.request('GET', '/events?date=%s&lat=%s&lon=%s' % (date, lat, lon))
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+
+        if response.status != 200:
+            errors.append(response.status)
+
+    connection.close()
+
+
+def main(requests = 2000, clients = 8, workers = 0):
+
+    event_server = server.EventServer(('127.0.0.1', 0), workers or None)
+    event_server.warm_up()
+
+    thread = threading.Thread(target=event_server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    latencies = []
+    errors = []
+
+    start = time.perf_counter()
+
+    threads = [
+        threading.Thread(target=run_client, args=(event_server.server_address, requests // clients, latencies, errors))
+        for client in range(clients)
+    ]
+
+    for client in threads:
+        client.start()
+
+    for client in threads:
+        client.join()
+
+    elapsed = time.perf_counter() - start
+
+    event_server.shutdown()
+    event_server.server_close()
+    event_server.shutdown_workers()
+
+    latencies.sort()
+    counters = event_server.metrics.to_dict()['counters']
+
+    print('%d requests from %d clients in %.2f s (%.0f requests/s), %d errors' % (
+        len(latencies), clients, elapsed, len(latencies) / elapsed, len(errors)
+    ))
+
+    for percentile in [50, 90, 99]:
+        print('p%d latency: %.2f ms' % (percentile, latencies[int(len(latencies) * percentile / 100.0)] * 1000))
+
+    print('cache hits: %(cache_hits)d, misses: %(cache_misses)d, coalesced: %(coalesced)d' % counters)
+
+
+if __name__ == '__main__':
+    main(*[int(argument) for argument in sys.argv[1:]])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Memory benchmark
+###############################################################################
+
+# Measures the memory held by the results of `get_events` (and the number of
+# memory blocks allocated for them) when events are returned as dictionaries
+# compared with compact records.
+#
+# Usage: python benchmarks/memory.py [days] [locations]
+
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import astronote
+
+
+def get_locations(count):
+    """Returns a list of (lat, lon) tuples spread between the polar circles.
+
+    Keyword arguments:
+    count -- the number of locations.
+    """
+
+    return [
+        (str(-60 + 120.0 * index / count), str(-180 + 360.0 * index / count))
+        for index in range(count)
+    ]
+
+
+def measure(dates, locations, compact):
+    """Calculates the events for every date and location, returning the number
+    of bytes and memory blocks held by the results.
+
+    Keyword arguments:
+    dates -- a list of YYYY-MM-DD strings.
+    locations -- a list of (lat, lon) tuples.
+    compact -- True to hold compact records, or False to hold dictionaries.
+    """
+
+    # Build any catalogs before measuring, so that only results are counted.
+    astronote.get_events_many(dates[0], locations[:1], compact=compact)
+
+    gc.collect()
+    tracemalloc.start()
+
+    results = [astronote.get_events_many(date, locations, compact=compact) for date in dates]
+
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    statistics = snapshot.statistics('filename')
+
+    size = sum(statistic.size for statistic in statistics)
+    blocks = sum(statistic.count for statistic in statistics)
+
+    del results
+
+    return size, blocks
+
+
+def main(days = 30, locations = 20):
+
+    dates = astronote.helpers.get_date_range('2017-01-01', '2017-12-31')[:days]
+    locations = get_locations(locations)
+    results = len(dates) * len(locations)
+
+    print('%d results (%d days x %d locations)' % (results, len(dates), len(locations)))
+    print('%-12s %14s %14s' % ('format', 'bytes/result', 'blocks/result'))
+
+    for name, compact in [('dict', False), ('compact', True)]:
+
+        size, blocks = measure(dates, locations, compact)
+        print('%-12s %14.0f %14.1f' % (name, float(size) / results, float(blocks) / results))
+
+
+if __name__ == '__main__':
+    main(*[int(argument) for argument in sys.argv[1:]])
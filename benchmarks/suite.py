@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+
+###############################################################################
+# Benchmark suite
+###############################################################################
+
+# Times `get_events` end to end and each subsystem (transits, separations, the
+# planetary event detectors, the Moon and meteor showers) in isolation, at
+# fixed dates and at temperate, tropical, polar and southern locations. The
+# number of times a body is computed is counted alongside the time taken, as
+# it does not vary between machines.
+#
+# Each result is compared with the baselines stored in `baselines.json`, and
+# any benchmark that is slower than its baseline (by more than TOLERANCE) or
+# computes bodies more often is reported as a regression.
+#
+# Usage: python benchmarks/suite.py [--save] [--check] [--repeat N] [names...]
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ephem
+import astronote
+from astronote import bodies, celestial, lunar, seasons, separations, transits
+
+
+# The file that baselines are stored in.
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# The proportion that a benchmark can be slower than its baseline before it is
+# reported as a regression. Times vary between runs (and machines), so only
+# large differences are reported.
+TOLERANCE = 0.25
+
+# The dates used by every benchmark: an equinox and both solstices, so that
+# the polar location covers days when the Sun never sets and never rises.
+DATES = ['2017-03-20', '2017-06-21', '2017-12-21']
+
+# The locations used by location dependent benchmarks, as (name, lat, lon).
+LOCATIONS = [
+    ('temperate', '51.5', '-0.1'),
+    ('tropical', '1.3', '103.8'),
+    ('polar', '78.2', '15.6'),
+    ('southern', '-33.9', '151.2')
+]
+
+# The names of the PyEphem body classes whose computations are counted.
+BODY_CLASSES = [
+    'Sun', 'Moon', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn', 'Uranus',
+    'Neptune', 'Pluto'
+]
+
+
+# A benchmark, where `func` performs the work being measured and `setup` (if
+# not None) is called before every run, e.g. to clear a table so that the time
+# taken to build it is measured.
+Benchmark = namedtuple('Benchmark', ['name', 'func', 'setup'])
+
+# The result of a benchmark, where `time` is the median number of milliseconds
+# taken by each run and `computes` is the number of bodies computed in a run.
+Result = namedtuple('Result', ['name', 'time', 'computes'])
+
+
+@contextmanager
+def count_computes():
+    """Counts every call to `compute` on bodies created within the `with`
+    block. Yields a list whose only item is the running count.
+
+    PyEphem's body types cannot be changed, so each is replaced (in the ephem
+    module) by a subclass that counts its calls. Bodies are created by looking
+    up these names when they are needed, so every body is counted.
+    """
+
+    counter = [0]
+    originals = dict((name, getattr(ephem, name)) for name in BODY_CLASSES)
+
+    def create_counted(body_class):
+
+        class CountedBody(body_class):
+
+            def compute(self, *args, **kwargs):
+                counter[0] += 1
+                return body_class.compute(self, *args, **kwargs)
+
+        CountedBody.__name__ = body_class.__name__
+
+        return CountedBody
+
+    for name, body_class in originals.items():
+        setattr(ephem, name, create_counted(body_class))
+
+    try:
+        yield counter
+    finally:
+        for name, body_class in originals.items():
+            setattr(ephem, name, body_class)
+
+
+def clear_tables():
+    """Removes every table that is built once per year, so that the next
+    request builds it again.
+    """
+
+    bodies._catalogs.clear()
+    lunar._phase_tables.clear()
+    lunar._apsis_tables.clear()
+    celestial._indexes.clear()
+    seasons._season_days.clear()
+    seasons._season_years.clear()
+
+
+def get_events_benchmark(lat, lon, engine):
+    """Returns a function that calculates the events on every date at a
+    location with a given transit engine.
+
+    Keyword arguments:
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    engine -- the name of the transit engine.
+    """
+
+    def run():
+
+        transits.configure(engine)
+
+        try:
+            for date in DATES:
+                astronote.get_events(date, lat, lon)
+        finally:
+            transits.configure()
+
+    return run
+
+
+def get_transits_benchmark(lat, lon):
+    """Returns a function that finds the rise and set times of every body on
+    every date at a location.
+
+    Keyword arguments:
+    lat -- a floating-point latitude string. (positive/negative = North/South)
+    lon -- a floating-point longitude string. (positive/negative = East/West)
+    """
+
+    def run():
+        for date in DATES:
+            for body in create_bodies():
+                transits.get_transit_times(body, date, lat, lon)
+
+    return run
+
+
+def create_bodies():
+    """Returns a list of a new PyEphem object for each body."""
+
+    return [getattr(ephem, name)() for name in BODY_CLASSES]
+
+
+def get_pairs():
+    """Returns a list of every pair of bodies (except the Sun)."""
+
+    every_body = create_bodies()[1:]
+
+    return [
+        (body1, body2)
+        for index, body1 in enumerate(every_body)
+        for body2 in every_body[index + 1:]
+    ]
+
+
+def is_min_separation():
+    """Checks every pair of bodies for a minimum separation on every date."""
+
+    for date in DATES:
+        with astronote.samples.request_cache():
+            for body1, body2 in get_pairs():
+                separations.is_min_separation(body1, body2, date)
+
+
+def get_min_separation():
+    """Finds the minimum separation of eight pairs of bodies on every date."""
+
+    for date in DATES:
+        for body1, body2 in get_pairs()[:8]:
+            separations.get_min_separation(body1, body2, date)
+
+
+def find_min_separations():
+    """Finds the minimum separations of every body at once on every date."""
+
+    for date in DATES:
+        with astronote.samples.request_cache():
+            separations.find_min_separations(create_bodies()[1:], date)
+
+
+def detect_planetary_events():
+    """Checks every planet for an opposition, conjunction and greatest
+    elongation on every date.
+    """
+
+    for date in DATES:
+        with astronote.samples.request_cache():
+            for planet in create_bodies()[2:]:
+                bodies.is_opposition(planet, date)
+                bodies.is_conjunction(planet, date)
+                bodies.is_elongation(planet, date)
+
+
+def build_catalog():
+    """Builds the planetary event catalog for a year."""
+
+    bodies.get_catalog(2017)
+
+
+def lunar_functions():
+    """Checks for a major phase, apogee and perigee and finds the next phase
+    on every date.
+    """
+
+    moon = ephem.Moon()
+
+    for date in DATES:
+        with astronote.samples.request_cache():
+            lunar.is_major_phase(date)
+            lunar.is_at_apogee(moon, date)
+            lunar.is_at_perigee(moon, date)
+            lunar.get_next_phase(date)
+
+
+def build_phase_table():
+    """Builds the Moon phase table for a year."""
+
+    lunar.get_phase_table(2017)
+
+
+def build_apsis_table():
+    """Builds the Moon apsis table for a year."""
+
+    lunar.get_apsis_table(2017)
+
+
+def get_meteor_showers():
+    """Finds the meteor showers on every date."""
+
+    for date in DATES:
+        celestial.get_meteor_showers(date)
+
+
+def build_meteor_shower_index():
+    """Builds the meteor shower index for a year."""
+
+    celestial.get_index(2017)
+
+
+def get_benchmarks():
+    """Returns a list of every Benchmark."""
+
+    benchmarks = []
+
+    for name, lat, lon in LOCATIONS:
+        benchmarks.append(Benchmark('get_events[%s]' % name, get_events_benchmark(lat, lon, 'solver'), None))
+        benchmarks.append(Benchmark('get_events[%s,sampled]' % name, get_events_benchmark(lat, lon, 'sampled'), None))
+
+    for name, lat, lon in LOCATIONS:
+        benchmarks.append(Benchmark('transits.get_transit_times[%s]' % name, get_transits_benchmark(lat, lon), None))
+
+    benchmarks += [
+        Benchmark('separations.is_min_separation', is_min_separation, None),
+        Benchmark('separations.get_min_separation', get_min_separation, None),
+        Benchmark('separations.find_min_separations', find_min_separations, None),
+        Benchmark('bodies.detectors', detect_planetary_events, None),
+        Benchmark('bodies.get_catalog[cold]', build_catalog, clear_tables),
+        Benchmark('lunar.functions', lunar_functions, None),
+        Benchmark('lunar.get_phase_table[cold]', build_phase_table, clear_tables),
+        Benchmark('lunar.get_apsis_table[cold]', build_apsis_table, clear_tables),
+        Benchmark('celestial.get_meteor_showers', get_meteor_showers, None),
+        Benchmark('celestial.get_index[cold]', build_meteor_shower_index, clear_tables)
+    ]
+
+    return benchmarks
+
+
+def run(benchmark, repeat):
+    """Runs a benchmark and returns its Result. Unless the benchmark has a
+    setup function, it is run once beforehand so that any tables it needs
+    are built before it is timed.
+
+    Keyword arguments:
+    benchmark -- a Benchmark.
+    repeat -- the number of times the benchmark is timed.
+    """
+
+    if benchmark.setup is None:
+        benchmark.func()
+
+    times = []
+
+    for index in range(repeat):
+
+        if benchmark.setup is not None:
+            benchmark.setup()
+
+        start = time.perf_counter()
+        benchmark.func()
+        times.append((time.perf_counter() - start) * 1000)
+
+    # Computations are counted in a separate run, so that the cost of
+    # counting is not included in the times.
+    if benchmark.setup is not None:
+        benchmark.setup()
+
+    with count_computes() as counter:
+        benchmark.func()
+
+    times.sort()
+
+    return Result(benchmark.name, times[len(times) // 2], counter[0])
+
+
+def load_baselines():
+    """Returns a dictionary of baselines keyed by benchmark name, each a
+    dictionary with `time` and `computes` keys.
+    """
+
+    if not os.path.exists(BASELINES):
+        return {}
+
+    with open(BASELINES) as baselines_file:
+        return json.load(baselines_file)
+
+
+def save_baselines(results):
+    """Stores the results as the new baselines.
+
+    Keyword arguments:
+    results -- a list of Results.
+    """
+
+    baselines = load_baselines()
+
+    for result in results:
+        baselines[result.name] = {
+            'time': round(result.time, 3),
+            'computes': result.computes
+        }
+
+    with open(BASELINES, 'w') as baselines_file:
+        json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+        baselines_file.write('\n')
+
+
+def get_regressions(result, baseline):
+    """Returns a list of strings describing how a result has regressed from
+    its baseline (which is empty if it has not).
+
+    Keyword arguments:
+    result -- a Result.
+    baseline -- a dictionary with `time` and `computes` keys, or None.
+    """
+
+    regressions = []
+
+    if baseline is None:
+        return regressions
+
+    if result.time > baseline['time'] * (1 + TOLERANCE):
+        regressions.append('slower')
+
+    if result.computes > baseline['computes']:
+        regressions.append('more computes')
+
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmarks astronote.')
+    parser.add_argument('names', nargs='*', help='only run benchmarks whose names contain one of these strings')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of times each benchmark is timed')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baselines')
+    parser.add_argument('--check', action='store_true', help='exit with an error if any benchmark regressed')
+    arguments = parser.parse_args()
+
+    baselines = load_baselines()
+    results = []
+    regressed = False
+
+    print('%-40s %10s %10s %10s %10s  %s' % ('benchmark', 'ms', 'base ms', 'computes', 'base', 'regressions'))
+
+    for benchmark in get_benchmarks():
+
+        if arguments.names and not any(name in benchmark.name for name in arguments.names):
+            continue
+
+        result = run(benchmark, arguments.repeat)
+        results.append(result)
+
+        baseline = baselines.get(result.name)
+        regressions = get_regressions(result, baseline)
+        regressed = regressed or bool(regressions)
+
+        print('%-40s %10.2f %10s %10d %10s  %s' % (
+            result.name,
+            result.time,
+            '%.2f' % baseline['time'] if baseline else '-',
+            result.computes,
+            baseline['computes'] if baseline else '-',
+            ', '.join(regressions)
+        ))
+
+    if arguments.save:
+        save_baselines(results)
+
+    if arguments.check and regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
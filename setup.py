@@ -23,6 +23,7 @@ URL = 'https://github.com/dfranklinau/astronote'
 EMAIL = 'me@danielfranklin.id.au'
 AUTHOR = 'Daniel Franklin'
 REQUIRED = [
+    'numpy',
     'pyephem==3.7.6.0'
 ]
 
@@ -82,7 +83,11 @@ setup(
     author_email=EMAIL,
     url=URL,
     packages=find_packages(exclude=('tests',)),
+    python_requires='>=3.7',
     install_requires=REQUIRED,
+    entry_points={
+        'console_scripts': ['astronote=astronote.cli:main'],
+    },
     include_package_data=True,
     license='MIT',
     classifiers=[
@@ -92,13 +97,13 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Topic :: Scientific/Engineering :: Astronomy',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.6',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Programming Language :: Python :: Implementation :: CPython',
         'Programming Language :: Python :: Implementation :: PyPy'
     ],
@@ -5,3 +5,5 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import astronote
+import astronote.cli
+import astronote.server
@@ -1,8 +1,32 @@
 # -*- coding: utf-8 -*-
 
 from .context import astronote
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextlib
+import http.client
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
 import ephem
+import numpy
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """A thread pool that counts the number of calls submitted to it."""
+
+    def __init__(self, *args, **kwargs):
+        ThreadPoolExecutor.__init__(self, *args, **kwargs)
+        self.submitted = 0
+
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return ThreadPoolExecutor.submit(self, *args, **kwargs)
 
 
 class SeasonMethods(unittest.TestCase):
@@ -47,6 +71,24 @@ class SeasonMethods(unittest.TestCase):
         self.assertEqual(None, not_equinox)
 
 
+    def test_get_season(self):
+        season = astronote.seasons.get_season('2016-06-20')
+
+        self.assertEqual(season.type, 'solstice')
+        self.assertEqual(season.name, 'june')
+        self.assertAlmostEqual(season.time, ephem.next_solstice('2016-06-01'), places=6)
+        self.assertIsNone(astronote.seasons.get_season('2016-06-21'))
+
+
+    def test_season_events(self):
+        events = astronote.get_events('2016-09-22')['events']
+        equinoxes = [event for event in events if event['type'] == 'equinox']
+
+        self.assertEqual(len(equinoxes), 1)
+        self.assertEqual(equinoxes[0]['data']['type'], 'september')
+        self.assertEqual(equinoxes[0]['data']['time']['day'], 22)
+
+
 class CelestialMethods(unittest.TestCase):
 
     def test_get_meteor_showers_return_value(self):
@@ -66,6 +108,55 @@ class CelestialMethods(unittest.TestCase):
         self.assertEqual(no_meteor_showers, [])
 
 
+    def test_get_meteor_showers_across_years(self):
+        showers = astronote.celestial.get_meteor_showers('2018-01-01')
+        self.assertEqual([shower['name'] for shower in showers], ['Quadrantids'])
+
+
+    def test_get_active_meteor_showers(self):
+        december = astronote.celestial.get_active_meteor_showers('2017-12-30')
+        january = astronote.celestial.get_active_meteor_showers('2018-01-10')
+        none = astronote.celestial.get_active_meteor_showers('2017-03-01')
+
+        self.assertEqual([shower.name for shower in december], ['Quadrantids'])
+        self.assertEqual([shower.name for shower in january], ['Quadrantids'])
+        self.assertEqual(none, [])
+
+
+    def test_get_active_meteor_showers_range(self):
+        days = astronote.celestial.get_active_meteor_showers_range('2017-12-20', '2018-01-13')
+
+        self.assertEqual(len(days), 25)
+
+        for date, showers in days:
+            self.assertEqual(showers, astronote.celestial.get_active_meteor_showers(date))
+
+
+    def test_load_meteor_showers(self):
+        path = os.path.join(tempfile.mkdtemp(), 'showers.json')
+
+        with open(path, 'w') as f:
+            json.dump([{'name': 'Test', 'start': [12, 30], 'peak': [1, 1], 'end': [1, 2], 'zhr': 5}], f)
+
+        try:
+            showers = astronote.celestial.load_meteor_showers(path)
+            active = astronote.celestial.get_active_meteor_showers('2017-12-31')
+        finally:
+            astronote.celestial.set_meteor_showers(astronote.celestial.METEOR_SHOWERS)
+
+        self.assertEqual(showers[0].start, (12, 30))
+        self.assertEqual([shower.name for shower in active], ['Test'])
+
+
+    def test_get_index_threads(self):
+        astronote.celestial._indexes.pop(2032, None)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            indexes = list(executor.map(astronote.celestial.get_index, [2032] * 4))
+
+        self.assertTrue(all(index is indexes[0] for index in indexes))
+
+
 class TransitMethods(unittest.TestCase):
 
     def setUp(self):
@@ -109,6 +200,111 @@ class TransitMethods(unittest.TestCase):
         self.assertIsNone(invalid)
 
 
+    def assertSameTransits(self, transits1, transits2, seconds = 2):
+        self.assertEqual([transit['type'] for transit in transits1], [transit['type'] for transit in transits2])
+
+        for transit1, transit2 in zip(transits1, transits2):
+
+            if isinstance(transit1['time'], dict):
+                time1 = ephem.Date(tuple(transit1['time'][key] for key in ['year', 'month', 'day', 'hour', 'minute', 'second']))
+                time2 = ephem.Date(tuple(transit2['time'][key] for key in ['year', 'month', 'day', 'hour', 'minute', 'second']))
+
+                self.assertLessEqual(abs(time1 - time2), seconds * ephem.second)
+
+            else:
+                self.assertEqual(transit1['time'], transit2['time'])
+
+
+    def test_sampled_horizon(self):
+        bodies = [ephem.Sun(), ephem.Moon(), ephem.Mercury(), ephem.Jupiter()]
+        locations = [('0', '0'), ('-27.7', '152.7'), ('51.5', '0'), ('78.2', '15.6')]
+
+        for date in ['2017-01-01', '2017-06-21', '2017-10-05']:
+            for lat, lon in locations:
+
+                horizon = astronote.transits.SampledHorizon(bodies, date, lat, lon)
+
+                for body in bodies:
+
+                    self.assertSameTransits(
+                        astronote.transits.get_transit_times(body, date, lat, lon),
+                        astronote.transits.get_transit_times(body, date, lat, lon, horizon)
+                    )
+
+
+    def test_sampled_horizon_grazing(self):
+        # The Moon barely clears the horizon here, so a crossing is solved with
+        # the secant method rather than Newton's method.
+        moon = ephem.Moon()
+        horizon = astronote.transits.SampledHorizon([moon], '2017-03-12', '85', '0')
+
+        self.assertSameTransits(
+            astronote.transits.get_transit_times(ephem.Moon(), '2017-03-12', '85', '0'),
+            astronote.transits.get_transit_times(moon, '2017-03-12', '85', '0', horizon)
+        )
+
+
+    def test_sampled_horizon_always_up(self):
+        sun = ephem.Sun()
+        horizon = astronote.transits.SampledHorizon([sun], '2017-06-21', '78.2', '15.6')
+        transits = astronote.transits.get_transit_times(sun, '2017-06-21', '78.2', '15.6', horizon)
+
+        self.assertEqual(transits, [
+            {'type': 'rise', 'time': 'AlwaysUp'},
+            {'type': 'set', 'time': 'AlwaysUp'}
+        ])
+
+
+    def test_sampled_horizon_refines_requested_crossings(self):
+        sun = ephem.Sun()
+        horizon = astronote.transits.SampledHorizon([sun], '2017-10-05', '51.5', '0')
+        astronote.transits.get_transit_times(sun, '2017-10-05', '51.5', '0', horizon)
+
+        self.assertGreater(len(horizon.crossings['Sun']), 4)
+        self.assertEqual(horizon.refinements, 4)
+
+
+    def test_iter_transits(self):
+        sun = ephem.Sun()
+        transits = list(astronote.transits.iter_transits(sun, '51.5', '0', '2017-10-01', '2017-10-07'))
+
+        self.assertEqual(len(transits), 14)
+        self.assertEqual([transit['type'] for transit in transits], ['rise', 'set'] * 7)
+
+        for transit in transits[:2]:
+            self.assertIn(transit, astronote.transits.get_transit_times(sun, '2017-10-01', '51.5', '0'))
+
+
+    def test_iter_transits_yields_each_transit_once(self):
+        transits = list(astronote.transits.iter_transits(ephem.Moon(), '-27.7', '152.7', '2017-01-01', '2017-04-30'))
+        times = [tuple(transit['time'].values()) for transit in transits]
+
+        self.assertEqual(times, sorted(set(times)))
+
+        for transit1, transit2 in zip(transits, transits[1:]):
+            self.assertNotEqual(transit1['type'], transit2['type'])
+
+
+    def test_iter_transits_always_up(self):
+        transits = list(astronote.transits.iter_transits(ephem.Sun(), '78.2', '15.6', '2017-06-01', '2017-06-30'))
+        self.assertEqual(transits, [])
+
+
+    def test_configure(self):
+        self.assertIsNone(astronote.transits.get_horizon([ephem.Sun()], self.date, self.lat, self.lon))
+
+        with self.assertRaises(ValueError):
+            astronote.transits.configure('unknown')
+
+        astronote.transits.configure('sampled')
+
+        try:
+            horizon = astronote.transits.get_horizon([ephem.Sun()], self.date, self.lat, self.lon)
+            self.assertIsInstance(horizon, astronote.transits.SampledHorizon)
+        finally:
+            astronote.transits.configure()
+
+
 class MoonMethods(unittest.TestCase):
 
     def setUp(self):
@@ -120,6 +316,22 @@ class MoonMethods(unittest.TestCase):
         self.assertEqual(full_moon, 'full_moon')
 
 
+    def test_get_next_phase(self):
+        full_moon = astronote.lunar.get_next_phase('2017-10-01', 'full_moon')
+        any_phase = astronote.lunar.get_next_phase('2017-12-31')
+
+        self.assertEqual(full_moon.name, 'full_moon')
+        self.assertEqual(astronote.helpers.set_date_to_midnight(ephem.Date(full_moon.time)), ephem.Date('2017-10-05'))
+        self.assertAlmostEqual(any_phase.time, ephem.next_full_moon('2017-12-31'), places=6)
+
+
+    def test_get_month_phases(self):
+        phases = astronote.lunar.get_month_phases(2017, 12)
+
+        self.assertEqual([phase.name for phase in phases], ['full_moon', 'last_quarter', 'new_moon', 'first_quarter'])
+        self.assertTrue(all(ephem.Date('2017-12-01') <= phase.time < ephem.Date('2018-01-01') for phase in phases))
+
+
     def test_is_moon_at_apogee(self):
         is_at_apogee = astronote.lunar.is_at_apogee(self.moon, '2017-10-25')
         is_not_apogee = astronote.lunar.is_at_apogee(self.moon, '2017-10-15')
@@ -134,6 +346,63 @@ class MoonMethods(unittest.TestCase):
         self.assertFalse(is_not_perigee)
 
 
+    def test_get_apsis_table(self):
+        times, apsides = astronote.lunar.get_apsis_table(2017)
+        perigee, apogee = apsides[0], apsides[1]
+
+        self.assertEqual(times, sorted(times))
+        self.assertEqual([apsis.type for apsis in apsides[:4]], ['perigee', 'apogee', 'perigee', 'apogee'])
+        self.assertAlmostEqual(perigee.time, ephem.Date('2017-01-10 06:01'), delta=5 * ephem.minute)
+        self.assertAlmostEqual(perigee.distance, 363240, delta=5)
+        self.assertAlmostEqual(apogee.time, ephem.Date('2017-01-22 00:13'), delta=5 * ephem.minute)
+        self.assertAlmostEqual(apogee.distance, 404913, delta=5)
+
+
+    def test_get_apsides(self):
+        apsides = astronote.lunar.get_apsides(ephem.Date('2017-12-25'), ephem.Date('2018-01-05'))
+        self.assertEqual(len(apsides), 1)
+        self.assertEqual(apsides[0].type, 'perigee')
+        self.assertEqual(ephem.Date(apsides[0].time).datetime().strftime('%Y-%m-%d'), '2018-01-01')
+
+
+    def test_find_apsides_boundary(self):
+        perigee = astronote.lunar.get_apsides(ephem.Date('2017-12-25'), ephem.Date('2018-01-05'))[0]
+        boundary = ephem.Date(perigee.time)
+
+        # A perigee exactly on the boundary of two searches is only found by
+        # the search that starts at it.
+        before = astronote.lunar.find_apsides(ephem.Moon(), 'perigee', ephem.Date(boundary - 40), boundary)
+        after = astronote.lunar.find_apsides(ephem.Moon(), 'perigee', boundary, ephem.Date(boundary + 40))
+
+        found = [apsis for apsis in before + after if abs(apsis.time - perigee.time) < ephem.minute]
+
+        self.assertEqual(len(found), 1)
+
+
+    def test_get_apsis(self):
+        self.assertEqual(astronote.lunar.get_apsis('2017-12-04').type, 'perigee')
+        self.assertIsNone(astronote.lunar.get_apsis('2017-12-04', 'apogee'))
+        self.assertIsNone(astronote.lunar.get_apsis('2017-12-10'))
+
+
+    def test_is_supermoon(self):
+        self.assertTrue(astronote.lunar.is_supermoon('2017-12-03'))
+        self.assertFalse(astronote.lunar.is_supermoon('2017-06-09'))
+        self.assertFalse(astronote.lunar.is_supermoon('2017-12-10'))
+
+
+    def test_get_events_apsis(self):
+        moon = astronote.get_events('2017-12-04', '51.5', '0', include={'moon'})['moon']
+        self.assertTrue(moon['perigee'])
+        self.assertEqual(moon['apsis']['type'], 'perigee')
+        self.assertEqual(moon['apsis']['time']['hour'], 8)
+        self.assertAlmostEqual(moon['apsis']['distance'], 357492, delta=5)
+
+        moon = astronote.get_events('2017-12-03', '51.5', '0', include={'moon'})['moon']
+        self.assertTrue(moon['supermoon'])
+        self.assertNotIn('apsis', moon)
+
+
 class BodyMethods(unittest.TestCase):
 
     def test_is_opposition(self):
@@ -156,6 +425,77 @@ class BodyMethods(unittest.TestCase):
         self.assertFalse(elongation2)
 
 
+    def test_get_catalog_events(self):
+        start = ephem.Date('2017-07-30')
+        events = astronote.bodies.get_catalog_events(start, start + 1)
+
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].type, 'elongation')
+        self.assertEqual(events[0].body, 'mercury')
+        self.assertEqual(events[0].subtype, 'east')
+        self.assertTrue(start <= events[0].time < start + 1)
+
+
+    def test_get_catalog_events_conjunction_type(self):
+        inferior = astronote.bodies.get_catalog_events('2017-03-25', '2017-03-26')
+        superior = astronote.bodies.get_catalog_events('2017-10-08', '2017-10-09')
+
+        self.assertEqual([(e.type, e.body, e.subtype) for e in inferior], [('conjunction', 'venus', 'inferior')])
+        self.assertEqual([(e.type, e.body, e.subtype) for e in superior], [('conjunction', 'mercury', 'superior')])
+
+
+    def test_get_catalog_events_across_years(self):
+        events = astronote.bodies.get_catalog_events('2017-12-21', '2018-01-10')
+        self.assertEqual(
+            [(e.type, e.body) for e in events],
+            [('conjunction', 'saturn'), ('elongation', 'mercury'), ('conjunction', 'venus'), ('conjunction', 'pluto')]
+        )
+
+
+    def test_get_catalog_threads(self):
+        find_planetary_events = astronote.bodies.find_planetary_events
+        calls = []
+
+        def find_counted(*args):
+            calls.append(args)
+            return find_planetary_events(*args)
+
+        astronote.bodies.find_planetary_events = find_counted
+        astronote.bodies._catalogs.pop(2031, None)
+
+        try:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                catalogs = list(executor.map(astronote.bodies.get_catalog, [2031] * 4))
+        finally:
+            astronote.bodies.find_planetary_events = find_planetary_events
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(catalog is catalogs[0] for catalog in catalogs))
+
+
+    def test_get_greatest_elongations(self):
+        elongations = astronote.bodies.get_greatest_elongations(ephem.Date('2017-01-01'), ephem.Date('2018-01-01'))
+
+        self.assertEqual(len(elongations), 8)
+        self.assertEqual([e.body for e in elongations].count('venus'), 2)
+
+        venus = astronote.bodies.get_greatest_elongations(ephem.Date('2017-01-01'), ephem.Date('2018-01-01'), 'Venus')
+        self.assertEqual([(e.subtype, round(e.angle, 1)) for e in venus], [('east', 47.1), ('west', 45.9)])
+
+        mercury = astronote.bodies.get_greatest_elongations(ephem.Date('2017-04-01'), ephem.Date('2017-04-02'))[0]
+        self.assertAlmostEqual(mercury.time, ephem.Date('2017-04-01 10:18'), delta=5 * ephem.minute)
+        self.assertAlmostEqual(mercury.angle, 19.0, delta=0.05)
+
+
+    def test_get_planetary_events_elongation(self):
+        events = astronote.get_events('2017-04-01', '0', '0', include={'planetary'})['events']
+
+        self.assertEqual(events[0]['type'], 'elongation')
+        self.assertEqual(events[0]['data']['type'], 'east')
+        self.assertEqual(events[0]['data']['angle'], 19.0)
+        self.assertEqual(events[0]['data']['time']['hour'], 10)
+
+
 class SeparationMethods(unittest.TestCase):
 
     def test_get_separation(self):
@@ -186,9 +526,1101 @@ class SeparationMethods(unittest.TestCase):
         self.assertAlmostEqual(separation, 0.2, places=1)
 
 
+    def test_get_closest_approach(self):
+        body1 = ephem.Venus()
+        body2 = ephem.Mars()
+        date = ephem.Date('2017-10-05')
+        time, separation = astronote.separations.get_closest_approach(body1, body2, date)
+
+        self.assertTrue(date <= time < date + 1)
+        self.assertAlmostEqual(separation, 0.2056, places=3)
+
+        for offset in (-ephem.minute, ephem.minute):
+            self.assertLess(separation, astronote.separations.get_separation(body1, body2, time + offset))
+
+
+    def test_find_min_separations(self):
+        bodies = [ephem.Moon(), ephem.Venus(), ephem.Mars(), ephem.Jupiter()]
+        pairs = astronote.separations.find_min_separations(bodies, '2017-10-05')
+
+        expected = []
+
+        for index, body1 in enumerate(bodies):
+            for body2 in bodies[index + 1:]:
+                if astronote.separations.is_min_separation(body1, body2, '2017-10-05'):
+                    expected.append((body1, body2))
+
+        self.assertIn((bodies[1], bodies[2]), pairs)
+        self.assertEqual(pairs, expected)
+
+
+    def test_get_separation_matrix(self):
+        body1 = ephem.Venus()
+        body2 = ephem.Mars()
+        time = ephem.Date('2017-10-06')
+        positions = astronote.samples.sample_positions([body1, body2], [time])
+        matrix = astronote.separations.get_separation_matrix(positions.ra, positions.dec)
+
+        self.assertEqual(matrix.shape, (2, 2, 1))
+        self.assertAlmostEqual(matrix[0, 1, 0], astronote.separations.get_separation(body1, body2, time))
+        self.assertAlmostEqual(matrix[0, 0, 0], 0)
+
+
+class SolverMethods(unittest.TestCase):
+
+    def test_find_root(self):
+        root = astronote.solvers.find_root(lambda time: time - 43000.25, 43000, 43001)
+        self.assertAlmostEqual(root, 43000.25, delta=ephem.second)
+
+
+    def test_find_sign_changes(self):
+        changes = astronote.solvers.find_sign_changes(numpy.array([[1, -1, -2, 3], [1, 2, 3, 4]]))
+        self.assertEqual(changes.tolist(), [[True, False, True], [False, False, False]])
+
+
+    def test_find_maxima(self):
+        maxima = astronote.solvers.find_maxima(numpy.array([1, 3, 2, 2, 5, 4]))
+        self.assertEqual(maxima.tolist(), [False, True, False, False, True, False])
+
+
+    def test_find_minimum(self):
+        time, value = astronote.solvers.find_minimum(lambda time: (time - 43000.3) ** 2 + 5, 43000, 43001)
+        self.assertAlmostEqual(time, 43000.3, delta=ephem.second)
+        self.assertAlmostEqual(value, 5)
+
+
+
+class SampleMethods(unittest.TestCase):
+
+    def test_cache_reuses_samples(self):
+        cache = astronote.samples.SampleCache()
+        moon = ephem.Moon()
+
+        with astronote.samples.use_cache(cache):
+            sample1 = astronote.samples.get_sample(moon, '2017-01-01')
+            sample2 = astronote.samples.get_sample(moon, ephem.Date('2017-01-01'))
+
+        self.assertIs(sample1, sample2)
+        self.assertEqual(len(cache.samples), 1)
+
+
+    def test_cache_stats(self):
+        cache = astronote.samples.SampleCache()
+
+        with astronote.samples.use_cache(cache):
+            astronote.get_events('2017-10-05', '-27.7', '152.7')
+            astronote.get_events('2017-10-05', '-27.7', '152.7')
+
+        stats = cache.get_stats()
+        self.assertGreater(stats['hits'], 0)
+        self.assertEqual(stats['misses'], stats['size'])
+
+
+    def test_request_cache(self):
+        cache = astronote.samples.SampleCache()
+
+        with astronote.samples.request_cache() as request_cache:
+            self.assertIsInstance(request_cache, astronote.samples.SampleCache)
+
+        with astronote.samples.use_cache(cache):
+            with astronote.samples.request_cache() as request_cache:
+                self.assertIs(request_cache, cache)
+
+
+    def test_sample_positions(self):
+        moon = ephem.Moon()
+        mars = ephem.Mars()
+        times = [ephem.Date('2017-01-01'), ephem.Date('2017-01-02'), ephem.Date('2017-01-03')]
+        positions = astronote.samples.sample_positions([moon, mars], times)
+
+        self.assertEqual(positions.ra.shape, (2, 3))
+        self.assertEqual(positions.earth_distance[0, 1], astronote.samples.get_sample(moon, times[1]).earth_distance)
+        self.assertEqual(positions.elong[1, 2], astronote.samples.get_sample(mars, times[2]).elong)
+
+
+    def test_discard_before(self):
+        cache = astronote.samples.SampleCache()
+        moon = ephem.Moon()
+
+        with astronote.samples.use_cache(cache):
+            astronote.samples.get_sample(moon, '2017-01-01')
+            astronote.samples.get_sample(moon, '2017-01-02')
+
+        cache.discard_before(ephem.Date('2017-01-02'))
+        self.assertEqual(list(cache.samples), [('Moon', float(ephem.Date('2017-01-02')))])
+
+
+class CoreMethods(unittest.TestCase):
+
+    def test_get_events_range(self):
+        events = astronote.get_events_range('2017-10-04', '2017-10-06', '-27.7', '152.7')
+
+        self.assertEqual([date for date, _ in events], ['2017-10-04', '2017-10-05', '2017-10-06'])
+
+        for date, day_events in events:
+            self.assertEqual(day_events, astronote.get_events(date, '-27.7', '152.7'))
+
+
+    def test_get_events_many(self):
+        locations = [('-27.7', '152.7'), ('51.5', '0'), ('78.2', '15.6')]
+        events = astronote.get_events_many('2017-10-05', locations)
+
+        self.assertEqual(len(events), len(locations))
+
+        for (lat, lon), location_events in zip(locations, events):
+            self.assertEqual(location_events, astronote.get_events('2017-10-05', lat, lon))
+
+
+    def test_get_events_sampled_transits(self):
+        events = astronote.get_events('2017-10-05', '51.5', '0')
+        astronote.transits.configure('sampled')
+
+        try:
+            sampled_events = astronote.get_events('2017-10-05', '51.5', '0')
+        finally:
+            astronote.transits.configure()
+
+        self.assertEqual(sampled_events['events'], events['events'])
+        self.assertEqual(len(sampled_events['planets']), len(events['planets']))
+        self.assertEqual(len(sampled_events['sun']['transits']), len(events['sun']['transits']))
+
+
+    def test_get_events_include(self):
+        events = astronote.get_events('2017-10-05', '51.5', '0')
+        sun_and_moon = astronote.get_events('2017-10-05', '51.5', '0', include={'sun', 'moon'})
+
+        self.assertEqual(list(sun_and_moon), ['sun', 'moon'])
+        self.assertEqual(sun_and_moon['sun'], events['sun'])
+        self.assertEqual(sun_and_moon['moon'], events['moon'])
+
+
+    def test_get_events_include_event_sections(self):
+        events = astronote.get_events('2017-10-05', '51.5', '0', include=['separations'])
+
+        self.assertEqual(list(events), ['events'])
+        self.assertTrue(events['events'])
+        self.assertEqual(set(event['type'] for event in events['events']), {'separation'})
+
+
+    def test_get_events_include_unknown(self):
+        with self.assertRaises(ValueError):
+            astronote.get_events('2017-10-05', '51.5', '0', include={'comets'})
+
+
+    def test_get_events_lazy(self):
+        events = astronote.get_events('2017-10-05', '51.5', '0', lazy=True)
+
+        self.assertIsInstance(events, astronote.LazyEvents)
+        self.assertEqual(list(events), ['sun', 'moon', 'planets', 'events'])
+        self.assertEqual(events._values, {})
+
+        events['sun']
+
+        self.assertEqual(list(events._values), ['sun'])
+        self.assertEqual(dict(events), astronote.get_events('2017-10-05', '51.5', '0'))
+
+
+    def test_get_events_lazy_include(self):
+        events = astronote.get_events('2017-10-05', '51.5', '0', include={'moon'}, lazy=True)
+
+        self.assertEqual(len(events), 1)
+
+        with self.assertRaises(KeyError):
+            events['sun']
+
+
+    def test_get_events_range_include(self):
+        events = astronote.get_events_range('2017-10-04', '2017-10-05', '51.5', '0', include={'sun'})
+
+        for date, day_events in events:
+            self.assertEqual(day_events, astronote.get_events(date, '51.5', '0', include={'sun'}))
+
+
+    def test_iter_events(self):
+        events = astronote.iter_events('2017-10-04', '2017-10-06', '-27.7', '152.7')
+
+        self.assertEqual(next(events), ('2017-10-04', astronote.get_events('2017-10-04', '-27.7', '152.7')))
+        self.assertIsNone(getattr(astronote.samples._local, 'cache', None))
+        self.assertEqual([date for date, _ in events], ['2017-10-05', '2017-10-06'])
+        self.assertEqual(
+            list(astronote.iter_events('2017-10-04', '2017-10-06', '-27.7', '152.7', include={'moon'}, compact=True)),
+            astronote.get_events_range('2017-10-04', '2017-10-06', '-27.7', '152.7', include={'moon'}, compact=True)
+        )
+
+
+    def test_get_events_many_copies_events(self):
+        events = astronote.get_events_many('2017-10-05', [('0', '0'), ('10', '10')])
+        events[0]['events'][0]['data']['angle'] = None
+
+        self.assertIsNotNone(events[1]['events'][0]['data']['angle'])
+
+
+    def test_moon_phase_percent(self):
+        moon = ephem.Moon()
+        moon.compute('2017-01-01')
+        events = astronote.get_events('2017-01-01', '51.5', '0')
+
+        self.assertEqual(events['moon']['phase']['percent'], int(round(moon.moon_phase * 100, 0)))
+
+
+class CacheMethods(unittest.TestCase):
+
+    def tearDown(self):
+        astronote.cache.configure(enabled=False)
+
+
+    def test_lru_cache(self):
+        cache = astronote.cache.LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.75)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['size'], 2)
+
+
+    def test_lru_cache_ttl(self):
+        cache = astronote.cache.LRUCache(ttl=0)
+        cache.set('a', 1)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get_stats()['expirations'], 1)
+
+
+    def test_quantize(self):
+        self.assertEqual(astronote.cache.quantize('51.5074', 0.01), '51.510000')
+        self.assertEqual(astronote.cache.quantize('-0.1', 0.25), '0.000000')
+        self.assertEqual(astronote.cache.quantize('-27.4698', 0.5), '-27.500000')
+        self.assertEqual(astronote.cache.quantize('0.00001', 0.00001), '0.000010')
+        self.assertEqual(astronote.cache.quantize('0.00002', 0.00001), '0.000020')
+
+        astronote.cache.configure(precision=None)
+        self.assertEqual(astronote.cache.quantize('51.5074'), '51.5074')
+
+
+    def test_get_events_cached(self):
+        events = astronote.get_events('2017-10-05', '51.51', '-0.13')
+
+        astronote.cache.configure(precision=0.01)
+        cached_events = astronote.get_events('2017-10-05', '51.5074', '-0.1278')
+        cached_events['sun'] = None
+
+        self.assertEqual(astronote.get_events('2017-10-05', '51.5099', '-0.1301'), events)
+
+        stats = astronote.cache.get_stats()
+        self.assertEqual(stats['results']['hits'], 1)
+        self.assertEqual(stats['results']['misses'], 1)
+
+
+    def test_get_events_cached_geocentric(self):
+        astronote.cache.configure()
+        events = astronote.get_events('2017-10-05', '-27.7', '152.7')
+        astronote.get_events('2017-10-05', '51.5', '0')
+        astronote.get_events('2017-10-05', '51.5', '0', include={'sun'})
+
+        stats = astronote.cache.get_stats()
+        self.assertEqual(stats['results']['size'], 3)
+        self.assertEqual(stats['geocentric']['hits'], 1)
+        self.assertEqual(stats['geocentric']['misses'], 2)
+
+        self.assertEqual(events['events'], astronote.get_events('2017-10-05', '51.5', '0')['events'])
+
+
+    def test_invalidate(self):
+        astronote.cache.configure()
+        astronote.get_events('2017-10-05', '51.5', '0')
+        astronote.get_events('2017-10-06', '51.5', '0')
+
+        self.assertEqual(astronote.cache.invalidate('2017-10-05'), 2)
+        self.assertEqual(astronote.cache.get_stats()['results']['size'], 1)
+        self.assertEqual(astronote.cache.invalidate(), 2)
+
+        astronote.cache.configure(enabled=False)
+
+        self.assertIsNone(astronote.cache.get_stats())
+        self.assertEqual(astronote.cache.invalidate(), 0)
+
+
+class StoreMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.schema_version = astronote.store.SCHEMA_VERSION
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'events.db')
+        self.sections = ['moon', 'planetary', 'separations', 'meteor_showers', 'seasons']
+
+
+    def tearDown(self):
+        astronote.store.configure(None)
+        astronote.store.SCHEMA_VERSION = self.schema_version
+
+        os.remove(self.path)
+        os.rmdir(self.directory)
+
+
+    def test_get_and_set(self):
+        store = astronote.store.GeocentricStore(self.path)
+        store.set('2017-10-05', self.sections, {'events': [], 'moon': None})
+
+        self.assertEqual(store.get('2017-10-05', reversed(self.sections)), {'events': [], 'moon': None})
+        self.assertIsNone(store.get('2017-10-05', ['seasons']))
+        self.assertEqual(store.get_stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+        store.close()
+
+
+    def test_schema_version(self):
+        store = astronote.store.GeocentricStore(self.path)
+        store.set('2017-10-05', self.sections, {'events': []})
+        store.close()
+
+        store = astronote.store.GeocentricStore(self.path)
+        self.assertIsNotNone(store.get('2017-10-05', self.sections))
+        store.close()
+
+        astronote.store.SCHEMA_VERSION += 1
+
+        store = astronote.store.GeocentricStore(self.path)
+        self.assertIsNone(store.get('2017-10-05', self.sections))
+        store.close()
+
+
+    def test_get_events_reads_through(self):
+        events = astronote.get_events('2017-10-05', '51.5', '0')
+
+        astronote.store.configure(self.path)
+
+        self.assertEqual(astronote.get_events('2017-10-05', '51.5', '0'), events)
+        self.assertEqual(astronote.get_events('2017-10-05', '-27.7', '152.7')['events'], events['events'])
+        self.assertEqual(astronote.store.get_store().get_stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+
+    def test_reconnect_in_new_process(self):
+        store = astronote.store.GeocentricStore(self.path)
+        store.set('2017-10-05', self.sections, {'events': []})
+        connection = store.connection
+
+        # A store used by a forked process opens its own connection.
+        store.pid = None
+
+        self.assertEqual(store.get('2017-10-05', self.sections), {'events': []})
+        self.assertIsNot(store.connection, connection)
+
+        connection.close()
+        store.close()
+
+
+    def test_get_events_range_workers(self):
+        astronote.store.configure(self.path)
+
+        try:
+            events = astronote.get_events_range('2017-10-01', '2017-10-20', '51.5', '0', workers=2)
+        finally:
+            astronote.parallel.shutdown()
+
+        store = astronote.store.get_store()
+
+        self.assertEqual(store.get_stats()['size'], 20)
+        self.assertEqual(astronote.get_events('2017-10-05', '51.5', '0'), events[4][1])
+        self.assertEqual(store.get_stats()['hits'], 1)
+
+
+    def test_prefill_store(self):
+        with self.assertRaises(ValueError):
+            astronote.prefill_store(2017, 2017)
+
+        astronote.store.configure(self.path)
+        store = astronote.store.get_store()
+
+        # Store every day except the last three, so only those are calculated.
+        dates = astronote.helpers.get_date_range('2017-01-01', '2017-12-28')
+        store.set_many([(date, {'events': []}) for date in dates], self.sections)
+
+        self.assertEqual(astronote.prefill_store(2017, 2017), 3)
+        self.assertEqual(astronote.prefill_store(2017, 2017), 0)
+        self.assertEqual(store.get('2017-12-31', self.sections), astronote.core._get_geocentric_events(
+            astronote.core._create_bodies(astronote.helpers.define_location('2017-12-31', '0', '0')),
+            '2017-12-31'
+        ))
+
+
+class RecordMethods(unittest.TestCase):
+
+    def test_timestamp(self):
+        date = ephem.Date('2017-10-05 18:40:12.7')
+        timestamp = astronote.records.Timestamp(date)
+
+        self.assertEqual(timestamp, float(date))
+        self.assertEqual(timestamp.to_date(), date)
+        self.assertEqual(timestamp.to_dict(), astronote.helpers.split_date(date))
+
+
+    def test_transit(self):
+        date = ephem.Date('2017-10-05 18:40:12')
+
+        self.assertEqual(
+            astronote.transits.get_transit_record('set', date).to_dict(),
+            astronote.transits.format_transit_time('set', date)
+        )
+        self.assertEqual(
+            astronote.transits.get_transit_record('rise', 'NeverUp').to_dict(),
+            {'type': 'rise', 'time': 'NeverUp'}
+        )
+
+
+    def test_event(self):
+        date = ephem.Date('2017-10-05 18:40:12')
+        event = astronote.records.Event('conjunction', body='venus', time=astronote.records.Timestamp(date), subtype='superior')
+
+        self.assertEqual(event.to_dict(), astronote.helpers.create_event('conjunction', {
+            'body': 'venus',
+            'time': astronote.helpers.split_date(date),
+            'type': 'superior'
+        }))
+        self.assertEqual(astronote.records.load_event(json.loads(json.dumps(event))), event)
+
+
+    def test_get_events_compact(self):
+        events = astronote.get_events('2017-06-21', '51.5', '0')
+        compact_events = astronote.get_events('2017-06-21', '51.5', '0', compact=True)
+
+        self.assertIsInstance(compact_events['sun']['transits'][0], astronote.records.Transit)
+        self.assertIsInstance(compact_events['events'][0], astronote.records.Event)
+
+        self.assertEqual([transit.to_dict() for transit in compact_events['moon']['transits']], events['moon']['transits'])
+        self.assertEqual([event.to_dict() for event in compact_events['events']], events['events'])
+
+        for planet, compact_planet in zip(events['planets'], compact_events['planets']):
+            self.assertEqual([transit.to_dict() for transit in compact_planet['transits']], planet['transits'])
+
+
+class ExportMethods(unittest.TestCase):
+
+    def test_iter_rows(self):
+        rows = list(astronote.export.iter_rows('2017-01-01', '2017-01-04', '51.5', '-0.1', include=['moon', 'separations', 'meteor_showers']))
+
+        self.assertEqual(rows, sorted(rows, key=astronote.export._get_row_key))
+
+        events = astronote.get_events_range('2017-01-01', '2017-01-04', '51.5', '-0.1', include=['separations', 'meteor_showers'], compact=True)
+        event_rows = [row for row in rows if row.type not in ['rise', 'set']]
+
+        self.assertEqual(
+            sorted(event_rows),
+            sorted(astronote.export.get_event_row(date, event) for date, day in events for event in day['events'])
+        )
+
+        moon = ephem.Moon()
+        transits = list(astronote.transits.iter_transits(moon, '51.5', '-0.1', '2017-01-01', '2017-01-04', compact=True))
+        transit_rows = [row for row in rows if row.type in ['rise', 'set']]
+
+        self.assertEqual([(row.type, row.time) for row in transit_rows], list(transits))
+        self.assertEqual(set(row.body1 for row in transit_rows), set(['moon']))
+
+        for row in transit_rows:
+            self.assertEqual(row.date, row.time.to_date().datetime().strftime('%Y-%m-%d'))
+
+
+    def test_get_array(self):
+        array = astronote.export.get_array('2017-01-03', '2017-01-03', include=['separations', 'meteor_showers'])
+
+        self.assertEqual(array.dtype, astronote.export.DTYPE)
+        self.assertEqual(list(array['type']), ['meteor_shower', 'separation', 'separation'])
+        self.assertEqual(list(array['body2']), ['', 'neptune', 'mars'])
+        self.assertTrue(numpy.isnan(array['angle'][0]))
+        self.assertTrue(numpy.isnat(array['time'][0]))
+        self.assertEqual(array['date'][1], numpy.datetime64('2017-01-03'))
+
+        time = astronote.separations.get_closest_approach(ephem.Moon(), ephem.Mars(), '2017-01-03')[0]
+
+        self.assertEqual(array['angle'][2], 0.23)
+        self.assertEqual(
+            array['time'][2].astype('datetime64[s]'),
+            numpy.datetime64(ephem.Date(time).datetime().replace(microsecond=0))
+        )
+
+
+    def test_write(self):
+        rows = list(astronote.export.iter_rows('2017-06-21', '2017-06-21', include=['seasons']))
+
+        csv_file = io.StringIO(newline='')
+        json_file = io.StringIO()
+
+        self.assertEqual(astronote.export.write_csv(csv_file, rows), 1)
+        self.assertEqual(astronote.export.write_ndjson(json_file, rows), 1)
+
+        time = astronote.helpers.split_date(rows[0].time.to_date())
+        time = '2017-06-21T%02d:%02d:%02dZ' % (time['hour'], time['minute'], time['second'])
+
+        self.assertEqual(csv_file.getvalue().splitlines(), [
+            'date,type,subtype,body1,body2,name,angle,time',
+            '2017-06-21,solstice,june,,,,,' + time
+        ])
+        self.assertEqual(json.loads(json_file.getvalue()), {
+            'date': '2017-06-21',
+            'type': 'solstice',
+            'subtype': 'june',
+            'time': time
+        })
+
+
+class InstrumentationMethods(unittest.TestCase):
+
+    def test_record(self):
+        astronote.get_events('2017-06-21', '51.5', '0')
+
+        with astronote.instrumentation.record() as recorder:
+            astronote.get_events('2017-06-21', '51.5', '0', include={'sun', 'separations'})
+
+        measurements = recorder.to_dict()
+
+        self.assertEqual(set(measurements['sections']), set(['horizon', 'sun', 'separations']))
+        self.assertEqual(measurements['sections']['sun']['calls'], 1)
+        self.assertEqual(measurements['sections']['sun']['solver_calls'], 4)
+        self.assertGreater(measurements['sections']['separations']['computes'], 0)
+        self.assertGreater(measurements['sections']['separations']['time'], 0)
+        self.assertEqual(measurements['solver_calls'], {'transits': 4})
+        self.assertEqual(measurements['computes']['separations'], measurements['sections']['separations']['computes'])
+        self.assertNotIn('samples', measurements['computes'])
+
+
+    def test_record_sampled(self):
+        astronote.transits.configure('sampled')
+
+        try:
+            with astronote.instrumentation.record() as recorder:
+                astronote.get_events('2017-06-21', '51.5', '0', include={'sun'})
+        finally:
+            astronote.transits.configure()
+
+        measurements = recorder.to_dict()
+
+        self.assertEqual(measurements['solver_calls'], {})
+        self.assertEqual(measurements['refinements'], {'transits': 4})
+        self.assertEqual(measurements['sections']['sun']['refinements'], 4)
+
+
+    def test_record_fallbacks(self):
+        results = []
+
+        with astronote.instrumentation.record(results.append):
+            astronote.get_events('2017-06-21', '78.2', '15.6', include={'sun'})
+
+        self.assertEqual(results[0]['always_up'], {'transits': 2})
+        self.assertEqual(results[0]['never_up'], {})
+        self.assertEqual(results[0]['sections']['sun']['always_up'], 2)
+
+
+    def test_disabled(self):
+        self.assertIsNone(astronote.instrumentation.get_recorder())
+        self.assertIs(astronote.instrumentation.section('sun'), astronote.instrumentation._null_section)
+
+        with astronote.instrumentation.record() as recorder:
+            with astronote.instrumentation.record() as inner:
+                astronote.instrumentation.count('computes', 'core')
+
+            self.assertIs(astronote.instrumentation.get_recorder(), recorder)
+
+        self.assertEqual(inner.to_dict()['computes'], {'core': 1})
+        self.assertEqual(recorder.to_dict()['computes'], {})
+        self.assertIsNone(astronote.instrumentation.get_recorder())
+
+
+class CommandLineMethods(unittest.TestCase):
+
+    def test_read_rows(self):
+        rows = io.StringIO('date,lat,lon\n2017-06-21, 51.5 ,0,extra\n\n# comment\n2017-06-22,1\n')
+
+        self.assertEqual(list(astronote.cli.read_rows([rows])), [
+            ('2017-06-21', '51.5', '0'),
+            ('2017-06-22', '1', None)
+        ])
+
+
+    def test_get_lines_rejects_rows(self):
+        bodies = astronote.core._create_bodies(astronote.helpers.define_location('2017-06-21', '0', '0'))
+        rows = [
+            ('2017-13-01', '51.5', '0'),
+            ('2017-02-30', '51.5', '0'),
+            ('2017-06-21', '95', '0'),
+            ('2017-06-21', '51.5', '-181'),
+            ('2017-06-21', '', '0'),
+            ('2017-06-21', '51.5', 'west'),
+            ('2017-06-21', '51.5', '0')
+        ]
+
+        lines = [json.loads(line) for line in astronote.cli.get_lines(bodies, rows, {'sun'})]
+
+        for line in lines[:-1]:
+            self.assertIn('error', line)
+            self.assertNotIn('events', line)
+
+        self.assertIn('Invalid date', lines[0]['error'])
+        self.assertIn('Latitude out of range', lines[2]['error'])
+        self.assertIn('Longitude out of range', lines[3]['error'])
+        self.assertIn('events', lines[-1])
+
+
+    def test_get_lines_errors(self):
+        bodies = astronote.core._create_bodies(astronote.helpers.define_location('2017-06-21', '0', '0'))
+        get_local_events = astronote.core._get_local_events
+
+        def failing_get_local_events(bodies, date, lat, lon, *args):
+            if lat == '10':
+                raise RuntimeError('Calculation failed')
+
+            return get_local_events(bodies, date, lat, lon, *args)
+
+        astronote.core._get_local_events = failing_get_local_events
+
+        try:
+            lines = astronote.cli.get_lines(bodies, [('2017-06-21', '10', '0'), ('2017-06-21', '20', '0')], {'sun'})
+        finally:
+            astronote.core._get_local_events = get_local_events
+
+        lines = [json.loads(line) for line in lines]
+
+        self.assertEqual(lines[0]['error'], 'Calculation failed')
+        self.assertNotIn('events', lines[0])
+        self.assertIn('events', lines[1])
+
+
+    def test_main_missing_file(self):
+        directory = tempfile.mkdtemp()
+        input_path = os.path.join(directory, 'rows.csv')
+        output_path = os.path.join(directory, 'events.ndjson')
+
+        with open(input_path, 'w') as input_file:
+            input_file.write('2017-06-21,51.5,0\n')
+
+        with self.assertRaises(FileNotFoundError):
+            astronote.cli.main([input_path, os.path.join(directory, 'missing.csv'), '-o', output_path])
+
+        self.assertFalse(os.path.exists(output_path))
+
+        os.remove(input_path)
+        os.rmdir(directory)
+
+
+    def test_main(self):
+        directory = tempfile.mkdtemp()
+        input_path = os.path.join(directory, 'rows.csv')
+        output_path = os.path.join(directory, 'events.ndjson')
+
+        with open(input_path, 'w') as input_file:
+            input_file.write('2017-06-21,51.5,0\nbad,0,0\n2017-06-21,-27.7,152.7\n')
+
+        self.assertEqual(astronote.cli.main([input_path, '-o', output_path, '-i', 'sun,moon,separations']), 0)
+
+        with open(output_path) as output_file:
+            lines = [json.loads(line) for line in output_file]
+
+        include = {'sun', 'moon', 'separations'}
+
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0]['events'], astronote.get_events('2017-06-21', '51.5', '0', include=include))
+        self.assertEqual(lines[2]['events'], astronote.get_events('2017-06-21', '-27.7', '152.7', include=include))
+        self.assertEqual(lines[1]['date'], 'bad')
+        self.assertIn('error', lines[1])
+
+        os.remove(input_path)
+        os.remove(output_path)
+        os.rmdir(directory)
+
+
+    def test_iter_lines_workers(self):
+        rows = [('2017-10-%02d' % day, str(lat), '0') for day in range(1, 4) for lat in range(-60, 90, 30)]
+
+        self.assertEqual(
+            list(astronote.cli.iter_lines(rows, include={'sun'})),
+            list(astronote.cli.iter_lines(rows, workers=2, include={'sun'}))
+        )
+        astronote.parallel.shutdown()
+
+
+    def test_unknown_section(self):
+        with self.assertRaises(SystemExit):
+            astronote.cli.main(['-i', 'sun,comets'])
+
+
+    def test_prefill(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'events.db')
+        sections = ['moon', 'planetary', 'separations', 'meteor_showers', 'seasons']
+
+        # Store every day except the last two, so only those are calculated.
+        store = astronote.store.GeocentricStore(path)
+        store.set_many([(date, {'events': []}) for date in astronote.helpers.get_date_range('2017-01-01', '2017-12-29')], sections)
+        store.close()
+
+        output = io.StringIO()
+
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(astronote.cli.main(['prefill', '2017', '2017', '--store', path]), 0)
+
+        self.assertEqual(output.getvalue(), 'Stored 2 days\n')
+        self.assertIsNone(astronote.store.get_store())
+
+        store = astronote.store.GeocentricStore(path)
+        self.assertEqual(len(store.get_dates(sections)), 365)
+        store.close()
+
+        with self.assertRaises(SystemExit):
+            astronote.cli.main(['prefill', '2018', '2017', '--store', path])
+
+        with self.assertRaises(SystemExit):
+            astronote.cli.main(['prefill', '2017', '2017'])
+
+        os.remove(path)
+        os.rmdir(directory)
+
+
+class ServerMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.server = astronote.server.EventServer(('127.0.0.1', 0))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+    def get(self, path):
+        connection = http.client.HTTPConnection(*self.server.server_address)
+        connection.request('GET', path)
+        response = connection.getresponse()
+        body = response.read().decode('utf-8')
+        connection.close()
+
+        return response.status, body
+
+
+    def test_events(self):
+        path = '/events?date=2017-06-21&lat=51.5&lon=0&include=sun,seasons'
+        status, body = self.get(path)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), astronote.get_events('2017-06-21', '51.5', '0', include={'sun', 'seasons'}))
+        self.assertEqual(self.get(path), (status, body))
+        self.assertEqual(self.server.metrics.to_dict()['counters']['cache_hits'], 1)
+
+
+    def test_range(self):
+        status, body = self.get('/range?start=2017-06-20&end=2017-06-21&lat=51.5&lon=0&include=moon')
+        events = astronote.get_events_range('2017-06-20', '2017-06-21', '51.5', '0', include={'moon'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), [{'date': date, 'events': day} for date, day in events])
+        self.assertEqual(self.get('/range?start=2017-01-01&end=2018-12-31&lat=0&lon=0')[0], 400)
+        self.assertEqual(self.get('/range?start=2017-06-21&end=2017-06-20&lat=0&lon=0')[0], 400)
+
+
+        # A long range is rejected without creating a date for every day.
+        iter_date_range = astronote.helpers.iter_date_range
+        calls = []
+
+        def iter_counted(*args):
+            calls.append(args)
+            return iter_date_range(*args)
+
+        astronote.helpers.iter_date_range = iter_counted
+
+        try:
+            status, body = self.get('/range?start=0001-01-01&end=9999-12-31&lat=0&lon=0')
+        finally:
+            astronote.helpers.iter_date_range = iter_date_range
+
+        self.assertEqual(status, 400)
+        self.assertIn('at most 366 days', body)
+        self.assertEqual(calls, [])
+
+
+    def test_workers(self):
+        server = astronote.server.EventServer(('127.0.0.1', 0), workers=2, cache_size=0)
+
+        try:
+            server.warm_up()
+
+            # Configuring shuts down the shared pool, but not the server's.
+            astronote.transits.configure()
+            response = server.calculate(astronote.server._get_events_json, '2017-06-21', '51.5', '0', ('sun',))
+        finally:
+            server.server_close()
+            server.shutdown_workers()
+
+        self.assertEqual(json.loads(response), astronote.get_events('2017-06-21', '51.5', '0', include={'sun'}))
+
+
+    def test_errors(self):
+        self.assertEqual(self.get('/events?date=2017-06-21&lat=51.5')[0], 400)
+        self.assertEqual(self.get('/events?date=2017-06-21&lat=51.5&lon=0&include=comets')[0], 400)
+        self.assertEqual(self.get('/events?date=2017-13-01&lat=51.5&lon=0')[0], 400)
+        self.assertEqual(self.get('/events?date=2017-06-21&lat=95&lon=0')[0], 400)
+        self.assertEqual(self.get('/unknown')[0], 404)
+
+
+    def test_metrics(self):
+        self.get('/events?date=2017-06-21&lat=51.5&lon=0&include=sun')
+        self.get('/unknown')
+
+        status, body = self.get('/metrics')
+
+        self.assertEqual(status, 200)
+        self.assertIn('astronote_request_duration_seconds_count{path="/events"} 1', body)
+        self.assertIn('astronote_responses_total{path="other",status="404"} 1', body)
+        self.assertIn('astronote_cache_misses_total 1', body)
+
+
+    def test_coalescing(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def calculate(bodies):
+            calls.append(bodies)
+            started.set()
+            release.wait(5)
+            return 'response'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.server.get_response('key', calculate)))
+            for index in range(3)
+        ]
+
+        threads[0].start()
+        started.wait(5)
+
+        for thread in threads[1:]:
+            thread.start()
+
+        while self.server.metrics.to_dict()['counters']['coalesced'] < 2:
+            time.sleep(0.01)
+
+        release.set()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['response'] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.server.pending, {})
+
+
+class ParallelMethods(unittest.TestCase):
+
+    def tearDown(self):
+        astronote.parallel.shutdown()
+
+
+    def test_get_chunks(self):
+        chunks = astronote.parallel.get_chunks(list(range(100)), 2)
+
+        self.assertEqual(sum(chunks, []), list(range(100)))
+        self.assertTrue(all(len(chunk) >= astronote.parallel.MIN_CHUNK_SIZE for chunk in chunks[:-1]))
+
+
+    def test_get_events_range_workers(self):
+        serial = astronote.get_events_range('2017-10-01', '2017-10-20', '-27.7', '152.7')
+        parallel = astronote.get_events_range('2017-10-01', '2017-10-20', '-27.7', '152.7', workers=2)
+
+        self.assertEqual(serial, parallel)
+
+
+    def test_get_executor_threads(self):
+        with ThreadPoolExecutor(max_workers=8) as threads:
+            executors = list(threads.map(lambda index: astronote.parallel.get_executor(2), range(8)))
+
+        self.assertTrue(all(executor is executors[0] for executor in executors))
+
+
+    def test_configure_workers(self):
+        solver = astronote.get_events_range('2017-10-01', '2017-10-20', '-27.7', '152.7', workers=2, include={'sun', 'moon'})
+        astronote.transits.configure('sampled')
+
+        try:
+            serial = astronote.get_events_range('2017-10-01', '2017-10-20', '-27.7', '152.7', include={'sun', 'moon'})
+            parallel = astronote.get_events_range('2017-10-01', '2017-10-20', '-27.7', '152.7', workers=2, include={'sun', 'moon'})
+        finally:
+            astronote.transits.configure()
+
+        self.assertNotEqual(solver, serial)
+        self.assertEqual(serial, parallel)
+
+
+    def test_iter_chunks(self):
+        taken = []
+
+        def get_chunks():
+            for index in range(20):
+                taken.append(index)
+                yield [index, index + 0.5]
+
+        results = astronote.parallel.iter_chunks(sorted, get_chunks(), 2)
+
+        self.assertEqual(next(results), 0)
+        self.assertEqual(len(taken), 2 * astronote.parallel.PENDING_PER_WORKER + 1)
+        self.assertEqual(list(results), [0.5] + sorted(index + offset for index in range(1, 20) for offset in [0, 0.5]))
+
+
+    def test_iter_events_workers(self):
+        serial = astronote.get_events_range('2017-10-01', '2017-11-10', '-27.7', '152.7', include={'sun', 'seasons'})
+        parallel = astronote.iter_events('2017-10-01', '2017-11-10', '-27.7', '152.7', workers=2, include={'sun', 'seasons'})
+
+        self.assertEqual(serial, list(parallel))
+
+
+    def test_get_events_many_workers(self):
+        locations = [(str(lat), '0') for lat in range(-80, 90, 10)]
+        serial = astronote.get_events_many('2017-10-05', locations)
+        parallel = astronote.get_events_many('2017-10-05', locations, workers=2)
+
+        self.assertEqual(serial, parallel)
+
+
+class AsyncMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = CountingExecutor(max_workers=2)
+        astronote.aio.configure(executor=self.executor, max_concurrency=2)
+
+
+    def tearDown(self):
+        astronote.aio.configure()
+        self.executor.shutdown()
+
+
+    def test_async_get_events(self):
+        events = asyncio.run(astronote.async_get_events('2017-10-05', '-27.7', '152.7'))
+        self.assertEqual(events, astronote.get_events('2017-10-05', '-27.7', '152.7'))
+
+
+    def test_async_get_events_merges_identical_requests(self):
+
+        async def run():
+            return await asyncio.gather(
+                astronote.async_get_events('2017-10-05', '0', '0'),
+                astronote.async_get_events('2017-10-05', '0', '0'),
+                astronote.async_get_events('2017-10-05', '0', '0'),
+                astronote.async_get_events('2017-10-06', '0', '0')
+            )
+
+        events = asyncio.run(run())
+
+        self.assertEqual(self.executor.submitted, 2)
+        self.assertEqual(events[0], events[1])
+        self.assertIsNot(events[0], events[1])
+
+
+    def test_async_get_events_cancel(self):
+
+        async def run():
+            task1 = asyncio.ensure_future(astronote.async_get_events('2017-10-05', '0', '0'))
+            task2 = asyncio.ensure_future(astronote.async_get_events('2017-10-05', '0', '0'))
+            await asyncio.sleep(0)
+
+            # Cancelling one of two identical requests leaves the other intact.
+            task1.cancel()
+            events = await task2
+
+            with self.assertRaises(asyncio.CancelledError):
+                await task1
+
+            state = astronote.aio._get_state(asyncio.get_running_loop())
+            return events, state.requests
+
+        events, requests = asyncio.run(run())
+
+        self.assertIn('sun', events)
+        self.assertEqual(requests, {})
+
+
+    def test_async_get_events_after_cancel(self):
+
+        async def run():
+            task1 = asyncio.ensure_future(astronote.async_get_events('2017-10-05', '0', '0'))
+            await asyncio.sleep(0)
+
+            # An identical request made while the first is being cancelled
+            # starts its own calculation.
+            task1.cancel()
+            await asyncio.sleep(0)
+            task2 = asyncio.ensure_future(astronote.async_get_events('2017-10-05', '0', '0'))
+
+            with self.assertRaises(asyncio.CancelledError):
+                await task1
+
+            return await task2
+
+        events = asyncio.run(run())
+
+        self.assertIn('sun', events)
+
+
+    def test_async_get_events_cancel_keeps_limit(self):
+        release = threading.Event()
+        executor = CountingExecutor(max_workers=2)
+        submit = executor.submit
+
+        def submit_blocked(func, *args):
+            return submit(lambda: release.wait(10) and func(*args))
+
+        executor.submit = submit_blocked
+        astronote.aio.configure(executor=executor, max_concurrency=1)
+
+        async def run():
+            task1 = asyncio.ensure_future(astronote.async_get_events('2017-10-05', '0', '0'))
+            await asyncio.sleep(0.01)
+
+            task1.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await task1
+
+            # The cancelled calculation is still running, so the next request
+            # waits for it to finish.
+            task2 = asyncio.ensure_future(astronote.async_get_events('2017-10-06', '0', '0'))
+            await asyncio.sleep(0.05)
+            submitted = executor.submitted
+
+            release.set()
+            await task2
+
+            return submitted
+
+        try:
+            submitted = asyncio.run(run())
+        finally:
+            release.set()
+            executor.shutdown()
+
+        self.assertEqual(submitted, 1)
+        self.assertEqual(executor.submitted, 2)
+
 
 class HelperMethods(unittest.TestCase):
 
+    def test_check_location(self):
+        location = astronote.helpers.check_location('2017-06-21', '51.5', '-180')
+        self.assertAlmostEqual(astronote.helpers.get_degrees(location.lat), 51.5)
+
+        for date, lat, lon in [('2017-13-01', '0', '0'), ('21-06-2017', '0', '0'), ('2017-06-21', '-90.5', '0'), ('2017-06-21', '0', '180.5')]:
+            with self.assertRaises(ValueError):
+                astronote.helpers.check_location(date, lat, lon)
+
+
     def test_get_degrees(self):
         angle = ephem.degrees('14:12:45.77')
         angle = astronote.helpers.get_degrees(angle)
@@ -223,6 +1655,13 @@ class HelperMethods(unittest.TestCase):
         self.assertEqual(midnight, astronote.helpers.set_date_to_midnight(date))
 
 
+    def test_get_date_range(self):
+        dates = astronote.helpers.get_date_range('2016-12-30', '2017-01-02')
+        self.assertEqual(dates, ['2016-12-30', '2016-12-31', '2017-01-01', '2017-01-02'])
+        self.assertEqual(astronote.helpers.get_date_range('2017-01-02', '2017-01-01'), [])
+        self.assertEqual(list(astronote.helpers.iter_date_range('2016-12-30', '2017-01-02')), dates)
+
+
     def test_get_distance_from_earth_return_value(self):
         distance = astronote.helpers.get_distance_from_earth(ephem.Moon(), '2017-01-01')
         self.assertAlmostEqual(distance, 0.0026, places=4)